@@ -1,103 +1,168 @@
 # scripts/00_preprocess_accidents.py
+# Streams the SWITRS crashes / parties / victims exports in chunks, reading only
+# the columns the pipeline uses with explicit dtypes, and writes a typed Parquet
+# dataset partitioned by collision year (ACCIDENTS_PARQUET/collision_year=YYYY/).
+# Downstream stages read only the years (ACCIDENT_YEARS) and columns they need.
+
 import sys
 import os
+import shutil
+import numpy as np
 import pandas as pd
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.config import *
 
+CRASHES = "data/raw/supplemental/crashes.csv"
+PARTIES = "data/raw/supplemental/parties.csv"
+VICTIMS = "data/raw/supplemental/victims.csv"
+
+# Columns read from crashes.csv (lowercased names) and their dtypes
+CRASH_DTYPES = {
+    "case_id":             "string",
+    "collision_date":      "string",
+    "latitude":            "float64",
+    "longitude":           "float64",
+    "number_killed":       "float32",
+    "number_injured":      "float32",
+    "count_severe_inj":    "float32",
+    "bicycle_accident":    "string",
+    "pedestrian_accident": "string",
+    "motorcycle_accident": "string",
+    "alcohol_involved":    "string",
+}
+# Carried through when present — handy for reports, not needed for scoring
+OPTIONAL_DTYPES = {
+    "collision_time":      "string",
+    "collision_severity":  "string",
+    "primary_rd":          "string",
+    "secondary_rd":        "string",
+    "type_of_collision":   "string",
+    "weather_1":           "string",
+    "lighting":            "string",
+}
+
+
+def read_header(path):
+    """Map lowercase column name -> name as written in the file"""
+    return {c.lower(): c for c in pd.read_csv(path, nrows=0).columns}
+
+
+def case_counts(path, label):
+    """One streaming pass over a parties / victims table: rows per case_id"""
+    try:
+        header = read_header(path)
+    except FileNotFoundError:
+        print(f"{os.path.basename(path)} not found — skipping {label} details")
+        return None
+    if "case_id" not in header:
+        print(f"{os.path.basename(path)} has no CASE_ID column — skipping {label} details")
+        return None
+
+    parts = [pd.Series(dtype="int64")]
+    rows  = 0
+    for chunk in pd.read_csv(path, usecols=[header["case_id"]], dtype="string",
+                             chunksize=ACCIDENT_CHUNK_ROWS):
+        rows += len(chunk)
+        parts.append(chunk.iloc[:, 0].value_counts())
+    print(f"{label.capitalize()}: {rows} rows")
+    return pd.concat(parts).groupby(level=0).sum().astype("int32")
+
+
 print("Loading SWITRS tables...")
-crashes = pd.read_csv("data/raw/supplemental/crashes.csv", low_memory=False)
-print(f"Crashes: {len(crashes)} rows")
-
-# Load parties and victims if available
-try:
-    parties = pd.read_csv("data/raw/supplemental/parties.csv", low_memory=False)
-    print(f"Parties: {len(parties)} rows")
-    has_parties = True
-except FileNotFoundError:
-    print("parties.csv not found — skipping party details")
-    has_parties = False
-
-try:
-    victims = pd.read_csv("data/raw/supplemental/victims.csv", low_memory=False)
-    print(f"Victims: {len(victims)} rows")
-    has_victims = True
-except FileNotFoundError:
-    print("victims.csv not found — skipping victim details")
-    has_victims = False
-
-# -------------------------------------------------------
-# Rename columns to lowercase for consistency
-# -------------------------------------------------------
-crashes.columns = crashes.columns.str.lower()
-
-# -------------------------------------------------------
-# Use LATITUDE/LONGITUDE columns — already present
-# -------------------------------------------------------
-accidents = crashes.copy()
-
-# Drop rows with missing coordinates
-accidents = accidents.dropna(subset=["latitude", "longitude"])
-
-# Filter to valid Menlo Park / San Mateo County coordinates
-accidents = accidents[
-    (accidents["latitude"]  > 37.0) & (accidents["latitude"]  < 38.5) &
-    (accidents["longitude"] > -123.0) & (accidents["longitude"] < -121.0)
-]
-
-print(f"\nAfter coordinate filter: {len(accidents)} crashes")
-
-# -------------------------------------------------------
-# Severity weighting using available columns
-# Fatal crashes weighted more heavily than injury crashes
-# -------------------------------------------------------
-accidents["severity_weight"] = (
-    accidents["number_killed"].fillna(0)   * 3.0 +
-    accidents["number_injured"].fillna(0)  * 1.0 +
-    accidents["count_severe_inj"].fillna(0) * 2.0
-).clip(lower=1.0)
-
-# -------------------------------------------------------
-# Useful flag columns already in crashes file
-# -------------------------------------------------------
-accidents["involved_cyclist"]  = accidents["bicycle_accident"].fillna("N").eq("Y").astype(int)
-accidents["involved_ped"]      = accidents["pedestrian_accident"].fillna("N").eq("Y").astype(int)
-accidents["involved_moto"]     = accidents["motorcycle_accident"].fillna("N").eq("Y").astype(int)
-accidents["alcohol"]           = accidents["alcohol_involved"].fillna("N").eq("Y").astype(int)
-
-# -------------------------------------------------------
-# Merge parties summary if available
-# -------------------------------------------------------
-if has_parties:
-    parties.columns = parties.columns.str.lower()
-    if "case_id" in parties.columns:
-        party_summary = parties.groupby("case_id").agg(
-            num_parties = ("case_id", "count")
-        ).reset_index()
-        accidents = accidents.merge(party_summary, on="case_id", how="left")
-
-# -------------------------------------------------------
-# Merge victim summary if available
-# -------------------------------------------------------
-if has_victims:
-    victims.columns = victims.columns.str.lower()
-    if "case_id" in victims.columns:
-        victim_summary = victims.groupby("case_id").agg(
-            total_victims = ("case_id", "count")
-        ).reset_index()
-        accidents = accidents.merge(victim_summary, on="case_id", how="left")
-
-# -------------------------------------------------------
-# Save final output
-# -------------------------------------------------------
-os.makedirs(os.path.dirname(ACCIDENTS_CSV), exist_ok=True)
-accidents.to_csv(ACCIDENTS_CSV, index=False)
-
-print(f"\nSaved {len(accidents)} accidents to {ACCIDENTS_CSV}")
-print(f"\nDate range: {accidents['collision_date'].min()} to {accidents['collision_date'].max()}")
-print(f"Fatal crashes:      {accidents['number_killed'].fillna(0).gt(0).sum()}")
-print(f"Cyclist involved:   {accidents['involved_cyclist'].sum()}")
-print(f"Pedestrian involved:{accidents['involved_ped'].sum()}")
-print(f"Alcohol involved:   {accidents['alcohol'].sum()}")
+party_counts  = case_counts(PARTIES, "parties")
+victim_counts = case_counts(VICTIMS, "victims")
+
+header  = read_header(CRASHES)
+missing = [c for c in CRASH_DTYPES if c not in header]
+if missing:
+    raise KeyError(f"{CRASHES} is missing required columns: {missing}")
+dtypes  = {**CRASH_DTYPES, **{c: t for c, t in OPTIONAL_DTYPES.items() if c in header}}
+
+if os.path.exists(ACCIDENTS_PARQUET):
+    shutil.rmtree(ACCIDENTS_PARQUET)
+
+west, south, east, north = ACCIDENT_BBOX
+total_rows = 0
+kept_rows  = 0
+part       = 0
+stats      = {"fatal": 0, "cyclist": 0, "ped": 0, "alcohol": 0}
+dates      = []
+severity   = []
+
+for chunk in pd.read_csv(
+    CRASHES,
+    usecols=[header[c] for c in dtypes],
+    dtype={header[c]: t for c, t in dtypes.items()},
+    chunksize=ACCIDENT_CHUNK_ROWS,
+):
+    total_rows += len(chunk)
+    chunk.columns = chunk.columns.str.lower()
+
+    # -------------------------------------------------------
+    # Drop rows with missing coordinates and filter to valid
+    # Menlo Park / San Mateo County coordinates
+    # -------------------------------------------------------
+    chunk = chunk[
+        chunk["latitude"].between(south, north, inclusive="neither") &
+        chunk["longitude"].between(west, east, inclusive="neither")
+    ]
+    if chunk.empty:
+        continue
+
+    # -------------------------------------------------------
+    # Severity weighting
+    # Fatal crashes weighted more heavily than injury crashes
+    # -------------------------------------------------------
+    chunk = chunk.assign(severity_weight=(
+        chunk["number_killed"].fillna(0)    * 3.0 +
+        chunk["number_injured"].fillna(0)   * 1.0 +
+        chunk["count_severe_inj"].fillna(0) * 2.0
+    ).clip(lower=1.0).astype("float32"))
+
+    # Flag columns already in crashes file
+    for flag, col in [("involved_cyclist", "bicycle_accident"),
+                      ("involved_ped",     "pedestrian_accident"),
+                      ("involved_moto",    "motorcycle_accident"),
+                      ("alcohol",          "alcohol_involved")]:
+        chunk[flag] = chunk[col].fillna("N").eq("Y").astype("int8")
+
+    # Parties / victims summaries, looked up by case_id
+    if party_counts is not None:
+        chunk["num_parties"]   = chunk["case_id"].map(party_counts).astype("Int32")
+    if victim_counts is not None:
+        chunk["total_victims"] = chunk["case_id"].map(victim_counts).astype("Int32")
+
+    chunk["collision_date"] = pd.to_datetime(chunk["collision_date"], errors="coerce")
+    chunk["collision_year"] = chunk["collision_date"].dt.year.fillna(0).astype("int16")
+
+    # -------------------------------------------------------
+    # Append this chunk to the year-partitioned dataset
+    # -------------------------------------------------------
+    for year, rows in chunk.groupby("collision_year"):
+        part_dir = os.path.join(ACCIDENTS_PARQUET, f"collision_year={year}")
+        os.makedirs(part_dir, exist_ok=True)
+        rows.drop(columns="collision_year").to_parquet(
+            os.path.join(part_dir, f"part-{part:05d}.parquet"), index=False
+        )
+    part += 1
+
+    kept_rows += len(chunk)
+    stats["fatal"]   += int(chunk["number_killed"].fillna(0).gt(0).sum())
+    stats["cyclist"] += int(chunk["involved_cyclist"].sum())
+    stats["ped"]     += int(chunk["involved_ped"].sum())
+    stats["alcohol"] += int(chunk["alcohol"].sum())
+    dates.extend([chunk["collision_date"].min(), chunk["collision_date"].max()])
+    severity.append(chunk["severity_weight"].to_numpy())
+
+print(f"Crashes: {total_rows} rows")
+print(f"\nAfter coordinate filter: {kept_rows} crashes")
+print(f"\nSaved {kept_rows} accidents to {ACCIDENTS_PARQUET}/ (partitioned by collision_year)")
+if kept_rows:
+    dates = pd.Series(dates).dropna()
+    print(f"\nDate range: {dates.min().date()} to {dates.max().date()}")
+print(f"Fatal crashes:      {stats['fatal']}")
+print(f"Cyclist involved:   {stats['cyclist']}")
+print(f"Pedestrian involved:{stats['ped']}")
+print(f"Alcohol involved:   {stats['alcohol']}")
 print(f"\nSeverity weight distribution:")
-print(accidents["severity_weight"].describe())
\ No newline at end of file
+print(pd.Series(np.concatenate(severity) if severity else [], dtype="float32").describe())
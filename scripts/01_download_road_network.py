@@ -1,19 +1,62 @@
 # scripts/01_download_road_network.py
+# Builds the drivable road network (edges + nodes).
+#
+#   python scripts/01_download_road_network.py                       live Overpass via OSMnx
+#   python scripts/01_download_road_network.py --pbf extract.osm.pbf offline, clipped to
+#                                                                    STUDY_POLYGON or STUDY_BBOX
+#   python scripts/01_download_road_network.py --reindex             add seg_id to an existing
+#                                                                    ROADS_RAW, no download
+#
+# Every edge gets an integer seg_id (scripts/segments.py) — the join key for
+# all later stages, derived from (u, v, key) so it is the same on every run —
+# and SEGMENT_LOOKUP maps it back to u, v, key, osmid.
 import sys
 import os
+import argparse
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.config import *
+from scripts.segments import assign_segment_ids
 
-import osmnx as ox
 import geopandas as gpd
 
-print("Downloading Menlo Park road network from OpenStreetMap...")
+parser = argparse.ArgumentParser(description="Build the drivable road network")
+parser.add_argument("--pbf", help="local .osm.pbf extract — skips the Overpass download")
+parser.add_argument("--reindex", action="store_true",
+                    help="assign seg_id to the network already at ROADS_RAW")
+args = parser.parse_args()
 
-G = ox.graph_from_place(STUDY_AREA, network_type="drive")
-nodes, edges = ox.graph_to_gdfs(G)
+if args.reindex:
+    edges = assign_segment_ids(gpd.read_file(ROADS_RAW))
+    edges.to_file(ROADS_RAW, driver="GPKG")
+    print(f"Assigned seg_id to {len(edges)} road segments in {ROADS_RAW}")
+    print(f"Lookup table: {SEGMENT_LOOKUP}")
+    sys.exit(0)
+
+if args.pbf:
+    from scripts.osm_pbf import read_drive_network
+
+    if STUDY_POLYGON:
+        clip = gpd.read_file(STUDY_POLYGON).to_crs(CRS_GEOGRAPHIC).union_all()
+        print(f"Reading {args.pbf}, clipped to {STUDY_POLYGON}...")
+    else:
+        clip = tuple(STUDY_BBOX)
+        print(f"Reading {args.pbf}, clipped to bbox {clip}...")
+    edges, nodes = read_drive_network(args.pbf, clip)
+else:
+    import osmnx as ox
+
+    print("Downloading Menlo Park road network from OpenStreetMap...")
+    G = ox.graph_from_place(STUDY_AREA, network_type="drive")
+    nodes, edges = ox.graph_to_gdfs(G)
+    edges = edges.reset_index()
+    nodes = nodes.reset_index()
 
 os.makedirs(os.path.dirname(ROADS_RAW), exist_ok=True)
+edges = assign_segment_ids(edges)
 edges.to_file(ROADS_RAW, driver="GPKG")
+nodes.to_file(ROADS_NODES, driver="GPKG")
 
 print(f"Done. Saved {len(edges)} road segments to {ROADS_RAW}")
-print(f"Road types found: {edges['highway'].value_counts().to_dict()}")
\ No newline at end of file
+print(f"Saved {len(nodes)} nodes to {ROADS_NODES}")
+print(f"Segment ID lookup: {SEGMENT_LOOKUP}")
+print(f"Road types found: {edges['highway'].value_counts().to_dict()}")
@@ -1,9 +1,16 @@
 # scripts/02a_prepare_sample_points.py
+# One Street View sample point every SV_SAMPLE_INTERVAL meters along each segment,
+# with the road heading so the camera faces along the road.
+#
+# Fully vectorized: the network is projected once for segment lengths, and all
+# sample positions and ±5% heading probes are interpolated in three bulk
+# shapely calls instead of per-row Python loops.
+
 import sys
 import os
 import numpy as np
 import geopandas as gpd
-from shapely.geometry import Point
+import shapely
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.config import *
 
@@ -11,41 +18,41 @@ print("Loading road network...")
 roads = gpd.read_file(ROADS_RAW).to_crs(CRS_GEOGRAPHIC)
 print(f"Loaded {len(roads)} road segments")
 
-sample_points = []
+valid = roads.geometry.notna() & ~roads.geometry.is_empty
+segs  = roads[valid]
 
-for idx, row in roads.iterrows():
-    geom = row.geometry
-    if geom is None or geom.is_empty:
-        continue
+# Measure segment lengths in meters — one projection for the whole network
+segment_length = segs.geometry.to_crs(CRS_PROJECTED).length.to_numpy()
 
-    # Measure segment length in meters using projected CRS
-    geom_proj = gpd.GeoSeries([geom], crs=CRS_GEOGRAPHIC).to_crs(CRS_PROJECTED).iloc[0]
-    segment_length = geom_proj.length
+# One sample point every SV_SAMPLE_INTERVAL meters, minimum 1
+num_samples = np.maximum(1, (segment_length / SV_SAMPLE_INTERVAL).astype(int))
 
-    # One sample point every SV_SAMPLE_INTERVAL meters, minimum 1
-    num_samples = max(1, int(segment_length / SV_SAMPLE_INTERVAL))
+# Flatten to one row per sample: segment index + normalized position along it
+seg_pos    = np.repeat(np.arange(len(segs)), num_samples)
+starts     = np.repeat(np.cumsum(num_samples) - num_samples, num_samples)
+sample_num = np.arange(len(seg_pos)) - starts
+position   = (sample_num + 0.5) / num_samples[seg_pos]
 
-    for i in range(num_samples):
-        position = (i + 0.5) / num_samples
-        point = geom.interpolate(position, normalized=True)
+geoms = segs.geometry.to_numpy()[seg_pos]
+point = shapely.line_interpolate_point(geoms, position, normalized=True)
 
-        # Calculate road heading so Street View faces along the road
-        p1 = geom.interpolate(max(0, position - 0.05), normalized=True)
-        p2 = geom.interpolate(min(1, position + 0.05), normalized=True)
-        heading = (np.degrees(np.arctan2(p2.x - p1.x, p2.y - p1.y)) + 360) % 360
+# Calculate road heading so Street View faces along the road
+p1 = shapely.line_interpolate_point(geoms, np.maximum(0, position - 0.05), normalized=True)
+p2 = shapely.line_interpolate_point(geoms, np.minimum(1, position + 0.05), normalized=True)
+heading = (np.degrees(np.arctan2(
+    shapely.get_x(p2) - shapely.get_x(p1),
+    shapely.get_y(p2) - shapely.get_y(p1)
+)) + 360) % 360
 
-        sample_points.append({
-            "osmid":          row.get("osmid", idx),
-            "segment_idx":    int(idx),
-            "sample_num":     i,
-            "latitude":       round(point.y, 7),
-            "longitude":      round(point.x, 7),
-            "heading":        round(heading, 1),
-            "geometry":       point
-        })
+gdf = gpd.GeoDataFrame({
+    "seg_id":      segs["seg_id"].to_numpy()[seg_pos],
+    "sample_num":  sample_num,
+    "latitude":    np.round(shapely.get_y(point), 7),
+    "longitude":   np.round(shapely.get_x(point), 7),
+    "heading":     np.round(heading, 1),
+}, geometry=point, crs=CRS_GEOGRAPHIC)
 
-gdf = gpd.GeoDataFrame(sample_points, crs=CRS_GEOGRAPHIC)
 os.makedirs(os.path.dirname(SAMPLE_POINTS), exist_ok=True)
 gdf.to_file(SAMPLE_POINTS, driver="GPKG")
 
-print(f"Generated {len(gdf)} sample points across {len(roads)} segments")
\ No newline at end of file
+print(f"Generated {len(gdf)} sample points across {len(roads)} segments")
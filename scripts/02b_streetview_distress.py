@@ -1,121 +1,213 @@
 # scripts/02b_streetview_distress.py
+# Fetches one Street View image per sample point and scores pavement distress.
+#
+#   python scripts/02b_streetview_distress.py               fetch missing + score
+#   python scripts/02b_streetview_distress.py --score-only  score the sample points whose
+#                                                           image is already in the pack,
+#                                                           no API calls
+#
+# Network and CPU work run as separate phases: a rate-limited thread pool fills
+# the packed image archive (sv_fetch.py, image_store.py), then a process pool
+# scores it (sv_scoring.py). Metadata lookups are cached by rounded location,
+# and points on the same panorama + heading bucket share one image and score.
+# Output rows and the pack are keyed by seg_id, so the edges one OSM way was
+# split into each get their own images and scores.
+
 import sys
 import os
-import time
-import requests
-import numpy as np
 import pandas as pd
 import geopandas as gpd
-import cv2
-from PIL import Image
-import io
 from tqdm import tqdm
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.config import *
-
-os.makedirs(SV_IMAGES_DIR, exist_ok=True)
-
-def fetch_image(lat, lon, heading):
-    """Fetch Street View image. Returns (PIL Image, date string) or (None, None)"""
-    # Check coverage first — cheaper metadata call
-    meta_url = (
-        f"https://maps.googleapis.com/maps/api/streetview/metadata"
-        f"?location={lat},{lon}&key={STREETVIEW_API_KEY}"
-    )
-    meta = requests.get(meta_url, timeout=10).json()
-    if meta.get("status") != "OK":
-        return None, None
-
-    image_url = (
-        f"https://maps.googleapis.com/maps/api/streetview"
-        f"?size=640x480"
-        f"&location={lat},{lon}"
-        f"&heading={heading}"
-        f"&pitch={SV_PITCH}"
-        f"&fov={SV_FOV}"
-        f"&key={STREETVIEW_API_KEY}"
-    )
-    r = requests.get(image_url, timeout=15)
-    img = Image.open(io.BytesIO(r.content)) if r.status_code == 200 else None
-    return img, meta.get("date", "unknown")
-
-
-def score_distress(image):
-    """Score pavement distress from Street View image. Returns 0 (perfect) to 1 (severe)"""
-    arr  = np.array(image)
-    # Use bottom 40% of image — that's where the road surface appears at pitch=-45
-    road = arr[int(arr.shape[0] * 0.6):, :]
-    gray = cv2.cvtColor(road, cv2.COLOR_RGB2GRAY)
-
-    # Metric 1: Edge density — cracks and distress lines create edges
-    edges = cv2.Canny(gray, threshold1=50, threshold2=150)
-    edge_density = float(edges.sum() / (edges.size * 255))
-
-    # Metric 2: Texture variance — rough surfaces have higher variance than smooth
-    texture_variance = float(np.var(gray) / 10000)
-
-    # Metric 3: Dark patch ratio — cracks appear as dark linear features
-    _, dark = cv2.threshold(gray, 60, 255, cv2.THRESH_BINARY_INV)
-    dark_ratio = float(dark.sum() / (dark.size * 255))
-
-    distress_score = min(1.0,
-        edge_density     * 0.40 +
-        min(texture_variance, 1.0) * 0.35 +
-        dark_ratio       * 0.25
-    )
-
-    return {
-        "edge_density":      edge_density,
-        "texture_variance":  texture_variance,
-        "dark_ratio":        dark_ratio,
-        "distress_score":    distress_score
-    }
-
-
-# Load sample points
-print("Loading sample points...")
-points = gpd.read_file(SAMPLE_POINTS)
-print(f"Processing {len(points)} sample points...")
-
-results   = []
-no_coverage = 0
-errors    = 0
-
-for _, row in tqdm(points.iterrows(), total=len(points), desc="Street View"):
-    cache_file = os.path.join(
-        SV_IMAGES_DIR,
-        f"seg_{row['osmid']}_s{row['sample_num']}.jpg"
-    )
-
-    try:
-        if os.path.exists(cache_file):
-            image    = Image.open(cache_file)
-            sv_date  = "cached"
+from scripts.sv_fetch import StreetViewFetcher, MetadataCache, heading_bucket
+from scripts.sv_scoring import score_images, ScoreStore
+from scripts.image_store import ImageStore, image_key, legacy_image_key
+from scripts.segments import segment_osmids
+
+
+def fetch_missing(points, store):
+    """Fetch every image not yet in the pack. Returns (no_coverage, errors) keyed by image key
+
+    Sample points that resolve to the same panorama and heading bucket share
+    one image download (and, via the pack's shared offset, one score).
+    """
+    missing    = points[~points["key"].map(store.__contains__)].drop_duplicates("key")
+    cached     = len(points) - len(missing)
+    meta_cache = MetadataCache()
+    missing    = missing.assign(location=[
+        MetadataCache.location(lat, lon)
+        for lat, lon in zip(missing["latitude"], missing["longitude"])
+    ])
+
+    # Locations an earlier run found without coverage are neither looked up nor fetched
+    uncovered   = [loc in meta_cache and meta_cache[loc]["status"] != "OK" for loc in missing["location"]]
+    uncovered   = pd.Series(uncovered, index=missing.index, dtype=bool)
+    no_coverage = set(missing.loc[uncovered, "key"])
+    known       = len(no_coverage)
+    missing     = missing[~uncovered]
+    errors      = {}
+    print(f"Cached: {cached} | No coverage (earlier runs): {known} | To fetch: {len(missing)}")
+    if not len(missing):
+        return no_coverage, errors
+
+    fetcher = StreetViewFetcher()
+
+    # -------------------------------------------------------
+    # Step 1: metadata — one call per uncached rounded location
+    # -------------------------------------------------------
+    lookups = missing.drop_duplicates("location")
+    lookups = lookups[~lookups["location"].map(meta_cache.__contains__)]
+    meta_errors = {}
+    jobs = zip(lookups["location"], lookups["latitude"], lookups["longitude"])
+    for location, meta, error in tqdm(
+        fetcher.run_many(fetcher.metadata, jobs), total=len(lookups), desc="Street View metadata"
+    ):
+        if error:
+            meta_errors[location] = error
+        else:
+            meta_cache.add(location, meta)
+
+    # -------------------------------------------------------
+    # Step 2: group points by (panorama, heading bucket)
+    # Groups already in the pack from earlier runs are linked, not refetched
+    # -------------------------------------------------------
+    packed = {}
+    for key, entry in store.index.items():
+        if entry.pano_id:
+            packed.setdefault((entry.pano_id, heading_bucket(key[2])), entry)
+
+    groups = {}
+    for key, location, heading in zip(missing["key"], missing["location"], missing["heading"]):
+        if location in meta_errors:
+            errors[key] = meta_errors[location]
+            continue
+        meta = meta_cache[location]
+        if meta["status"] != "OK":
+            no_coverage.add(key)
+            continue
+        # Without a pano_id the location stands in for the panorama, and is what gets fetched
+        groups.setdefault((meta["pano_id"] or location, heading_bucket(heading)), []).append((key, heading, meta))
+
+    to_fetch = {}
+    for group, members in groups.items():
+        if group in packed:
+            for key, _, _ in members:
+                store.link(key, packed[group])
         else:
-            image, sv_date = fetch_image(
-                row["latitude"], row["longitude"], row["heading"]
+            to_fetch[group] = members
+
+    # -------------------------------------------------------
+    # Step 3: one image per group, facing the first member's heading
+    # -------------------------------------------------------
+    jobs = ((group, members[0][2]["pano_id"], members[0][1], group[0]) for group, members in to_fetch.items())
+    for group, content, error in tqdm(
+        fetcher.run_many(fetcher.image, jobs), total=len(to_fetch), desc="Street View images"
+    ):
+        members = to_fetch[group]
+        if error:
+            errors.update(dict.fromkeys([key for key, _, _ in members], error))
+            continue
+        entry = store.put(members[0][0], content, members[0][2]["sv_date"], members[0][2]["pano_id"])
+        for key, _, _ in members[1:]:
+            store.link(key, entry)
+
+    # Without dedup every point to fetch costs one metadata + one image call
+    meta_saved  = len(missing) - len(lookups)
+    image_saved = sum(len(members) for members in groups.values()) - len(to_fetch)
+    print(f"HTTP requests: {fetcher.stats['requests']} | retries: {fetcher.stats['retries']}")
+    print(f"Dedup saved {meta_saved} metadata calls and {image_saved} image calls "
+          f"({len(groups)} panorama views for {len(missing)} points)")
+    print(f"No coverage: {len(no_coverage) - known} new points, {known} from earlier runs")
+    for kind, count in sorted(fetcher.stats.items()):
+        if kind.startswith("error_"):
+            print(f"  {kind[6:]}: {count}")
+    return no_coverage, errors
+
+
+def score_pack(store, keys):
+    """Score every image behind `keys` that has no checkpointed score for the
+    current SCORE_PARAMS. Returns ({key: metrics}, [undecodable keys])"""
+    scores_db = ScoreStore()
+
+    # Keys whose bytes are identical share one decode + score
+    by_hash = {}
+    for key in keys:
+        by_hash.setdefault(store.content_hash(key), []).append(key)
+    todo = [group[0] for digest, group in by_hash.items() if digest not in scores_db]
+    print(f"Scores checkpointed: {len(by_hash) - len(todo)} | To score: {len(todo)}"
+          + (f" | {scores_db.stale} stale rows from other scoring parameters" if scores_db.stale else ""))
+
+    failed = []
+    with tqdm(total=len(todo), desc="Scoring") as bar:
+        for batch in score_images(todo, store.path):
+            # Checkpoint each batch as it arrives — a crash loses at most one batch
+            scores_db.add([(store.content_hash(key), m) for key, m in batch if m is not None])
+            failed.extend(
+                k for key, m in batch if m is None for k in by_hash[store.content_hash(key)]
             )
-            if image:
-                image.save(cache_file)
-            time.sleep(0.05)  # gentle rate limiting
-
-        if image:
-            scores = score_distress(image)
-            scores.update({
-                "osmid":      row["osmid"],
-                "sample_num": row["sample_num"],
-                "sv_date":    sv_date
+            bar.update(len(batch))
+
+    scores = {
+        key: scores_db[digest]
+        for digest, group in by_hash.items() if digest in scores_db
+        for key in group
+    }
+    return scores, failed
+
+
+def main():
+    store = ImageStore()
+
+    print("Loading sample points...")
+    points = gpd.read_file(SAMPLE_POINTS, ignore_geometry=True)
+    points["key"] = [
+        image_key(seg_id, n, heading)
+        for seg_id, n, heading in zip(points["seg_id"], points["sample_num"], points["heading"])
+    ]
+    if store.legacy:
+        # Images from an osmid-keyed pack, where the key wasn't shared by several edges
+        osmids  = points["seg_id"].map(segment_osmids())
+        adopted = store.adopt_legacy(points["key"], [
+            legacy_image_key(osmid, n, heading)
+            for osmid, n, heading in zip(osmids, points["sample_num"], points["heading"])
+        ])
+        print(f"Carried over {adopted} images from the osmid-keyed pack index")
+
+    if "--score-only" in sys.argv:
+        points = points[points["key"].map(store.__contains__)]
+        print(f"Score-only: {len(points)} sample points with images in {SV_IMAGE_PACK}")
+        no_coverage, errors = set(), {}
+    else:
+        print(f"Processing {len(points)} sample points...")
+
+        # Phase 1: fetch missing images concurrently into the pack
+        no_coverage, errors = fetch_missing(points, store)
+
+    # Phase 2: score new / changed images on all cores, checkpointing as we go
+    keys = [key for key in points["key"].unique() if key in store]
+    scores, failed = score_pack(store, keys)
+    for key in failed:
+        errors[key] = "undecodable"
+
+    results = []
+    for seg_id, sample_num, key in zip(points["seg_id"], points["sample_num"], points["key"]):
+        if key in scores:
+            results.append({
+                **scores[key],
+                "seg_id":     seg_id,
+                "sample_num": sample_num,
+                "sv_date":    store.sv_date(key)
             })
-            results.append(scores)
-        else:
-            no_coverage += 1
 
-    except Exception as e:
-        errors += 1
+    results_df = pd.DataFrame(results)
+    os.makedirs(os.path.dirname(SV_DISTRESS_RAW), exist_ok=True)
+    results_df.to_csv(SV_DISTRESS_RAW, index=False)
+    store.close()
+
+    print(f"\nComplete: {len(results)} scored | {len(no_coverage)} no coverage | {len(errors)} errors")
+    print(results_df["distress_score"].describe())
 
-results_df = pd.DataFrame(results)
-os.makedirs(os.path.dirname(SV_DISTRESS_RAW), exist_ok=True)
-results_df.to_csv(SV_DISTRESS_RAW, index=False)
 
-print(f"\nComplete: {len(results)} scored | {no_coverage} no coverage | {errors} errors")
-print(results_df["distress_score"].describe())
\ No newline at end of file
+if __name__ == "__main__":
+    main()
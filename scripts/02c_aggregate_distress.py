@@ -7,9 +7,9 @@ from scripts.config import *
 
 print("Loading raw distress scores...")
 raw = pd.read_csv(SV_DISTRESS_RAW)
-print(f"Raw records: {len(raw)} across {raw['osmid'].nunique()} segments")
+print(f"Raw records: {len(raw)} across {raw['seg_id'].nunique()} segments")
 
-seg = raw.groupby("osmid").agg(
+seg = raw.groupby("seg_id").agg(
     avg_distress  = ("distress_score", "mean"),
     max_distress  = ("distress_score", "max"),
     std_distress  = ("distress_score", "std"),
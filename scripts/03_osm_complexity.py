@@ -10,7 +10,8 @@
 # attributes are direct structural predictors of the same agent interaction
 # density that Waymo trajectory data would measure. The methodology is
 # architecturally transparent — swapping in real Waymo data only requires
-# replacing osm_complexity.csv with a file in the same column format.
+# replacing osm_complexity.csv with a file in the same column format
+# (minus seg_id — bare points are joined to the nearest segment in 04).
 
 import sys
 import os
@@ -130,10 +131,12 @@ centroids = gpd.GeoSeries(
 
 # -------------------------------------------------------
 # Build output CSV
-# Column format matches what 04_spatial_join.py expects
+# Column format matches what 04_spatial_join.py expects; seg_id keys
+# each record to its source segment so 04 can skip the spatial join
 # -------------------------------------------------------
 output = pd.DataFrame({
     "scenario_id":      [f"osm_{i}" for i in range(len(roads))],
+    "seg_id":           roads["seg_id"].values,
     "center_x":         centroids.x.values,   # longitude (geographic)
     "center_y":         centroids.y.values,   # latitude  (geographic)
     "num_vehicles":     (roads["complexity_score"] * 8).round().astype(int),
@@ -1,37 +1,55 @@
 # scripts/04_spatial_join.py
 # Attaches all three risk layers to the road network:
-#   Join 1 — Street View distress:    direct merge on osmid (already at segment level)
-#   Join 2 — OSM behavioral complexity: sjoin_nearest 100m radius
-#   Join 3 — SWITRS accident history:   sjoin_nearest 30m radius
+#   Join 1 — Street View distress:    direct merge on seg_id (already at segment level)
+#   Join 2 — OSM behavioral complexity: hash join on seg_id (03 output);
+#                                       nearest segment within 100m for bare points
+#   Join 3 — SWITRS accident history:   nearest segment, counted at every
+#                                       radius in ACCIDENT_RADII in one pass
+#
+# Nearest-segment joins query one persisted road-segment index
+# (scripts/road_index.py), rebuilt only when the network geometry changes.
 
 import sys
 import os
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-from shapely.geometry import Point
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.config import *
+from scripts.road_index import RoadIndex
 
 print("Loading road network...")
 roads = gpd.read_file(ROADS_RAW).to_crs(CRS_PROJECTED)
 
-# Force osmid to string throughout — prevents silent merge failures
-# when one side is int64 and the other is object
-roads["osmid"] = roads["osmid"].astype(str)
+# Every join is keyed on the integer seg_id from 01 — the osmid string
+# (possibly a list) stays in SEGMENT_LOOKUP instead of every output table
+roads = roads.drop(columns="osmid", errors="ignore")
 print(f"Loaded {len(roads)} road segments")
 
+# Road-segment index — opened on first spatial join, shared by the rest
+road_index   = None
+road_seg_ids = roads["seg_id"].values
+
+
+def nearest_segments(lon, lat, max_distance):
+    """Geographic lon/lat arrays → (point positions, road row positions, distances)
+    of the nearest segment within max_distance"""
+    global road_index
+    if road_index is None:
+        road_index = RoadIndex.open(roads.geometry.values)
+    points = gpd.GeoSeries.from_xy(lon, lat, crs=CRS_GEOGRAPHIC).to_crs(CRS_PROJECTED).values
+    return road_index.nearest(points, max_distance)
+
 # -------------------------------------------------------
-# Join 1: Street View distress — direct merge on osmid
+# Join 1: Street View distress — direct merge on seg_id
 # Scores already aggregated to segment level by 02c
 # -------------------------------------------------------
 print("\nJoining Street View distress scores...")
 distress = pd.read_csv(SV_DISTRESS_SEG)
-distress["osmid"] = distress["osmid"].astype(str)
 
 roads = roads.merge(
-    distress[["osmid", "avg_distress", "max_distress", "sample_count", "reliable"]],
-    on="osmid",
+    distress[["seg_id", "avg_distress", "max_distress", "sample_count", "reliable"]],
+    on="seg_id",
     how="left"
 )
 
@@ -46,47 +64,31 @@ roads["sv_imputed"]   = roads["sample_count"].isna()
 
 # -------------------------------------------------------
 # Join 2: OSM behavioral complexity
-# Each complexity point spatially joined to nearest road within 100m
-# Drop osmid from complexity data before joining to avoid column conflict
+# Records from 03 carry their segment's seg_id — direct hash join.
+# External trajectory data (bare points, no seg_id) is joined
+# spatially to the nearest road within 100m instead.
 # -------------------------------------------------------
 print("\nJoining OSM behavioral complexity scores...")
 try:
     complexity_df = pd.read_csv(OSM_COMPLEXITY_CSV)
     print(f"Loaded {len(complexity_df)} complexity records")
 
-    # Remove osmid column if present — prevents sjoin_nearest column conflict
-    if "osmid" in complexity_df.columns:
-        complexity_df = complexity_df.drop(columns=["osmid"])
-
-    complexity_gdf = gpd.GeoDataFrame(
-        complexity_df,
-        geometry=[
-            Point(x, y) for x, y in
-            zip(complexity_df.center_x, complexity_df.center_y)
-        ],
-        crs=CRS_GEOGRAPHIC   # center_x/y are in lat/lon (geographic)
-    ).to_crs(CRS_PROJECTED)  # reproject to meters for distance join
-
-    # Spatial join — each complexity point joins to nearest road segment
-    complexity_joined = gpd.sjoin_nearest(
-        complexity_gdf,
-        roads[["osmid", "geometry"]],
-        max_distance=100   # 100 meter search radius
-    )
-
-    # Force osmid to string after join
-    complexity_joined["osmid"] = complexity_joined["osmid"].astype(str)
+    if "seg_id" in complexity_df.columns:
+        # Segment-keyed — no geometry needed, no risk of matching a crossing street
+        complexity_joined = complexity_df[complexity_df["seg_id"].isin(road_seg_ids)]
+    else:
+        # Bare points — center_x/y are lon/lat, nearest road segment within 100 m
+        pt, seg, _ = nearest_segments(complexity_df.center_x, complexity_df.center_y, max_distance=100)
+        complexity_joined = complexity_df.iloc[pt].assign(seg_id=road_seg_ids[seg])
     print(f"Matched {len(complexity_joined)} complexity records to road segments")
 
-    complexity_per_road = complexity_joined.groupby("osmid").agg(
+    complexity_per_road = complexity_joined.groupby("seg_id").agg(
         avg_complexity = ("complexity_score", "mean"),
         max_complexity = ("complexity_score", "max"),
         scenario_count = ("scenario_id", "count")
     ).reset_index()
 
-    complexity_per_road["osmid"] = complexity_per_road["osmid"].astype(str)
-
-    roads = roads.merge(complexity_per_road, on="osmid", how="left")
+    roads = roads.merge(complexity_per_road, on="seg_id", how="left")
 
     complexity_coverage = roads["avg_complexity"].notna().sum()
     print(f"Complexity coverage: {complexity_coverage}/{len(roads)} segments ({complexity_coverage/len(roads)*100:.1f}%)")
@@ -98,61 +100,55 @@ except FileNotFoundError:
     roads["scenario_count"] = 0
 
 # -------------------------------------------------------
-# Join 3: Accident history — sjoin_nearest 30m radius
-# Count / weight accidents within 30 metres of each segment
+# Join 3: Accident history — nearest segment, several radii
+# One index query at the largest radius; each crash then counts
+# towards its nearest segment at every radius it falls within.
+# accident_count / severity_score mirror ACCIDENT_RADIUS (30 m
+# by default), so 05 can switch radius without re-running this.
 # Zero is valid — quiet streets genuinely have no accidents
 # -------------------------------------------------------
+radii = sorted(set(ACCIDENT_RADII) | {ACCIDENT_RADIUS})
+
 print("\nJoining SWITRS accident data...")
 try:
-    accidents = pd.read_csv(ACCIDENTS_CSV)
+    # Only the columns (and collision years) this join needs
+    if not os.path.exists(ACCIDENTS_PARQUET):
+        raise FileNotFoundError(ACCIDENTS_PARQUET)
+    accidents = pd.read_parquet(
+        ACCIDENTS_PARQUET,
+        columns=["latitude", "longitude", "severity_weight"],
+        filters=[("collision_year", "in", list(ACCIDENT_YEARS))] if ACCIDENT_YEARS else None
+    )
     print(f"Loaded {len(accidents)} accident records")
 
-    # Confirm coordinate columns exist
-    if "latitude" not in accidents.columns or "longitude" not in accidents.columns:
-        print("Accident CSV missing latitude/longitude columns — setting count to 0")
-        roads["accident_count"]  = 0
-        roads["severity_score"]  = 0
-    else:
-        accidents = accidents.dropna(subset=["latitude", "longitude"])
-
-        accidents_gdf = gpd.GeoDataFrame(
-            accidents,
-            geometry=[
-                Point(lon, lat) for lon, lat in
-                zip(accidents.longitude, accidents.latitude)
-            ],
-            crs=CRS_GEOGRAPHIC
-        ).to_crs(CRS_PROJECTED)
-
-        acc_joined = gpd.sjoin_nearest(
-            accidents_gdf,
-            roads[["osmid", "geometry"]],
-            max_distance=30   # 30 metre radius — tight to avoid cross-street attribution
-        )
-
-        acc_joined["osmid"] = acc_joined["osmid"].astype(str)
-
-        # Aggregate — count and severity score per segment
-        agg_dict = {"osmid": "count"}
-        if "severity_weight" in acc_joined.columns:
-            agg_dict["severity_weight"] = "sum"
-
-        acc_per_road = acc_joined.groupby("osmid").agg(
-            accident_count  = ("osmid", "count"),
-            **( {"severity_score": ("severity_weight", "sum")}
-                if "severity_weight" in acc_joined.columns else {} )
-        ).reset_index()
-
-        acc_per_road["osmid"] = acc_per_road["osmid"].astype(str)
-
-        roads = roads.merge(acc_per_road, on="osmid", how="left")
-        acc_coverage = roads["accident_count"].notna().sum()
-        print(f"Accident coverage: {acc_coverage}/{len(roads)} segments ({acc_coverage/len(roads)*100:.1f}%)")
+    accidents = accidents.dropna(subset=["latitude", "longitude"])
+
+    pt, seg, dist = nearest_segments(accidents.longitude, accidents.latitude, max_distance=radii[-1])
+
+    # Optional distance decay — a crash on the centreline counts 1,
+    # one ACCIDENT_DECAY metres off counts 1/e
+    weight   = np.exp(-dist / ACCIDENT_DECAY) if ACCIDENT_DECAY else np.ones(len(dist))
+    severity = accidents["severity_weight"].to_numpy()[pt] * weight
+
+    # Aggregate — count and severity score per segment, per radius
+    for r in radii:
+        within = dist <= r
+        count  = np.bincount(seg[within], weights=weight[within], minlength=len(roads))
+        roads[f"accident_count_r{r}"] = count if ACCIDENT_DECAY else count.astype(int)
+        roads[f"severity_score_r{r}"] = np.bincount(seg[within], weights=severity[within], minlength=len(roads))
+        acc_coverage = (count > 0).sum()
+        print(f"Accident coverage at {r:>3} m: {acc_coverage}/{len(roads)} segments ({acc_coverage/len(roads)*100:.1f}%)")
+
+    roads["accident_count"] = roads[f"accident_count_r{ACCIDENT_RADIUS}"]
+    roads["severity_score"] = roads[f"severity_score_r{ACCIDENT_RADIUS}"]
 
 except FileNotFoundError:
-    print(f"Accident data not found at {ACCIDENTS_CSV}")
+    print(f"Accident data not found at {ACCIDENTS_PARQUET}")
     print("Run scripts/00_preprocess_accidents.py first, or continue without accident data")
     print("If continuing without: set WEIGHT_ACCIDENTS=0 in config.py")
+    for r in radii:
+        roads[f"accident_count_r{r}"] = 0
+        roads[f"severity_score_r{r}"] = 0
     roads["accident_count"] = 0
     roads["severity_score"] = 0
 
@@ -176,7 +172,3 @@ roads.to_file(ROADS_FEATURES, driver="GPKG")
 print(f"\nSaved {len(roads)} segments to {ROADS_FEATURES}")
 print(f"\nFeature summary:")
 print(roads[["avg_distress", "avg_complexity", "accident_count"]].describe())
-
-
-
-
@@ -7,56 +7,135 @@
 #     to prevent one extreme outlier from compressing all other scores
 #   - Risk tiers based on score percentiles (not fixed bins) so all
 #     four categories are meaningfully populated regardless of distribution
+#
+#   python scripts/05_risk_scoring.py           score with the config weights
+#   python scripts/05_risk_scoring.py --sweep   rank / tier / dominant-factor stability
+#                                               over SWEEP_RESOLUTION simplex weights
+#                                               → OUTPUT_SWEEP (ROADS_RISK untouched)
+#
+# Scores, tiers and dominant factors come from the vectorized kernels in
+# scripts/scoring_kernels.py, shared by both modes.
+#
+# The capped + normalized matrix is cached (scripts/feature_cache.py) by a
+# hash of the input feature columns: a re-score with new weights or tier
+# cutoffs reads no geometry and only rewrites ROADS_RISK's score columns.
 
 import sys
 import os
+import time
 import pandas as pd
 import geopandas as gpd
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.config import *
+from scripts.scoring_kernels import (
+    FACTORS, TIER_LABELS, risk_scores, risk_tiers, dominant_factors,
+    simplex_weights, weight_sweep
+)
+from scripts.feature_cache import NormCache, feature_hash, update_gpkg_columns
 
+# Attribute columns only — geometry is read just for a full rewrite of ROADS_RISK
 print("Loading road features...")
-roads = gpd.read_file(ROADS_FEATURES)
+roads = gpd.read_file(ROADS_FEATURES, ignore_geometry=True)
 
 # -------------------------------------------------------
-# Cap accident outliers before normalization
-# A segment with 75 accidents vs one with 5 are both
-# high-risk — the difference isn't meaningfully 15x.
-# Capping at 95th percentile prevents the outlier from
-# compressing all other accident scores toward zero.
+# Accident radius — 04 stores counts at every ACCIDENT_RADII
+# radius, so changing ACCIDENT_RADIUS only needs this step
 # -------------------------------------------------------
-acc_cap = roads["accident_count"].quantile(0.95)
-print(f"Capping accident count at 95th percentile: {acc_cap:.1f}")
-roads["accident_count_capped"] = roads["accident_count"].clip(upper=acc_cap)
+radius_col = f"accident_count_r{ACCIDENT_RADIUS}"
+if radius_col in roads.columns:
+    roads["accident_count"] = roads[radius_col]
+    roads["severity_score"] = roads[f"severity_score_r{ACCIDENT_RADIUS}"]
+    print(f"Accident attribution radius: {ACCIDENT_RADIUS} m")
+else:
+    print(f"No {radius_col} column — re-run 04 with {ACCIDENT_RADIUS} in ACCIDENT_RADII; using accident_count")
 
 # -------------------------------------------------------
-# Normalize each component independently to 0-1
-# Worst segment in each category → 1.0   Best → 0.0
+# Normalized component matrix — reused from RISK_NORM_CACHE
+# while the input feature columns are unchanged
 # -------------------------------------------------------
-scaler   = MinMaxScaler()
-features = ["avg_distress", "avg_complexity", "accident_count_capped"]
-norm     = scaler.fit_transform(roads[features].fillna(0))
+features   = ["avg_distress", "avg_complexity", "accident_count"]
+digest     = feature_hash(roads, ["seg_id", *features])
+norm_cache = NormCache()
+cached     = norm_cache.load(digest)
 
-roads["norm_surface"]   = norm[:, 0]   # Street View CV distress
-roads["norm_behavior"]  = norm[:, 1]   # OSM behavioral complexity
-roads["norm_accidents"] = norm[:, 2]   # SWITRS severity-weighted accidents
+if cached is not None and np.array_equal(cached[1], roads["seg_id"].to_numpy()):
+    norm    = cached[0]
+    acc_cap = norm_cache.meta["acc_cap"]
+    print(f"Normalized features: cached ({RISK_NORM_CACHE}, hash {digest[:12]})")
+else:
+    cached = None
+
+    # -------------------------------------------------------
+    # Cap accident outliers before normalization
+    # A segment with 75 accidents vs one with 5 are both
+    # high-risk — the difference isn't meaningfully 15x.
+    # Capping at 95th percentile prevents the outlier from
+    # compressing all other accident scores toward zero.
+    # -------------------------------------------------------
+    acc_cap = float(roads["accident_count"].quantile(0.95))
+    print(f"Capping accident count at 95th percentile: {acc_cap:.1f}")
+
+    # -------------------------------------------------------
+    # Normalize each component independently to 0-1
+    # Worst segment in each category → 1.0   Best → 0.0
+    # -------------------------------------------------------
+    raw = pd.DataFrame({
+        "avg_distress":          roads["avg_distress"],
+        "avg_complexity":        roads["avg_complexity"],
+        "accident_count_capped": roads["accident_count"].clip(upper=acc_cap),
+    }).fillna(0)
+    scaler = MinMaxScaler()
+    norm   = scaler.fit_transform(raw)
+    norm_cache.save(
+        digest, roads["seg_id"].to_numpy(), norm, acc_cap=acc_cap,
+        scaler_min=scaler.data_min_.tolist(), scaler_max=scaler.data_max_.tolist()
+    )
 
 print(f"\nNormalized score means:")
-print(f"  Surface:   {roads['norm_surface'].mean():.3f}")
-print(f"  Behavior:  {roads['norm_behavior'].mean():.3f}")
-print(f"  Accidents: {roads['norm_accidents'].mean():.3f}")
+print(f"  Surface:   {norm[:, 0].mean():.3f}")
+print(f"  Behavior:  {norm[:, 1].mean():.3f}")
+print(f"  Accidents: {norm[:, 2].mean():.3f}")
+
+weights = np.array([WEIGHT_SURFACE, WEIGHT_BEHAVIOR, WEIGHT_ACCIDENTS])
+
+# -------------------------------------------------------
+# Sweep mode — every weight triple on the simplex lattice,
+# evaluated in vectorized blocks over the same norm matrix
+# -------------------------------------------------------
+if "--sweep" in sys.argv:
+    grid = simplex_weights(SWEEP_RESOLUTION)
+    print(f"\nSweeping {len(grid)} weight triples (simplex step 1/{SWEEP_RESOLUTION}) "
+          f"against baseline Surface={WEIGHT_SURFACE} | Behavior={WEIGHT_BEHAVIOR} | Accidents={WEIGHT_ACCIDENTS}")
+    t0     = time.perf_counter()
+    sweep  = weight_sweep(norm, weights, grid)
+    print(f"Swept in {time.perf_counter() - t0:.1f}s")
+
+    base   = risk_scores(norm, weights)
+    report = pd.DataFrame({
+        "seg_id":          roads["seg_id"],
+        "name":            roads["name"] if "name" in roads.columns else None,
+        "risk_score":      base,
+        "risk_tier":       np.array(TIER_LABELS)[risk_tiers(base)],
+        "dominant_factor": np.array(FACTORS)[dominant_factors(norm, weights)],
+        **sweep
+    })
+    os.makedirs(os.path.dirname(OUTPUT_SWEEP), exist_ok=True)
+    report.to_csv(OUTPUT_SWEEP, index=False)
+
+    print(f"\nSaved per-segment stability to {OUTPUT_SWEEP}")
+    print(f"Segments whose tier never changes:        {(report['tier_flip_rate'] == 0).mean():.1%}")
+    print(f"Segments whose tier changes in >50% runs: {(report['tier_flip_rate'] > 0.5).mean():.1%}")
+    print(f"Median dominant-factor stability:         {report['dominant_stability'].median():.2f}")
+    sys.exit(0)
+
 print(f"\nWeights: Surface={WEIGHT_SURFACE} | Behavior={WEIGHT_BEHAVIOR} | Accidents={WEIGHT_ACCIDENTS}")
 
 # -------------------------------------------------------
 # Weighted composite risk score
 # -------------------------------------------------------
-roads["risk_score"] = (
-    roads["norm_surface"]   * WEIGHT_SURFACE   +
-    roads["norm_behavior"]  * WEIGHT_BEHAVIOR  +
-    roads["norm_accidents"] * WEIGHT_ACCIDENTS
-)
+scores = pd.DataFrame({"risk_score": risk_scores(norm, weights)})
 
 # -------------------------------------------------------
 # Risk tiers — percentile-based bins
@@ -68,16 +147,8 @@ roads["risk_score"] = (
 #   High     = 70th–90th percentile
 #   Critical = top 10%
 # -------------------------------------------------------
-roads["risk_tier"] = pd.cut(
-    roads["risk_score"],
-    bins=[
-        roads["risk_score"].min() - 0.001,
-        roads["risk_score"].quantile(0.40),
-        roads["risk_score"].quantile(0.70),
-        roads["risk_score"].quantile(0.90),
-        roads["risk_score"].max()
-    ],
-    labels=["Low", "Moderate", "High", "Critical"]
+scores["risk_tier"] = pd.Categorical.from_codes(
+    risk_tiers(scores["risk_score"].to_numpy()), TIER_LABELS, ordered=True
 )
 
 # -------------------------------------------------------
@@ -86,21 +157,39 @@ roads["risk_tier"] = pd.cut(
 # segment's score — useful for explaining results to
 # non-technical audiences and prioritizing interventions
 # -------------------------------------------------------
-def dominant_factor(row):
-    factors = {
-        "Surface Condition":      row["norm_surface"]   * WEIGHT_SURFACE,
-        "Behavioral Complexity":  row["norm_behavior"]  * WEIGHT_BEHAVIOR,
-        "Accident History":       row["norm_accidents"] * WEIGHT_ACCIDENTS
-    }
-    return max(factors, key=factors.get)
+scores["dominant_factor"] = np.array(FACTORS)[dominant_factors(norm, weights)]
 
-roads["dominant_factor"] = roads.apply(dominant_factor, axis=1)
+# -------------------------------------------------------
+# Save — same features as the last full write: overwrite
+# the three score columns in place. Otherwise write the
+# full layer (geometry included) and remember its hash.
+# -------------------------------------------------------
+if cached is not None and os.path.exists(ROADS_RISK) and norm_cache.written(ROADS_RISK) == digest:
+    update_gpkg_columns(ROADS_RISK, "seg_id", roads["seg_id"].to_numpy(), {
+        "risk_score":      scores["risk_score"].to_numpy(),
+        "risk_tier":       scores["risk_tier"].astype(str).to_numpy(),
+        "dominant_factor": scores["dominant_factor"].to_numpy(),
+    })
+    print(f"\nUpdated score columns in {ROADS_RISK}")
+else:
+    roads = gpd.read_file(ROADS_FEATURES)
+    if radius_col in roads.columns:
+        roads["accident_count"] = roads[radius_col]
+        roads["severity_score"] = roads[f"severity_score_r{ACCIDENT_RADIUS}"]
+    roads["accident_count_capped"] = roads["accident_count"].clip(upper=acc_cap)
+    roads["norm_surface"]   = norm[:, 0]   # Street View CV distress
+    roads["norm_behavior"]  = norm[:, 1]   # OSM behavioral complexity
+    roads["norm_accidents"] = norm[:, 2]   # SWITRS severity-weighted accidents
+    for col in scores.columns:
+        roads[col] = scores[col].to_numpy()
 
-roads.to_file(ROADS_RISK, driver="GPKG")
+    roads.to_file(ROADS_RISK, driver="GPKG")
+    norm_cache.mark_written(ROADS_RISK)
+    print(f"\nSaved {len(roads)} segments to {ROADS_RISK}")
 
 print(f"\nRisk tier distribution:")
-print(roads["risk_tier"].value_counts().reindex(["Low", "Moderate", "High", "Critical"]))
+print(scores["risk_tier"].value_counts().reindex(["Low", "Moderate", "High", "Critical"]))
 print(f"\nDominant risk factors:")
-print(roads["dominant_factor"].value_counts())
+print(scores["dominant_factor"].value_counts())
 print(f"\nRisk score distribution:")
-print(roads["risk_score"].describe())
\ No newline at end of file
+print(scores["risk_score"].describe())
\ No newline at end of file
@@ -1,60 +1,149 @@
 # scripts/06_hotspot_analysis.py
+# Getis-Ord Gi* hotspots of the risk score — see scripts/gistar.py.
+#
+#   python scripts/06_hotspot_analysis.py               # GI_PERMUTATIONS on GI_WORKERS processes
+#   python scripts/06_hotspot_analysis.py --check-esda  # also run esda.G_Local and compare
+#   python scripts/06_hotspot_analysis.py --bands       # also every HOTSPOT_BANDS distance band
+#   python scripts/06_hotspot_analysis.py --network     # street-network distance, whatever HOTSPOT_WEIGHTS says
+#   python scripts/06_hotspot_analysis.py --incremental # only re-test segments near changed risk scores (not with --bands)
+#   python scripts/06_hotspot_analysis.py --incremental --verify   # ... and compare with a full run
 import sys
 import os
+import time
 import numpy as np
 import geopandas as gpd
-from libpysal.weights import DistanceBand
-from esda.getisord import G_Local
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.config import *
+from scripts.gistar import (gi_star, gi_star_bands, gi_star_update, affected_sites, hotspot_classes,
+                            most_significant_band, results_key, save_results, load_results)
+from scripts.spatial_weights import (open_weights, open_network_weights, band_weights,
+                                     distance_pairs, network_distance_pairs)
+
+CHECK_ESDA = "--check-esda" in sys.argv
+MULTIBAND  = "--bands" in sys.argv
+NETWORK    = "--network" in sys.argv or HOTSPOT_WEIGHTS == "network"
+INCREMENTAL = "--incremental" in sys.argv
+VERIFY      = "--verify" in sys.argv
+if INCREMENTAL and MULTIBAND:
+    # The checkpoint holds the single SPATIAL_WEIGHT_THRESHOLD band only
+    sys.exit("--incremental re-tests the SPATIAL_WEIGHT_THRESHOLD band only — drop --bands or --incremental")
 
 print("Loading risk-scored roads...")
 roads = gpd.read_file(ROADS_RISK).to_crs(CRS_PROJECTED)
 
-# Use segment centroids to build the spatial weight matrix
+# Segment centroids for Euclidean weights; u, v, length of 01's graph for network weights
 centroids = roads.geometry.centroid
 coords    = np.column_stack([centroids.x, centroids.y])
+metric    = "network" if NETWORK else "euclidean"
+
+y = roads["risk_score"].fillna(0).values
+
+if MULTIBAND:
+    # One neighbour search at the widest band, one set of permutation draws —
+    # each band still adds its own weighted sums, which grow with its neighbour
+    # count: the default bands cost about twice the 1 km band alone
+    bands = sorted(set(HOTSPOT_BANDS) | {SPATIAL_WEIGHT_THRESHOLD})
+    print(f"Spatial weights matrices ({metric}, bands {', '.join(f'{b}m' for b in bands)})...")
+    if NETWORK:
+        pairs = network_distance_pairs(roads["u"], roads["v"], roads["length"], max(bands))
+    else:
+        pairs = distance_pairs(coords, max(bands))
+    weights = band_weights(len(roads), pairs, bands)
+    for band, band_w in zip(bands, weights):
+        if band_w.nnz:
+            print(f"  {band:>5}m: mean neighbors per segment {band_w.nnz / band_w.shape[0]:.1f}")
+        else:
+            print(f"  {band:>5}m: no neighbours within the band — Gi* is undefined, every segment Not Significant")
+
+    print(f"Running Getis-Ord Gi* on {len(bands)} bands ({GI_PERMUTATIONS} permutations, {GI_WORKERS} workers)...")
+    start   = time.perf_counter()
+    results = gi_star_bands(y, weights)
+    print(f"Gi* done in {time.perf_counter() - start:.1f}s")
+
+    for band, (band_z, band_p) in zip(bands, results):
+        roads[f"gi_zscore_{band}m"]     = band_z
+        roads[f"gi_pvalue_{band}m"]     = band_p
+        roads[f"hotspot_class_{band}m"] = hotspot_classes(band_z, band_p)
+    best    = most_significant_band(bands, [z for z, _ in results], [p for _, p in results])
+    classes = np.stack([roads[f"hotspot_class_{band}m"].to_numpy() for band in bands])
+    roads["gi_best_band"]       = best
+    roads["hotspot_class_best"] = classes[np.searchsorted(bands, best), np.arange(len(roads))]
+
+    w = weights[bands.index(SPATIAL_WEIGHT_THRESHOLD)]
+    zs, p_sim = results[bands.index(SPATIAL_WEIGHT_THRESHOLD)]
+else:
+    print(f"Spatial weights matrix ({metric}, threshold={SPATIAL_WEIGHT_THRESHOLD}m)...")
+    # inverse distance, row-standardized — cached until the network changes
+    if NETWORK:
+        w = open_network_weights(roads["u"], roads["v"], roads["length"])
+    else:
+        w = open_weights(coords)
+    print(f"Mean neighbors per segment: {w.nnz / w.shape[0]:.1f}")
+
+    # The last run's scores and results, valid while weights and permutation settings match
+    key     = results_key(w)
+    seg_ids = roads["seg_id"].to_numpy()
+    cached  = load_results(GI_CACHE, key) if INCREMENTAL else None
+    if INCREMENTAL and (cached is None or not np.array_equal(cached["seg_id"], seg_ids)):
+        print(f"No cached Gi* run for these segments and weights — running in full")
+        cached = None
+    if cached is not None:
+        changed  = np.flatnonzero(cached["y"] != y)
+        affected = affected_sites(w, changed)
+        if len(affected) > GI_INCREMENTAL_MAX * len(y):
+            print(f"{len(changed)} changed segments affect {len(affected) / len(y):.0%} of the network "
+                  f"(> GI_INCREMENTAL_MAX) — running in full")
+            cached = None
+
+    start = time.perf_counter()
+    if cached is not None:
+        print(f"Updating Gi*: {len(changed)} changed segments, {len(affected)} with a changed neighbourhood...")
+        zs, p_sim, _ = gi_star_update(y, w, cached["p_sim"], changed)
+    else:
+        print(f"Running Getis-Ord Gi* ({GI_PERMUTATIONS} permutations, {GI_WORKERS} workers)...")
+        zs, p_sim = gi_star(y, w)
+    print(f"Gi* done in {time.perf_counter() - start:.1f}s")
+    save_results(GI_CACHE, key, seg_ids, y, zs, p_sim)
+
+    if VERIFY and cached is not None:
+        print("\nVerifying against a full recompute...")
+        full_z, full_p = gi_star(y, w)
+        agree = hotspot_classes(full_z, full_p) == hotspot_classes(zs, p_sim)
+        print(f"  max |z - full z|:                {np.nanmax(np.abs(zs - full_z)):.2e}")
+        print(f"  affected segments, p identical:  {np.mean(p_sim[affected] == full_p[affected]):.1%}")
+        print(f"  others, max |p - full p|:        {np.abs(p_sim - full_p).max():.4f}")
+        print(f"  same hotspot class:              {agree.mean():.1%}")
+
+# SPATIAL_WEIGHT_THRESHOLD stays the headline band in either mode
+roads["gi_zscore"]     = zs
+roads["gi_pvalue"]     = p_sim
+roads["hotspot_class"] = hotspot_classes(zs, p_sim)
 
-print(f"Building spatial weights matrix (threshold={SPATIAL_WEIGHT_THRESHOLD}m)...")
-w = DistanceBand(
-    coords,
-    threshold=SPATIAL_WEIGHT_THRESHOLD,
-    binary=False,
-    silence_warnings=True
-)
-w.transform = "r"  # row-standardize
-print(f"Mean neighbors per segment: {w.mean_neighbors:.1f}")
-
-print("Running Getis-Ord Gi* (this takes a few minutes)...")
-gi = G_Local(
-    roads["risk_score"].fillna(0).values,
-    w,
-    star=True,
-    transform="r",
-    permutations=999  # 999 random simulations for reliable p-values
-)
-
-roads["gi_zscore"] = gi.Zs
-roads["gi_pvalue"] = gi.p_sim
-
-def classify_hotspot(z, p):
-    if   p <= 0.01 and z > 0: return "Hot Spot (99%)"
-    elif p <= 0.05 and z > 0: return "Hot Spot (95%)"
-    elif p <= 0.10 and z > 0: return "Hot Spot (90%)"
-    elif p <= 0.01 and z < 0: return "Cold Spot (99%)"
-    elif p <= 0.05 and z < 0: return "Cold Spot (95%)"
-    elif p <= 0.10 and z < 0: return "Cold Spot (90%)"
-    else:                      return "Not Significant"
-
-roads["hotspot_class"] = roads.apply(
-    lambda r: classify_hotspot(r["gi_zscore"], r["gi_pvalue"]),
-    axis=1
-)
+# ---------------------------------------------------
+# Optional cross-check against esda
+# ---------------------------------------------------
+if CHECK_ESDA:
+    from esda.getisord import G_Local
+    from libpysal.weights import WSP
+    print("\nRunning esda.G_Local for comparison...")
+    start = time.perf_counter()
+    gi = G_Local(y, WSP(w).to_W(silence_warnings=True), star=True, transform="r", permutations=GI_PERMUTATIONS, seed=GI_SEED)
+    print(f"esda done in {time.perf_counter() - start:.1f}s")
+    # z-scores are analytical and must agree to rounding; p_sim only up to
+    # Monte Carlo noise — ~sqrt(p(1-p)/permutations) for each of the two runs
+    agree = hotspot_classes(gi.Zs, gi.p_sim) == roads["hotspot_class"].to_numpy()
+    print(f"  max |z - esda z|:        {np.nanmax(np.abs(zs - gi.Zs)):.2e}")
+    print(f"  mean |p - esda p|:       {np.abs(p_sim - gi.p_sim).mean():.4f}")
+    print(f"  mean p (engine / esda):  {p_sim.mean():.4f} / {gi.p_sim.mean():.4f}")
+    print(f"  same hotspot class:      {agree.mean():.1%}")
 
 roads.to_file(ROADS_HOTSPOT, driver="GPKG")
 
 print(f"\nHotspot classification results:")
 print(roads["hotspot_class"].value_counts())
+if MULTIBAND:
+    print(f"\nMost significant band per segment:")
+    print(roads["gi_best_band"].value_counts().sort_index())
 print(f"\nTop 10 highest-risk hotspot segments:")
 hot = roads[roads["hotspot_class"].str.contains("Hot", na=False)]
-print(hot.nlargest(10, "gi_zscore")[["name", "risk_score", "hotspot_class", "dominant_factor"]])
\ No newline at end of file
+print(hot.nlargest(10, "gi_zscore")[["name", "risk_score", "hotspot_class", "dominant_factor"]])
@@ -1,12 +1,30 @@
 # scripts/07_build_webmap.py
+# Interactive hotspot map — one client-side segment layer (scripts/webmap_layer.py)
+# with Street View thumbnails (scripts/thumbnails.py) as external files in OUTPUT_THUMBS.
+#
+#   python scripts/07_build_webmap.py                 # OUTPUT_MAP
+#   python scripts/07_build_webmap.py --synthetic 10  # network tiled 10×, to a separate file — for sizing
 import sys
 import os
-import base64
+import time
+import argparse
+import numpy as np
+import pandas as pd
 import geopandas as gpd
+import shapely
 import folium
 from folium.plugins import MiniMap, Fullscreen
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.config import *
+from scripts.image_store import ImageStore
+from scripts.thumbnails import build_thumbnails
+from scripts.webmap_layer import SegmentLayer, segment_payload, level_vertices, write_levels
+
+parser = argparse.ArgumentParser(description="Build the interactive risk map")
+parser.add_argument("--synthetic", type=int, default=1, metavar="N",
+                    help="tile the network N times side by side and write OUTPUT_MAP with a _synthetic{N}x suffix")
+args = parser.parse_args()
+build_start = time.perf_counter()
 
 # Color scheme matches standard Gi* hotspot map convention
 HOTSPOT_COLORS = {
@@ -19,77 +37,46 @@ HOTSPOT_COLORS = {
     "Cold Spot (99%)": "#2c7bb6"
 }
 
-def load_thumbnail(osmid):
-    """Load cached Street View image as base64 string for popup embedding"""
-    path = os.path.join(SV_IMAGES_DIR, f"seg_{osmid}_s0.jpg")
-    if os.path.exists(path):
-        with open(path, "rb") as f:
-            return base64.b64encode(f.read()).decode()
-    return None
-
-def build_popup(row):
-    """Build HTML popup with Street View photo and risk metrics"""
-    b64 = load_thumbnail(row.get("osmid", ""))
-    img_html = (
-        f'<img src="data:image/jpeg;base64,{b64}" '
-        f'width="400" style="border-radius:6px;margin-bottom:8px;display:block"><br>'
-        if b64 else ""
-    )
-
-    tier_colors = {
-        "Low": "#2ecc71", "Moderate": "#f39c12",
-        "High": "#e67e22", "Critical": "#e74c3c"
-    }
-    tier  = str(row.get("risk_tier", "N/A"))
-    color = tier_colors.get(tier, "#95a5a6")
-    badge = (
-        f'<span style="background:{color};color:white;padding:2px 8px;'
-        f'border-radius:10px;font-size:11px">{tier}</span>'
-    )
-
-    return (
-        f'<div style="font-family:Arial;font-size:12px;width:420px">'
-        f'{img_html}'
-        f'<b>{row.get("name", "Road Segment")}</b> {badge}<br><br>'
-        f'<b>Risk Score:</b> {row.get("risk_score", 0):.3f}<br>'
-        f'<b>Hotspot Class:</b> {row.get("hotspot_class", "N/A")}<br>'
-        f'<b>Gi* Z-Score:</b> {row.get("gi_zscore", 0):.3f}<br>'
-        f'<hr style="margin:4px 0">'
-        f'<b>Components:</b><br>'
-        f'Pavement Distress: {row.get("avg_distress", 0):.3f}<br>'
-        f'Behavioral Complexity: {row.get("avg_complexity", 0):.3f}<br>'
-        f'Accident Count: {int(row.get("accident_count", 0))}<br><br>'
-        f'<b>Dominant Factor:</b> {row.get("dominant_factor", "N/A")}'
-        f'</div>'
-    )
+def tile_network(roads, copies):
+    """`copies` side-by-side copies of the network (EPSG:4326) — a synthetic larger city"""
+    minx, miny, maxx, maxy = roads.total_bounds
+    cols  = int(np.ceil(np.sqrt(copies)))
+    tiles = []
+    for c in range(copies):
+        dx, dy = (c % cols) * (maxx - minx) * 1.05, (c // cols) * (maxy - miny) * 1.05
+        tile = roads.copy()
+        tile["geometry"] = shapely.transform(roads.geometry.values, lambda xy: xy + [dx, dy])
+        tiles.append(tile)
+    return gpd.GeoDataFrame(pd.concat(tiles, ignore_index=True), crs=roads.crs)
 
 print("Loading hotspot data...")
 roads = gpd.read_file(ROADS_HOTSPOT).to_crs(CRS_GEOGRAPHIC)
+roads = roads[~(roads.geometry.isna() | roads.geometry.is_empty)].reset_index(drop=True)
+output_map = OUTPUT_MAP
+if args.synthetic > 1:
+    roads      = tile_network(roads, args.synthetic)
+    output_map = OUTPUT_MAP.replace(".html", f"_synthetic{args.synthetic}x.html")
 
 m = folium.Map(location=MAP_CENTER, zoom_start=MAP_ZOOM, tiles="CartoDB positron")
 MiniMap(toggle_display=True).add_to(m)
 Fullscreen().add_to(m)
 
-print(f"Adding {len(roads)} road segments to map...")
-skipped = 0
-
-for _, row in roads.iterrows():
-    if row.geometry is None or row.geometry.is_empty:
-        skipped += 1
-        continue
+print(f"Deriving thumbnails in {OUTPUT_THUMBS}...")
+store = ImageStore()
+thumb_paths, stats = build_thumbnails(store)
+print(f"Thumbnails: {stats['derived']} derived | {stats['current']} already current"
+      + (f" | {stats['failed']} undecodable" if stats["failed"] else ""))
+map_dir = os.path.dirname(output_map)
+thumbs  = roads["seg_id"].map({seg_id: os.path.relpath(path, map_dir).replace(os.sep, "/")
+                               for seg_id, path in thumb_paths.items()})
 
-    hotspot_class = str(row.get("hotspot_class", "Not Significant"))
-    color  = HOTSPOT_COLORS.get(hotspot_class, "#d3d3d3")
-    weight = 6 if "Hot Spot" in hotspot_class else 2
-
-    folium.GeoJson(
-        row.geometry.__geo_interface__,
-        style_function=lambda x, c=color, w=weight: {
-            "color": c, "weight": w, "opacity": 0.85
-        },
-        popup=folium.Popup(build_popup(row), max_width=430),
-        tooltip=f"{row.get('name', 'Segment')} — Risk: {row.get('risk_score', 0):.2f}"
-    ).add_to(m)
+print(f"Adding {len(roads)} road segments to map...")
+payload = segment_payload(roads, thumbs, HOTSPOT_COLORS)
+for (zoom, tolerance, _), vertices in zip(sorted(MAP_LOD), level_vertices(payload)):
+    print(f"  zoom {zoom:>2}+: {tolerance:>3} m tolerance, {vertices:,} vertices")
+os.makedirs(map_dir, exist_ok=True)
+level_files = write_levels(payload, output_map)      # finer levels, loaded on zoom
+SegmentLayer(payload).add_to(m)
 
 # Add legend
 legend_html = """
@@ -98,7 +85,13 @@ legend_html = """
      border:2px solid #ccc;font-family:Arial;font-size:12px;
      box-shadow:2px 2px 6px rgba(0,0,0,0.3)">
     <b>AV Road Risk Index</b><br>
-    <i style="color:#666">Menlo Park, CA — Getis-Ord Gi*</i><br><br>
+    <i style="color:#666">Menlo Park, CA</i><br><br>
+    <b>Risk Tier</b> <i style="color:#666">(live weights)</i><br>
+    <span style="color:#e74c3c">━━━</span> Critical — top 10%<br>
+    <span style="color:#e67e22">━━━</span> High — 70th–90th pct<br>
+    <span style="color:#f39c12">━━━</span> Moderate — 40th–70th pct<br>
+    <span style="color:#2ecc71">━━━</span> Low — bottom 40%<br><br>
+    <b>Gi* Hotspots</b> <i style="color:#666">(baked run)</i><br>
     <span style="color:#d7191c">━━━</span> Hot Spot (99%)<br>
     <span style="color:#f17c4a">━━━</span> Hot Spot (95%)<br>
     <span style="color:#fec980">━━━</span> Hot Spot (90%)<br>
@@ -106,15 +99,18 @@ legend_html = """
     <span style="color:#abd9e9">━━━</span> Cold Spot (90%)<br>
     <span style="color:#74add1">━━━</span> Cold Spot (95%)<br>
     <span style="color:#2c7bb6">━━━</span> Cold Spot (99%)<br><br>
-    <b>Risk Weights</b><br>
-    Surface: 35% | Behavior: 40% | Accidents: 25%<br><br>
     <i style="color:#999;font-size:10px">Click any segment for Street View photo</i>
 </div>
 """
 m.get_root().html.add_child(folium.Element(legend_html))
 
-os.makedirs(os.path.dirname(OUTPUT_MAP), exist_ok=True)
-m.save(OUTPUT_MAP)
-print(f"\nMap saved to {OUTPUT_MAP}")
-print(f"Segments added: {len(roads) - skipped} | Skipped: {skipped}")
+m.save(output_map)
+elapsed    = time.perf_counter() - build_start
+thumb_size = sum(os.path.getsize(os.path.join(map_dir, t)) for t in set(thumbs.dropna()))
+print(f"\nMap saved to {output_map}")
+print(f"Segments added: {len(roads)} | Thumbnails: {thumbs.nunique()}")
+level_size = sum(os.path.getsize(path) for path in level_files)
+print(f"Build time: {elapsed:.1f}s | HTML: {os.path.getsize(output_map) / 1e6:.2f} MB"
+      f" | finer levels (loaded on zoom): {level_size / 1e6:.2f} MB"
+      f" | thumbnails (loaded on click): {thumb_size / 1e6:.1f} MB")
 print("Open the .html file in Chrome or Edge to preview")
\ No newline at end of file
@@ -0,0 +1,125 @@
+# scripts/bench_risk_service.py
+# Load generator for the risk query service (scripts/risk_service.py).
+#
+#   python scripts/bench_risk_service.py                        # starts a service, 1 / 4 / 16 clients, 10 s each
+#   python scripts/bench_risk_service.py --clients 8 --duration 30
+#   python scripts/bench_risk_service.py --url http://127.0.0.1:8765   # an already running service
+#
+# Each client is its own process on one keep-alive connection, issuing a mix
+# of bbox (~500 m boxes), nearest, segment-by-id and top-20 queries, plus
+# revalidations of earlier URLs with their ETag (answered 304). Reports
+# throughput and latency percentiles per endpoint.
+import sys
+import os
+import json
+import time
+import socket
+import argparse
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+parser = argparse.ArgumentParser(description="Benchmark the risk query service")
+parser.add_argument("--url", help="service to load; default starts one on a free port")
+parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+parser.add_argument("--duration", type=float, default=10.0, help="seconds per client count")
+args = parser.parse_args()
+
+MIX = {"bbox": 0.3, "nearest": 0.3, "segment": 0.2, "top": 0.1, "revalidate": 0.1}
+
+
+def get(conn, path, etag=None):
+    conn.request("GET", path, headers={"If-None-Match": etag} if etag else {})
+    resp = conn.getresponse()
+    resp.read()
+    return resp.status, resp.getheader("ETag")
+
+
+def client(host, port, bounds, seg_ids, duration, seed):
+    """One client's loop — [(endpoint, seconds)]"""
+    rng   = np.random.default_rng(seed)
+    conn  = http.client.HTTPConnection(host, port)
+    west, south, east, north = bounds
+    names, probs = list(MIX), list(MIX.values())
+    seen, timings = [], []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        kind  = names[rng.choice(len(names), p=probs)]
+        etag  = None
+        lon, lat = rng.uniform(west, east), rng.uniform(south, north)
+        if kind == "bbox":
+            path = f"/segments?bbox={lon:.5f},{lat:.5f},{lon + 0.0057:.5f},{lat + 0.0045:.5f}"
+        elif kind == "nearest":
+            path = f"/nearest?lat={lat:.6f}&lon={lon:.6f}&k=3"
+        elif kind == "segment":
+            path = f"/segment/{seg_ids[rng.integers(len(seg_ids))]}"
+        elif kind == "top":
+            path = "/top?n=20"
+        elif seen:
+            path, etag = seen[rng.integers(len(seen))]
+        else:
+            continue
+        t0 = time.perf_counter()
+        status, tag = get(conn, path, etag)
+        timings.append((kind, time.perf_counter() - t0))
+        if status == 200 and tag and len(seen) < 1000:
+            seen.append((path, tag))
+        elif status not in (200, 304):
+            raise RuntimeError(f"{path} → {status}")
+    conn.close()
+    return timings
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+service = None
+if args.url:
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+else:
+    host, port = "127.0.0.1", free_port()
+    service = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "risk_service.py"),
+                                "--host", host, "--port", str(port)])
+
+# Wait for the service, then learn its extent and segment ids
+for _ in range(600):
+    try:
+        conn   = http.client.HTTPConnection(host, port)
+        conn.request("GET", "/health")
+        health = json.loads(conn.getresponse().read())
+        break
+    except (ConnectionRefusedError, OSError):
+        time.sleep(0.1)
+else:
+    sys.exit(f"No service at {host}:{port}")
+conn.request("GET", f"/top?n={SERVICE_MAX_RESULTS}")
+seg_ids = [f["id"] for f in json.loads(conn.getresponse().read())["features"]]
+conn.close()
+print(f"Service: {health['segments']} segments, version {health['version']} — {host}:{port}\n")
+
+try:
+    print(f"{'clients':>7} {'endpoint':>10} {'requests':>9} {'req/s':>8} {'p50_ms':>7} {'p95_ms':>7} {'p99_ms':>7}")
+    for clients in args.clients:
+        with ProcessPoolExecutor(max_workers=clients) as pool:
+            futures = [pool.submit(client, host, port, health["bounds"], seg_ids, args.duration, seed)
+                       for seed in range(clients)]
+            timings = [t for f in futures for t in f.result()]
+        for kind in [*MIX, "all"]:
+            ms = np.array([s for k, s in timings if kind in (k, "all")]) * 1000
+            if len(ms):
+                p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+                print(f"{clients:>7} {kind:>10} {len(ms):>9} {len(ms) / args.duration:>8.0f} "
+                      f"{p50:>7.2f} {p95:>7.2f} {p99:>7.2f}")
+        print()
+finally:
+    if service is not None:
+        service.terminate()
+        service.wait()
@@ -9,8 +9,15 @@ STREETVIEW_API_KEY = os.getenv("STREETVIEW_API_KEY")
 
 # Study Area
 STUDY_AREA         = "Menlo Park, California, USA"
+STUDY_BBOX         = (-122.2180, 37.4220, -122.1350, 37.5050)   # west, south, east, north — offline clip
+STUDY_POLYGON      = None           # optional boundary file (GeoJSON / GPKG) — overrides STUDY_BBOX
 MAP_CENTER         = [37.4530, -122.1817]
 MAP_ZOOM           = 14
+MAP_LOD            = [              # web map levels of detail — (from zoom, simplify tolerance m, coordinate decimals)
+    (0,  25, 4),                    #   region / city: ~11 m grid
+    (14,  4, 5),                    #   neighbourhood: ~1 m grid
+    (16,  0, 6),                    #   street: full OSM geometry, ~0.1 m grid
+]
 
 # Coordinate Systems
 CRS_GEOGRAPHIC     = "EPSG:4326"    # lat/lon for web maps
@@ -21,34 +28,102 @@ SV_PITCH           = -45            # degrees down toward road surface
 SV_FOV             = 90
 SV_SAMPLE_INTERVAL = 50             # meters between sample points
 
+# Street View Fetching — see scripts/sv_fetch.py
+# SV_API_BASE can be overridden (env) to point at a local stand-in server
+SV_API_BASE        = os.getenv("SV_API_BASE", "https://maps.googleapis.com/maps/api/streetview")
+SV_MAX_WORKERS     = 8              # concurrent HTTP requests in flight
+SV_RATE_LIMIT      = 25             # requests/sec across all workers (token bucket)
+SV_RATE_BURST      = 10             # requests that may be banked for short bursts
+SV_MAX_RETRIES     = 5              # retries on 429 / 5xx / connection errors
+SV_BACKOFF_BASE    = 0.5            # seconds — doubles every retry, full jitter
+SV_META_ROUND      = 5              # metadata cache key: lat/lon decimals (~1 m)
+SV_HEADING_BUCKET  = 30             # degrees — same panorama + bucket shares one image
+
+# Distress Scoring — see scripts/sv_scoring.py
+SV_DECODE_SCALE    = 1              # JPEG decode scale: 1 = full 640×480, 2/4/8 = reduced (changes scores)
+SV_SCORE_WORKERS   = os.cpu_count() # scoring processes
+SV_SCORE_BATCH     = 64             # images per worker task
+
+# Map Thumbnails — see scripts/thumbnails.py
+THUMB_WIDTH        = 400            # px — popup display width
+THUMB_QUALITY      = 70             # JPEG quality
+THUMB_WORKERS      = os.cpu_count() # thumbnail processes
+THUMB_BATCH        = 64             # images per worker task
+
 # Risk Score Weights — must sum to 1.0
 WEIGHT_SURFACE     = 0.35           # Street View pavement distress
 WEIGHT_BEHAVIOR    = 0.40           # OSM behavioral complexity
 WEIGHT_ACCIDENTS   = 0.25           # SWITRS historical accident data
 
-# Hotspot Analysis
+# Weight Sweep — 05_risk_scoring.py --sweep, see scripts/scoring_kernels.py
+SWEEP_RESOLUTION   = 50             # simplex lattice step 1/50 → 1,326 weight triples
+SWEEP_CHUNK        = 128            # triples evaluated per vectorized block
+
+# Accident Ingestion
+ACCIDENT_BBOX      = (-123.0, 37.0, -121.0, 38.5)   # west, south, east, north — valid crash coordinates
+ACCIDENT_YEARS     = None           # e.g. [2021, 2022, 2023] — None reads every year
+ACCIDENT_CHUNK_ROWS = 200_000       # rows per streamed CSV chunk
+ACCIDENT_RADII     = [15, 30, 50, 100]   # meters — 04 stores accident_count_r{r} / severity_score_r{r} for each
+ACCIDENT_RADIUS    = 30             # meters — radius 05 scores with (mirrored in accident_count)
+ACCIDENT_DECAY     = None           # meters — e.g. 25 weights each crash by exp(-distance / decay)
+
+# Spatial Joins — see scripts/road_index.py
+ROAD_INDEX_CELL    = 100            # meters — grid cell of the persisted road-segment index
+
+# Hotspot Analysis — see scripts/gistar.py
 SPATIAL_WEIGHT_THRESHOLD = 300      # meters — roughly 1 city block
+HOTSPOT_BANDS      = [100, 200, 300, 500, 750, 1000]   # meters — 06 --bands, ~2× a run at the widest alone
+HOTSPOT_WEIGHTS    = "euclidean"    # "euclidean" (centroid distance) or "network" (along the streets)
+NETWORK_WORKERS    = os.cpu_count() # bounded shortest-path processes for "network" weights
+GI_PERMUTATIONS    = 999            # conditional permutations — 9999 resolves p-values to 0.0001
+GI_WORKERS         = os.cpu_count() # permutation processes
+GI_SEED            = 12345          # root seed — each permutation block gets its own child seed
+GI_PERM_BLOCK      = 1000           # permutations per seeded task
+GI_SITE_BLOCK      = 4096           # sites per matrix product (GI_PERM_BLOCK × this × 8 bytes)
+GI_INCREMENTAL_MAX = 0.25           # 06 --incremental: above this share of affected segments, run in full
+
+# Risk Query Service — see scripts/risk_service.py
+SERVICE_HOST       = "127.0.0.1"
+SERVICE_PORT       = 8765
+SERVICE_POLL       = 2.0            # seconds between checks of ROADS_HOTSPOT for a new pipeline run
+SERVICE_MAX_RESULTS = 5000          # features per response — bbox / nearest / top are truncated here
+
+# Routing — see scripts/routing.py
+ROUTE_RISK_ALPHA   = 4.0            # arc cost = length × (1 + α · risk_score) — 0 routes by distance alone
+ROUTE_WITNESS_SETTLE = 60           # nodes a contraction witness search may settle before adding the shortcut
+ROUTE_BATCH_CELLS  = 2_000_000      # OD pairs × nodes per query batch (several arrays of × 8 bytes)
 
 # File Paths — raw data
 ROADS_RAW          = "data/raw/road_network/menlo_park_streets.gpkg"
+ROADS_NODES        = "data/raw/road_network/menlo_park_nodes.gpkg"
+SEGMENT_LOOKUP     = "data/raw/road_network/menlo_park_segments.csv"        # seg_id → u, v, key, osmid
+ROADS_INDEX        = "data/raw/road_network/menlo_park_streets.index.npz"   # keyed by geometry hash
+OSM_NODE_INDEX     = "flex_mem"     # pyosmium location index — "sparse_file_array,<path>" keeps it on disk
 OSM_COMPLEXITY_DIR = "data/raw/osm_complexity"
-ACCIDENTS_CSV      = "data/raw/supplemental/accidents.csv"
-SV_IMAGES_DIR      = "data/streetview_images"
+SV_IMAGES_DIR      = "data/streetview_images"          # legacy loose-file cache
+SV_IMAGE_PACK      = "data/streetview_images.pack"     # packed archive (+ .idx)
+SV_METADATA_CACHE  = "data/streetview_metadata.csv"
 
 # File Paths — processed data
 SAMPLE_POINTS      = "data/processed/sample_points.gpkg"
+ACCIDENTS_PARQUET  = "data/processed/accidents"        # partitioned by collision_year
 SV_DISTRESS_RAW    = "data/processed/streetview_distress_raw.csv"
+SV_SCORE_STORE     = "data/processed/streetview_scores.csv"     # checkpointed per-image scores
 SV_DISTRESS_SEG    = "data/processed/streetview_distress_by_segment.csv"
 OSM_COMPLEXITY_CSV = "data/processed/osm_complexity.csv"
 ROADS_FEATURES     = "data/processed/roads_with_features.gpkg"
 ROADS_RISK         = "data/processed/roads_risk_scored.gpkg"
+RISK_NORM_CACHE    = "data/processed/risk_norm.npy"    # 05's normalized matrix (+ .seg_id.npy, .json)
+SPATIAL_WEIGHTS    = "data/processed/spatial_weights.npz"   # 06's row-standardized weights, keyed by centroids + threshold
+NETWORK_WEIGHTS    = "data/processed/network_weights.npz"   # same, along the street network — keyed by graph + threshold
+GI_CACHE           = "data/processed/gi_cache.npz"          # 06's last Gi* inputs and results, for --incremental
+ROUTING_CH         = "data/processed/routing_ch.npz"        # contraction hierarchy, keyed by graph + ROUTE_RISK_ALPHA
 ROADS_HOTSPOT      = "data/processed/roads_hotspot_final.gpkg"
 
 # File Paths — outputs
 OUTPUT_MAP         = "outputs/maps/av_risk_index_map.html"
+OUTPUT_THUMBS      = "outputs/maps/thumbs"            # popup images, referenced by OUTPUT_MAP
 OUTPUT_CHARTS      = "outputs/charts/summary_charts.png"
+OUTPUT_SWEEP       = "outputs/reports/weight_sweep.csv"
+OUTPUT_ROUTES      = "outputs/reports/routes.csv"
 LOG_FILE           = "logs/pipeline.log"
-
-
-
-
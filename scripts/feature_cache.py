@@ -0,0 +1,123 @@
+# scripts/feature_cache.py
+# Re-scoring without the geometry round trip, for 05_risk_scoring.py.
+#
+#   RISK_NORM_CACHE           capped + normalized component matrix (n × 3, .npy,
+#                             memory-mapped on load)
+#   RISK_NORM_CACHE .seg_id   seg_id of each row (.npy)
+#   RISK_NORM_CACHE .json     feature hash, accident cap, scaler min / max, and
+#                             the feature hash ROADS_RISK was last written from
+#
+# The cache is valid while the hash of 05's input columns is unchanged, so a
+# weight or tier change re-scores from the mapped matrix and only the score
+# columns of ROADS_RISK are rewritten in place (update_gpkg_columns).
+
+import sys
+import os
+import json
+import sqlite3
+import hashlib
+import numpy as np
+import pandas as pd
+import shapely
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+
+def feature_hash(df, columns):
+    """128-bit BLAKE2b digest of `columns` of `df` — names, dtypes and values"""
+    h = hashlib.blake2b(digest_size=16)
+    for col in columns:
+        values = np.ascontiguousarray(df[col].to_numpy())
+        h.update(f"{col}:{values.dtype}:".encode())
+        h.update(values.tobytes())
+    return h.hexdigest()
+
+
+class NormCache:
+    """Memory-mappable normalized feature matrix keyed by feature hash"""
+
+    def __init__(self, path=RISK_NORM_CACHE):
+        base           = os.path.splitext(path)[0]
+        self.path      = path
+        self.seg_path  = base + ".seg_id.npy"
+        self.meta_path = base + ".json"
+        self.meta      = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                self.meta = json.load(f)
+
+    def load(self, digest):
+        """(norm memmap, seg_ids) if the cache was built from `digest`, else None"""
+        if self.meta.get("feature_hash") != digest:
+            return None
+        if not (os.path.exists(self.path) and os.path.exists(self.seg_path)):
+            return None
+        return np.load(self.path, mmap_mode="r"), np.load(self.seg_path)
+
+    def save(self, digest, seg_ids, norm, **params):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        np.save(self.path, np.ascontiguousarray(norm, dtype=np.float64))
+        np.save(self.seg_path, np.asarray(seg_ids))
+        self.meta = {"feature_hash": digest, **params}
+        self._write_meta()
+
+    def written(self, target):
+        """Feature hash `target` (a file path) was last fully written from"""
+        return self.meta.get("written", {}).get(target)
+
+    def mark_written(self, target):
+        self.meta.setdefault("written", {})[target] = self.meta.get("feature_hash")
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, self.meta_path)
+
+
+# GeoPackage header: magic, version, flags, srs_id — then an optional envelope
+GPKG_ENVELOPE_BYTES = (0, 32, 48, 48, 64)
+
+
+def _gpkg_bounds(blob, i):
+    flags = blob[3]
+    if flags & 0x10:
+        return None   # empty geometry
+    geom = shapely.from_wkb(bytes(blob[8 + GPKG_ENVELOPE_BYTES[(flags >> 1) & 7]:]))
+    return float(shapely.bounds(geom)[i])
+
+
+def _register_gpkg_functions(con):
+    """SQL functions GDAL's R-tree triggers call on every UPDATE. The geometry
+    isn't changed, so they only ever recompute the same bounding box."""
+    con.create_function("ST_IsEmpty", 1, lambda b: None if b is None else int(bool(b[3] & 0x10)))
+    for i, name in enumerate(["ST_MinX", "ST_MinY", "ST_MaxX", "ST_MaxY"]):
+        con.create_function(name, 1, lambda b, i=i: None if b is None else _gpkg_bounds(b, i))
+
+
+def update_gpkg_columns(path, key, keys, values):
+    """Overwrite attribute columns of a single-layer GeoPackage in place.
+
+    `values` maps column name → array aligned with `keys`, matched against
+    the layer's `key` column. Geometry and every other column are untouched.
+    """
+    con = sqlite3.connect(path)
+    _register_gpkg_functions(con)
+    try:
+        table = con.execute(
+            "SELECT table_name FROM gpkg_contents WHERE data_type = 'features'"
+        ).fetchone()[0]
+        fids = pd.read_sql_query(f'SELECT fid, "{key}" FROM "{table}"', con).set_index(key)["fid"]
+        fid  = fids.reindex(keys).to_numpy()
+        if pd.isna(fid).any():
+            raise KeyError(f"{int(pd.isna(fid).sum())} {key} values not in {path}")
+
+        columns = list(values)
+        sql  = (f'UPDATE "{table}" SET ' + ", ".join(f'"{c}" = ?' for c in columns)
+                + " WHERE fid = ?")
+        rows = zip(*(pd.Series(values[c]).tolist() for c in columns), fid.astype(int).tolist())
+        with con:
+            con.executemany(sql, rows)
+    finally:
+        con.close()
@@ -0,0 +1,295 @@
+# scripts/gistar.py
+# Getis-Ord Gi* with conditional permutation inference for 06_hotspot_analysis.py.
+#
+# Same statistic and inference as esda.G_Local(star=True, transform="r"):
+# self-weight = the row's largest neighbour weight, rows standardized, z from
+# the analytical moments, p_sim from conditional permutations with esda's
+# folded ("directed") pseudo p-value.
+#
+# The permutations run as matrix operations instead of a per-site loop:
+#   - every permutation p draws neighbour slots P[p] (ids in 0..n-2, without
+#     replacement), shared by all sites as in esda
+#   - slot m maps to site m, except at site i itself, where it maps to site
+#     n-1 — a bijection onto the other sites, so each site still samples
+#     only its neighbours' conditional null
+#   - permuted lags for a block of sites = z[P] @ padded weights.T (one BLAS
+#     call), plus a sparse correction for the few (p, i) with some P[p, j] == i
+#   - sites are sorted by cardinality and their weights kept as CSR rows; each
+#     block of GI_SITE_BLOCK sites is padded only when it is multiplied, to as
+#     many columns as its own densest site needs
+#
+# Permutations are split into GI_PERM_BLOCK-sized tasks, each seeded from its
+# own child of SeedSequence(GI_SEED) and run on a process pool — results are
+# identical for any number of workers. Each worker gets the weights once, in
+# its initializer, not with every task.
+#
+# gi_star_update() recomputes p_sim only around changed sites, reusing the
+# previous run's results (cached in GI_CACHE) everywhere else.
+#
+# gi_star_bands() runs several weight matrices (e.g. distance bands) against
+# the same permutation draws: slots and gathered values are generated once,
+# only the weighted sums and counts are per band. The weighted sums are most
+# of the work, so a run costs about the sum of its bands' neighbour counts.
+
+import sys
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+HOTSPOT_CLASSES = [
+    ("Hot Spot (99%)",   0.01,  1), ("Hot Spot (95%)",   0.05,  1), ("Hot Spot (90%)",   0.10,  1),
+    ("Cold Spot (99%)",  0.01, -1), ("Cold Spot (95%)",  0.05, -1), ("Cold Spot (90%)",  0.10, -1),
+]
+
+
+def star_weights(w):
+    """Gi* weights from a sparse (n × n) weight matrix — (other weights csr, self-weights).
+
+    As esda does for row-standardized input with no diagonal, each site's
+    self-weight is its largest neighbour weight; rows are then standardized.
+    """
+    w    = sp.csr_matrix(w, dtype=np.float64)
+    n    = w.shape[0]
+    rows = np.repeat(np.arange(n), np.diff(w.indptr))
+    keep = (w.indices != rows) & (w.data != 0)
+    # Filtered rather than setdiag(0), so each row keeps its neighbour order
+    indptr = np.r_[0, np.cumsum(np.bincount(rows[keep], minlength=n))]
+    w      = sp.csr_matrix((w.data[keep], w.indices[keep], indptr), shape=w.shape)
+    rows   = rows[keep]
+    # Row reductions by hand — scipy's would sort each row's indices in place
+    filled = np.diff(indptr) > 0
+    self_w = np.zeros(n)
+    self_w[filled] = np.maximum.reduceat(w.data, indptr[:-1][filled])
+    total  = np.bincount(rows, weights=w.data, minlength=n) + self_w
+    scale  = np.divide(1.0, total, out=np.zeros_like(total), where=total > 0)
+    w.data = w.data * scale[rows]
+    return w, self_w * scale
+
+
+def gi_zscores(y, others, self_w):
+    """Observed Gi* and its analytical z-score — esda's G_Local.Zs"""
+    n       = len(y)
+    G       = (others @ y + self_w * y) / y.sum()
+    card    = np.asarray(others.sum(axis=1)).ravel() + self_w
+    mean    = y.mean()
+    var     = (y * y).mean() - mean ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        VG  = card * (n - card) / (n - 1) / n ** 2 * (var / mean ** 2)
+        return (G - card / n) / np.sqrt(VG)
+
+
+def _sorted_rows(others, sites):
+    """`sites` sorted by neighbour count, and their weights in that order — (order, rank, card, data, indptr).
+
+    rank maps every site to its sorted position — len(sites) for sites not
+    included, whose cardinality (the extra last entry of card) is 0. data
+    and indptr are the CSR rows of the sorted sites; slot j of a site is its
+    j-th stored weight.
+    """
+    counts = np.diff(others.indptr)[sites]
+    order  = sites[np.argsort(counts, kind="stable")]
+    rank   = np.full(others.shape[0], len(sites))
+    rank[order] = np.arange(len(order))
+    rows   = others[order]
+    return order, rank, np.r_[np.diff(rows.indptr), 0], rows.data, rows.indptr
+
+
+def _pad_block(data, indptr, card, start, stop):
+    """Weights of sorted sites start..stop left-aligned in a (sites × densest card) array"""
+    counts = card[start:stop]
+    pad    = np.zeros((stop - start, counts.max(initial=0)))
+    first  = indptr[start:stop] - indptr[start]
+    col    = np.arange(indptr[stop] - indptr[start]) - np.repeat(first, counts)
+    pad[np.repeat(np.arange(stop - start), counts), col] = data[indptr[start]:indptr[stop]]
+    return pad
+
+
+# ---------------------------------------------------
+# Permutation engine (runs in each worker)
+# ---------------------------------------------------
+_engine = None
+
+
+def _init_worker(engine):
+    global _engine
+    _engine = engine
+
+
+def _count_larger(task):
+    """For one seeded block of permutations: per band and sorted site, how many permuted lags ≥ observed"""
+    seed, permutations = task
+    y, kmax, bands, site_block = _engine
+    n    = len(y)
+    rng  = np.random.default_rng(seed)
+    P    = np.empty((permutations, kmax), dtype=np.int64)
+    for p in range(permutations):
+        P[p] = rng.choice(n - 1, size=kmax, replace=False)
+    A    = y[P]                               # gathered once, shared by every band
+    fix  = y[n - 1] - A                       # slot value when it lands on the site itself
+
+    counts = []
+    for rank, card, data, indptr, observed in bands:
+        k_band = card.max()
+        # Sparse correction: slot j of permutation p points at site m itself —
+        # at that one site it means site n-1 instead, when m uses slot j at all
+        pos  = rank[P[:, :k_band]]
+        slot = np.broadcast_to(np.arange(k_band), pos.shape)
+        hit  = slot < card[pos]
+        fix_p, fix_pos = np.nonzero(hit)[0], pos[hit]
+        fix_val = data[indptr[fix_pos] + slot[hit]] * fix[:, :k_band][hit]
+        by_pos  = np.argsort(fix_pos, kind="stable")
+        fix_p, fix_pos, fix_val = fix_p[by_pos], fix_pos[by_pos], fix_val[by_pos]
+
+        n_sites = len(observed)
+        larger  = np.zeros(n_sites, dtype=np.int64)
+        for start in range(0, n_sites, site_block):
+            stop = min(start + site_block, n_sites)
+            pad  = _pad_block(data, indptr, card, start, stop)
+            lags = A[:, :pad.shape[1]] @ pad.T
+            lo, hi = np.searchsorted(fix_pos, [start, stop])
+            lags[fix_p[lo:hi], fix_pos[lo:hi] - start] += fix_val[lo:hi]
+            larger[start:stop] = (lags >= observed[start:stop]).sum(axis=0)
+        counts.append(larger)
+    return np.stack(counts)
+
+
+def gi_star_bands(y, weights, permutations=GI_PERMUTATIONS, workers=GI_WORKERS, seed=GI_SEED,
+                  perm_block=GI_PERM_BLOCK, site_block=GI_SITE_BLOCK, sites=None):
+    """Gi* of `y` under each weight matrix in `weights` — list of (z, p_sim), one per matrix.
+
+    Every matrix sees the same permutation draws: the random neighbour slots
+    and the gathered values are generated once per permutation block and
+    reused, only the weighted sums are per matrix.
+
+    With `sites` (positions), p_sim is only computed there — NaN elsewhere —
+    from the very draws a full run would use, so those values are identical
+    to a full run's. z is always computed for every site.
+    """
+    y     = np.asarray(y, dtype=np.float64)
+    stars = [star_weights(w) for w in weights]
+    zs    = [gi_zscores(y, others, self_w) for others, self_w in stars]
+    if not permutations:
+        return [(z, None) for z in zs]
+
+    sites = np.arange(len(y)) if sites is None else np.asarray(sites, dtype=np.int64)
+    kmax  = max(np.diff(others.indptr).max(initial=0) for others, _ in stars)
+    bands, orders = [], []
+    for others, _ in stars:
+        order, rank, card, data, indptr = _sorted_rows(others, sites)
+        # Permuted and observed lags are summed in different orders — count
+        # exact ties as ties despite last-bit rounding differences
+        observed = others[order] @ y - 1e-12 * np.abs(y).max()
+        bands.append((rank, card, data, indptr, observed))
+        orders.append(order)
+    engine = (y, kmax, bands, site_block)
+
+    sizes = [min(perm_block, permutations - s) for s in range(0, permutations, perm_block)]
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+    workers = max(1, min(workers or 1, len(tasks)))
+    if workers == 1:
+        _init_worker(engine)
+        larger = sum(map(_count_larger, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(engine,)) as pool:
+            larger = sum(pool.map(_count_larger, tasks))
+
+    # esda's folded p-value: the smaller tail, whichever side the observation is on
+    larger  = np.minimum(larger, permutations - larger)
+    results = []
+    for z, order, band_larger in zip(zs, orders, larger):
+        p_sim = np.full(len(y), np.nan)
+        p_sim[order] = (band_larger + 1.0) / (permutations + 1.0)
+        results.append((z, p_sim))
+    return results
+
+
+def gi_star(y, w, **kwargs):
+    """Gi* z-scores and permutation pseudo p-values of `y` under weights `w` — (z, p_sim).
+
+    `w` is any sparse (n × n) weight matrix (e.g. libpysal's W.sparse); its
+    diagonal is ignored and replaced by the Gi* self-weight. Keyword
+    arguments as for gi_star_bands.
+    """
+    return gi_star_bands(y, [w], **kwargs)[0]
+
+
+# ---------------------------------------------------
+# Incremental updates
+# ---------------------------------------------------
+def affected_sites(w, changed):
+    """Positions whose Gi* neighbourhood — the site itself or any neighbour — includes `changed`"""
+    changed = np.asarray(changed, dtype=np.int64)
+    hit     = np.zeros(w.shape[0], dtype=bool)
+    hit[changed] = True
+    hit[sp.csc_matrix(w)[:, changed].nonzero()[0]] = True
+    return np.flatnonzero(hit)
+
+
+def gi_star_update(y, w, p_sim, changed, **kwargs):
+    """Gi* after the values of `y` at positions `changed` moved — (z, p_sim, affected).
+
+    z is recomputed everywhere (it is analytical, and the global mean and
+    variance moved). p_sim is recomputed only at the affected sites, with
+    the same draws as a full run; elsewhere the lag and the observed
+    statistic are unchanged and the previous p_sim is kept. Only the few
+    permuted values drawn from the changed sites differ from a full
+    recompute there.
+    """
+    affected = affected_sites(w, changed)
+    z, fresh = gi_star(y, w, sites=affected, **kwargs)
+    p_sim    = np.array(p_sim, dtype=np.float64)
+    p_sim[affected] = fresh[affected]
+    return z, p_sim, affected
+
+
+def results_key(w, permutations=GI_PERMUTATIONS, seed=GI_SEED, perm_block=GI_PERM_BLOCK):
+    """128-bit BLAKE2b digest of a weight matrix and the permutation settings"""
+    w = sp.csr_matrix(w)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{w.shape}:{permutations}:{seed}:{perm_block}:".encode())
+    for values in (w.indptr, w.indices, w.data):
+        h.update(np.ascontiguousarray(values).tobytes())
+    return h.hexdigest()
+
+
+def save_results(path, key, seg_ids, y, z, p_sim):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, key=key, seg_id=seg_ids, y=y, z=z, p_sim=p_sim)
+    os.replace(tmp, path)
+
+
+def load_results(path, key):
+    """Cached {seg_id, y, z, p_sim} if saved under `key`, else None"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        if str(f["key"]) != key:
+            return None
+        return {name: f[name] for name in ("seg_id", "y", "z", "p_sim")}
+
+
+def most_significant_band(bands, zs, p_sims):
+    """Per site, the band with the smallest p_sim — ties to the largest |z|.
+
+    Bands where the site's z is undefined (no neighbours within the band)
+    are only picked if no band has one.
+    """
+    zs, p_sims = np.abs(np.asarray(zs)), np.asarray(p_sims, dtype=np.float64)
+    undefined  = np.isnan(zs)
+    zs     = np.where(undefined, -np.inf, zs)
+    p_sims = np.where(undefined, np.inf, p_sims)
+    best  = np.lexsort((-zs, p_sims), axis=0)[0]
+    return np.asarray(bands)[best]
+
+
+def hotspot_classes(z, p):
+    """Hot / cold spot label at the 99 / 95 / 90% level, else "Not Significant" """
+    z, p = np.asarray(z), np.asarray(p)
+    conditions = [(p <= alpha) & (np.sign(z) == sign) for _, alpha, sign in HOTSPOT_CLASSES]
+    return np.select(conditions, [label for label, _, _ in HOTSPOT_CLASSES], "Not Significant")
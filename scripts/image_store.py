@@ -0,0 +1,201 @@
+# scripts/image_store.py
+# Append-only packed Street View image archive.
+#
+#   SV_IMAGE_PACK          raw JPEG bytes, back to back
+#   SV_IMAGE_PACK + .idx   CSV index: seg_id, sample_num, heading →
+#                          offset, length, sv_date, pano_id, content_hash
+#
+# Reads are zero-copy memoryviews into a read-only mmap of the pack, so the
+# scorer and the map builder decode straight from the page cache without an
+# os.path.exists + open per image. Writes append the JPEG first and the index
+# row second; a crash in between leaves unreferenced bytes, never a dangling
+# index entry. Several keys may point at the same bytes (link()).
+#
+# Packs from before seg_id were keyed by osmid, which one way shares across
+# all the edges it was split into. Such an index is read as `legacy` (and
+# kept as .idx.osmid once the index is rewritten); adopt_legacy() carries an
+# image over only where its osmid key belongs to a single edge.
+
+import sys
+import os
+import csv
+import mmap
+import hashlib
+from collections import namedtuple
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+INDEX_COLUMNS = ["seg_id", "sample_num", "heading", "offset", "length", "sv_date", "pano_id", "content_hash"]
+
+Entry = namedtuple("Entry", ["offset", "length", "sv_date", "pano_id", "content_hash"])
+
+
+def content_hash(data):
+    """128-bit BLAKE2b hex digest of the JPEG bytes"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def image_key(seg_id, sample_num, heading):
+    """Normalized index key — heading matches the 0.1° rounding of 02a"""
+    return (int(seg_id), int(sample_num), round(float(heading), 1))
+
+
+def legacy_image_key(osmid, sample_num, heading):
+    """Index key of a pack written before seg_id, when images were keyed by osmid"""
+    return (str(osmid), int(sample_num), round(float(heading), 1))
+
+
+def ends_with_newline(path):
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class ImageStore:
+    """Packed JPEG archive with a (seg_id, sample_num, heading) offset index"""
+
+    def __init__(self, path=SV_IMAGE_PACK):
+        self.path       = path
+        self.index_path = path + ".idx"
+        self.index      = {}
+        self.legacy     = {}
+        self._pack      = None
+        self._idx       = None
+        self._map       = None
+        self._columns   = None
+        self._load_index()
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            self._columns = self._read_index(self.index_path)
+        if os.path.exists(self.index_path + ".osmid"):
+            self._read_index(self.index_path + ".osmid")
+
+    def _read_index(self, path):
+        """Load `path` into index, or into legacy if it is keyed by osmid. Returns its columns"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            if "seg_id" in reader.fieldnames:
+                target, key_of, id_column = self.index, image_key, "seg_id"
+            else:
+                target, key_of, id_column = self.legacy, legacy_image_key, "osmid"
+            for row in reader:
+                if None in row.values():
+                    continue   # torn final line from an interrupted write
+                try:
+                    key    = key_of(row[id_column], row["sample_num"], row["heading"])
+                    offset = int(row["offset"])
+                    length = int(row["length"])
+                except ValueError:
+                    continue
+                if offset + length <= size:
+                    target[key] = Entry(
+                        offset, length, row["sv_date"],
+                        row.get("pano_id") or "", row.get("content_hash") or ""
+                    )
+            return reader.fieldnames
+
+    # ---------------------------------------------------
+    # Reading
+    # ---------------------------------------------------
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def get(self, key):
+        """Zero-copy memoryview of the JPEG bytes for `key`"""
+        offset, length = self.index[key][:2]
+        if self._map is None or offset + length > len(self._map):
+            self._remap()
+        return memoryview(self._map)[offset:offset + length]
+
+    def sv_date(self, key):
+        return self.index[key].sv_date
+
+    def content_hash(self, key):
+        """Content hash for `key` — computed (and kept in memory) for entries
+        indexed before hashes were recorded; persisted on the next index rewrite"""
+        entry = self.index[key]
+        if not entry.content_hash:
+            entry = self.index[key] = entry._replace(content_hash=content_hash(self.get(key)))
+        return entry.content_hash
+
+    def _remap(self):
+        # The old map is left to the GC — callers may still hold views into it
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # ---------------------------------------------------
+    # Writing
+    # ---------------------------------------------------
+    def _open_for_append(self):
+        if self._pack is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if self._columns is not None and self._columns != INDEX_COLUMNS:
+                self._rewrite_index()
+            new_index  = not os.path.exists(self.index_path)
+            self._pack = open(self.path, "ab")
+            self._idx  = open(self.index_path, "a", newline="", encoding="utf-8")
+            self._csv  = csv.writer(self._idx)
+            if new_index:
+                self._csv.writerow(INDEX_COLUMNS)
+            elif not ends_with_newline(self.index_path):
+                self._idx.write("\r\n")   # close off a torn final row
+
+    def _rewrite_index(self):
+        """Upgrade an index written with an older column layout — an osmid-keyed one is kept as .idx.osmid"""
+        if "seg_id" not in self._columns:
+            os.replace(self.index_path, self.index_path + ".osmid")
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(INDEX_COLUMNS)
+            for key, entry in self.index.items():
+                writer.writerow([*key, *entry])
+        os.replace(tmp, self.index_path)
+        self._columns = INDEX_COLUMNS
+
+    def put(self, key, data, sv_date="unknown", pano_id=""):
+        """Append JPEG bytes under `key`. Returns the new index Entry for link()"""
+        self._open_for_append()
+        offset = self._pack.seek(0, os.SEEK_END)
+        self._pack.write(data)
+        self._pack.flush()
+        return self.link(key, Entry(offset, len(data), sv_date, pano_id, content_hash(data)))
+
+    def adopt_legacy(self, keys, legacy_keys):
+        """Link each key to the image of its legacy (osmid) key, where that legacy key
+        belongs to this key alone. Returns how many keys were linked"""
+        owners = {}
+        for key, old in zip(keys, legacy_keys):
+            owners.setdefault(old, set()).add(key)
+        adopted = 0
+        for old, new in owners.items():
+            if len(new) == 1 and old in self.legacy:
+                key = next(iter(new))
+                if key not in self.index:
+                    self.link(key, self.legacy[old])
+                    adopted += 1
+        return adopted
+
+    def link(self, key, entry):
+        """Index `key` against bytes already in the pack"""
+        self._open_for_append()
+        self._csv.writerow([*key, *entry])
+        self._idx.flush()
+        self.index[key] = entry
+        return entry
+
+    def close(self):
+        for handle in (self._pack, self._idx):
+            if handle is not None:
+                handle.close()
+        self._pack = self._idx = self._map = None
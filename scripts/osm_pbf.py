@@ -0,0 +1,174 @@
+# scripts/osm_pbf.py
+# Offline road-network ingestion from a local .osm.pbf extract (pyosmium).
+#
+# Produces the same edge / node tables that OSMnx's graph_to_gdfs gives
+# 01_download_road_network.py for network_type="drive":
+#   - drivable ways only (OSMnx "drive" filter, evaluated on exact tag values)
+#   - ways split into edges at every node shared with another way
+#   - two-way streets as two directed edges, one-ways in travel direction
+#   - edges kept only when both end nodes fall inside the clip area
+#
+# Memory stays bounded for county / state extracts: the file is streamed once,
+# node locations go to a pyosmium location index (OSM_NODE_INDEX — use a
+# sparse_file_array to keep it on disk), and only ways touching the clip
+# area's bounding box are held in memory.
+
+import sys
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import osmium
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+# OSMnx network_type="drive" exclusions
+EXCLUDED_HIGHWAY = {
+    "abandoned", "bridleway", "bus_guideway", "construction", "corridor",
+    "cycleway", "elevator", "escalator", "footway", "no", "path", "pedestrian",
+    "planned", "platform", "proposed", "raceway", "razed", "rest_area",
+    "service", "services", "steps", "track",
+}
+EXCLUDED_SERVICE = {"alley", "driveway", "emergency_access", "parking", "parking_aisle", "private"}
+ONEWAY_FORWARD   = {"yes", "true", "1"}
+ONEWAY_REVERSE   = {"-1", "reverse"}
+EDGE_TAGS        = ["highway", "lanes", "maxspeed", "name", "ref", "oneway", "junction", "bridge", "tunnel", "access", "width"]
+
+EARTH_RADIUS_M   = 6_371_009
+
+
+def is_drivable(tags):
+    """OSMnx 'drive' way filter"""
+    highway = tags.get("highway")
+    return (
+        highway is not None
+        and highway not in EXCLUDED_HIGHWAY
+        and tags.get("area") != "yes"
+        and tags.get("access") != "private"
+        and tags.get("motor_vehicle") != "no"
+        and tags.get("motorcar") != "no"
+        and tags.get("service") not in EXCLUDED_SERVICE
+    )
+
+
+class DriveWayCollector(osmium.SimpleHandler):
+    """Keeps drivable ways with at least one node inside `bounds`"""
+
+    def __init__(self, bounds):
+        super().__init__()
+        self.west, self.south, self.east, self.north = bounds
+        self.ways = []
+
+    def way(self, w):
+        if not is_drivable(w.tags):
+            return
+        ids, lon, lat = [], [], []
+        for n in w.nodes:
+            if not n.location.valid():
+                return   # node missing from the extract — drop the way
+            ids.append(n.ref)
+            lon.append(n.location.lon)
+            lat.append(n.location.lat)
+        lon = np.array(lon)
+        lat = np.array(lat)
+        inside = (lon >= self.west) & (lon <= self.east) & (lat >= self.south) & (lat <= self.north)
+        if len(ids) < 2 or not inside.any():
+            return
+        tags = {k: w.tags.get(k) for k in EDGE_TAGS if k in w.tags}
+        self.ways.append((w.id, tags, np.array(ids, dtype=np.int64), lon, lat))
+
+
+def great_circle_length(lon, lat):
+    """Sum of haversine distances along a vertex chain, in meters"""
+    lon, lat = np.radians(lon), np.radians(lat)
+    a = (np.sin(np.diff(lat) / 2) ** 2 +
+         np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2)
+    return float((2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))).sum())
+
+
+def read_drive_network(pbf_path, clip):
+    """Stream `pbf_path` and return (edges, nodes) GeoDataFrames clipped to `clip`.
+
+    `clip` is a (west, south, east, north) tuple or a shapely (Multi)Polygon in
+    geographic coordinates.
+    """
+    polygon = None if isinstance(clip, tuple) else clip
+    bounds  = clip if polygon is None else polygon.bounds
+
+    collector = DriveWayCollector(bounds)
+    collector.apply_file(
+        pbf_path, locations=True, idx=OSM_NODE_INDEX,
+        filters=[osmium.filter.KeyFilter("highway")]
+    )
+    ways = collector.ways
+    print(f"Drivable ways touching the clip area: {len(ways)}")
+
+    # -------------------------------------------------------
+    # Split points: way ends + nodes referenced more than once
+    # (intersections, and loops back onto the same way)
+    # -------------------------------------------------------
+    all_ids = np.concatenate([ids for _, _, ids, _, _ in ways]) if ways else np.array([], np.int64)
+    uniq, counts = np.unique(all_ids, return_counts=True)
+    shared = set(uniq[counts > 1].tolist())
+
+    coords = {}
+    rows   = []
+    piece  = 0
+    for way_id, tags, ids, lon, lat in ways:
+        cuts = [0] + [i for i in range(1, len(ids) - 1) if ids[i] in shared] + [len(ids) - 1]
+
+        oneway_tag = str(tags.get("oneway", "")).lower()
+        oneway     = oneway_tag in (ONEWAY_FORWARD | ONEWAY_REVERSE) or tags.get("junction") == "roundabout"
+        directions = [oneway_tag in ONEWAY_REVERSE] if oneway else [False, True]
+
+        for a, b in zip(cuts[:-1], cuts[1:]):
+            seg = slice(a, b + 1)
+            length = great_circle_length(lon[seg], lat[seg])
+            for node, x, y in zip(ids[[a, b]], lon[[a, b]], lat[[a, b]]):
+                coords[int(node)] = (x, y)
+            for reverse in directions:
+                order = slice(None, None, -1) if reverse else slice(None)
+                xs, ys = lon[seg][order], lat[seg][order]
+                u, v = (ids[b], ids[a]) if reverse else (ids[a], ids[b])
+                rows.append({
+                    "u": int(u), "v": int(v), "osmid": way_id, **tags,
+                    "oneway": oneway, "reversed": reverse, "length": length,
+                    "geometry": shapely.linestrings(np.column_stack([xs, ys])),
+                    "piece": piece,
+                })
+            piece += 1
+
+    edges = gpd.GeoDataFrame(rows, geometry="geometry", crs=CRS_GEOGRAPHIC)
+    if edges.empty:
+        raise ValueError(f"No drivable ways found in {pbf_path} within {bounds}")
+    nodes = pd.DataFrame(
+        [(node, x, y) for node, (x, y) in coords.items()], columns=["osmid", "x", "y"]
+    )
+
+    # -------------------------------------------------------
+    # Clip: keep nodes inside the area and edges between them
+    # -------------------------------------------------------
+    if polygon is None:
+        west, south, east, north = bounds
+        keep = (nodes.x >= west) & (nodes.x <= east) & (nodes.y >= south) & (nodes.y <= north)
+    else:
+        keep = shapely.contains_xy(polygon, nodes.x.to_numpy(), nodes.y.to_numpy())
+    nodes = nodes[keep]
+    inside = set(nodes["osmid"].tolist())
+    edges  = edges[edges["u"].isin(inside) & edges["v"].isin(inside)].reset_index(drop=True)
+
+    # Parallel edges between the same pair of nodes get increasing keys
+    edges.insert(2, "key", edges.groupby(["u", "v"]).cumcount())
+
+    # street_count = physical street segments meeting at each node
+    undirected = edges.drop_duplicates("piece")
+    edges = edges.drop(columns="piece")
+    ends  = pd.concat([undirected["u"], undirected["v"]])
+    nodes = nodes[nodes["osmid"].isin(ends)].copy()
+    nodes["street_count"] = nodes["osmid"].map(ends.value_counts()).astype(int)
+    nodes = gpd.GeoDataFrame(
+        nodes, geometry=gpd.points_from_xy(nodes.x, nodes.y), crs=CRS_GEOGRAPHIC
+    ).reset_index(drop=True)
+
+    return edges, nodes
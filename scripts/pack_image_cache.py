@@ -0,0 +1,66 @@
+# scripts/pack_image_cache.py
+# One-shot importer: moves the legacy loose-file cache
+# (SV_IMAGES_DIR/seg_{osmid}_s{n}.jpg) into the packed archive SV_IMAGE_PACK.
+#
+# Loose files carry no heading, so each one is matched to its sample point(s)
+# in SAMPLE_POINTS. Loose files were named by osmid, so one can only be
+# imported where it belongs to a single seg_id — the edges a way was split
+# into never had images of their own, and 02b fetches those fresh.
+# Safe to re-run — images already in the pack are skipped.
+
+import sys
+import os
+import re
+import geopandas as gpd
+from tqdm import tqdm
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+from scripts.image_store import ImageStore, image_key
+from scripts.segments import segment_osmids
+
+CACHE_NAME = re.compile(r"^seg_(.+)_s(\d+)\.jpg$")
+
+print("Loading sample points...")
+points = gpd.read_file(SAMPLE_POINTS, ignore_geometry=True)
+osmids = points["seg_id"].map(segment_osmids())
+
+keys_by_file, segs_by_file = {}, {}
+for seg_id, osmid, n, heading in zip(points["seg_id"], osmids, points["sample_num"], points["heading"]):
+    name = f"seg_{osmid}_s{n}.jpg"
+    keys_by_file.setdefault(name, []).append(image_key(seg_id, n, heading))
+    segs_by_file.setdefault(name, set()).add(seg_id)
+
+names = sorted(n for n in os.listdir(SV_IMAGES_DIR) if CACHE_NAME.match(n))
+print(f"Found {len(names)} loose images in {SV_IMAGES_DIR}")
+
+store     = ImageStore()
+imported  = 0
+skipped   = 0
+unmatched = 0
+shared    = 0
+
+for name in tqdm(names, desc="Packing"):
+    keys = keys_by_file.get(name)
+    if not keys:
+        unmatched += 1
+        continue
+    if len(segs_by_file[name]) > 1:
+        shared += 1
+        continue
+    todo = [key for key in keys if key not in store]
+    if not todo:
+        skipped += 1
+        continue
+
+    with open(os.path.join(SV_IMAGES_DIR, name), "rb") as f:
+        entry = store.put(todo[0], f.read())
+    for key in todo[1:]:
+        store.link(key, entry)
+    imported += 1
+
+store.close()
+
+print(f"\nImported {imported} images | {skipped} already packed | {unmatched} not in sample points"
+      f" | {shared} shared by several edges, left for 02b to fetch")
+print(f"Pack: {SV_IMAGE_PACK} ({os.path.getsize(SV_IMAGE_PACK) / 1e6:.1f} MB, {len(store)} index entries)")
+print(f"Once verified, {SV_IMAGES_DIR}/ can be deleted")
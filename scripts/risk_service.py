@@ -0,0 +1,313 @@
+# scripts/risk_service.py
+# Local HTTP query service over 06's output (ROADS_HOTSPOT).
+#
+#   python scripts/risk_service.py                      serve on SERVICE_HOST:SERVICE_PORT
+#   python scripts/risk_service.py --port 9000 --log    another port, log every request
+#
+# Endpoints — GeoJSON in WGS84; bbox, nearest and top answer a FeatureCollection:
+#   GET /segments?bbox=west,south,east,north            segments intersecting the box
+#   GET /nearest?lat=..&lon=..[&k=1][&max_m=..]         k nearest segments, with distance_m
+#   GET /top?n=10[&by=risk_score|gi_zscore][&tier=..]   highest-ranked segments
+#   GET /segment/<seg_id>                               one segment
+#   GET /health                                         segment count, bounds, data version
+#
+# The layer is loaded once into memory with two STRtrees (packed R-trees) —
+# lon/lat for boxes, projected metres for nearest — and every segment's
+# GeoJSON is encoded up front, so a query is an index lookup plus a string
+# join. Responses carry an ETag of the data version and URL, and a matching
+# If-None-Match is answered 304 without running the query.
+#
+# A watcher thread checks ROADS_HOTSPOT every SERVICE_POLL seconds. Once a
+# new file has stopped changing between two checks it is loaded next to the
+# old data and swapped in with one assignment: requests in flight finish on
+# the data they started with, and a file that fails to load leaves the
+# previous run serving.
+
+import sys
+import os
+import json
+import math
+import hashlib
+import argparse
+import threading
+import traceback
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+import numpy as np
+import geopandas as gpd
+import shapely
+from pyproj import Transformer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+# Served per segment, where the layer has them (06 --bands adds the last two)
+PROPERTIES = [
+    "seg_id", "name", "highway", "length", "risk_score", "risk_tier", "dominant_factor",
+    "avg_distress", "avg_complexity", "accident_count",
+    "gi_zscore", "gi_pvalue", "hotspot_class", "gi_best_band", "hotspot_class_best",
+]
+RANKINGS = ["risk_score", "gi_zscore"]     # /top?by=
+
+
+class BadRequest(ValueError):
+    """Invalid query parameters — answered 400"""
+
+
+class NotFound(LookupError):
+    """Unknown path or seg_id — answered 404"""
+
+
+def file_stat(path):
+    """(mtime ns, size) of `path`, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+# ---------------------------------------------------
+# In-memory layer
+# ---------------------------------------------------
+class RiskData:
+    """One pipeline run's segments, indexed and pre-encoded. Read-only once built"""
+
+    def __init__(self, path=ROADS_HOTSPOT):
+        self.stat    = file_stat(path)
+        self.version = hashlib.blake2b(repr(self.stat).encode(), digest_size=8).hexdigest()
+        roads = gpd.read_file(path)
+        roads = roads[~(roads.geometry.isna() | roads.geometry.is_empty)].reset_index(drop=True)
+        self.n = len(roads)
+
+        self.metres   = roads.to_crs(CRS_PROJECTED).geometry.values
+        lonlat        = roads.to_crs(CRS_GEOGRAPHIC).geometry.values
+        self.tree_m   = shapely.STRtree(self.metres)
+        self.tree_deg = shapely.STRtree(lonlat)
+        self.to_m     = Transformer.from_crs(CRS_GEOGRAPHIC, CRS_PROJECTED, always_xy=True)
+        self.bounds   = [round(float(b), 6) for b in shapely.total_bounds(lonlat)]
+
+        # GeoJSON fragments: properties without their braces, so a distance can be appended
+        cols = [c for c in PROPERTIES if c in roads.columns]
+        self.props = [json.dumps(p, separators=(",", ":"), ensure_ascii=False)[1:-1]
+                      for p in json.loads(roads[cols].to_json(orient="records"))]
+        self.geoms = shapely.to_geojson(shapely.transform(lonlat, lambda xy: np.round(xy, 6))).tolist()
+        self.ids   = [json.dumps(v) for v in roads["seg_id"].tolist()]
+        self.row   = {str(v): i for i, v in enumerate(roads["seg_id"].tolist())}
+
+        # Rankings, highest first, segments without a value left out
+        self.tier     = roads["risk_tier"].astype(str).to_numpy() if "risk_tier" in roads else None
+        self.rankings = {}
+        for col in RANKINGS:
+            if col in roads.columns:
+                values = roads[col].to_numpy(dtype=np.float64)
+                order  = np.argsort(-values, kind="stable")
+                self.rankings[col] = order[~np.isnan(values[order])]
+
+    def feature(self, i, extra=""):
+        return (f'{{"type":"Feature","id":{self.ids[i]},"properties":{{{self.props[i]}{extra}}},'
+                f'"geometry":{self.geoms[i]}}}')
+
+    def collection(self, rows, extras=None):
+        """FeatureCollection of `rows`, cut at SERVICE_MAX_RESULTS"""
+        rows      = list(rows)
+        truncated = len(rows) > SERVICE_MAX_RESULTS
+        rows      = rows[:SERVICE_MAX_RESULTS]
+        features  = ",".join(self.feature(i, extras[k] if extras else "") for k, i in enumerate(rows))
+        return (f'{{"type":"FeatureCollection","count":{len(rows)},'
+                f'"truncated":{"true" if truncated else "false"},"features":[{features}]}}')
+
+    # ---------------------------------------------------
+    # Queries — row positions
+    # ---------------------------------------------------
+    def in_bbox(self, west, south, east, north):
+        rows = self.tree_deg.query(shapely.box(west, south, east, north), predicate="intersects")
+        return np.sort(rows)
+
+    def nearest(self, lon, lat, k=1, max_m=None):
+        """(rows, distances in metres) of the `k` segments nearest the point, nearest first.
+
+        Searches a growing radius until it holds k segments — everything
+        closer than the k-th is then inside it.
+        """
+        point  = shapely.Point(*self.to_m.transform(lon, lat))
+        k      = min(k, self.n)
+        limit  = np.inf if max_m is None else float(max_m)
+        radius = min(100.0, limit)
+        while True:
+            rows = self.tree_m.query(point, predicate="dwithin", distance=radius)
+            if len(rows) >= k or radius >= limit or len(rows) == self.n:
+                break
+            radius = min(radius * 4, limit)
+        rows  = np.sort(rows)
+        dist  = shapely.distance(self.metres[rows], point)
+        keep  = np.argsort(dist, kind="stable")[:k]
+        return rows[keep], dist[keep]
+
+    def top(self, n, by="risk_score", tier=None):
+        order = self.rankings[by]
+        if tier is not None:
+            order = order[self.tier[order] == tier]
+        return order[:n]
+
+
+# ---------------------------------------------------
+# HTTP
+# ---------------------------------------------------
+_REQUIRED = object()
+
+
+def _param(query, name, cast=float, default=_REQUIRED):
+    if name not in query:
+        if default is _REQUIRED:
+            raise BadRequest(f"missing parameter '{name}'")
+        return default
+    try:
+        value = cast(query[name][0])
+    except ValueError:
+        raise BadRequest(f"invalid {name}: {query[name][0]!r}")
+    if cast is float and not math.isfinite(value):      # nan / inf would reach the index
+        raise BadRequest(f"invalid {name}: {query[name][0]!r}")
+    return value
+
+
+class RiskHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"          # keep-alive — every response has a Content-Length
+    server_version   = "RiskService/1.0"
+    disable_nagle_algorithm = True         # headers and body are separate writes — don't hold the body for an ACK
+
+    def do_GET(self):
+        data = self.server.data            # one run for the whole request, even across a reload
+        url  = urlsplit(self.path)
+        etag = '"' + hashlib.blake2b(f"{data.version}:{self.path}".encode(), digest_size=12).hexdigest() + '"'
+
+        match = [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]
+        if etag in match or "*" in match:
+            self._send(304, b"", etag)
+            return
+        try:
+            body, status = self.route(data, url.path, parse_qs(url.query)), 200
+        except BadRequest as e:
+            body, status, etag = json.dumps({"error": str(e)}), 400, None
+        except NotFound as e:
+            body, status, etag = json.dumps({"error": str(e)}), 404, None
+        except Exception:
+            # Answered rather than dropping the connection; the traceback goes to stderr
+            print(f"GET {self.path} failed:", file=sys.stderr)
+            traceback.print_exc()
+            body, status, etag = json.dumps({"error": "internal error"}), 500, None
+        self._send(status, body.encode("utf-8"), etag)
+
+    def route(self, data, path, query):
+        if path == "/segments":
+            try:
+                west, south, east, north = (float(v) for v in _param(query, "bbox", str).split(","))
+            except ValueError:
+                raise BadRequest("bbox must be west,south,east,north")
+            if not all(map(math.isfinite, (west, south, east, north))):
+                raise BadRequest("bbox must be finite")
+            return data.collection(data.in_bbox(west, south, east, north))
+
+        if path == "/nearest":
+            k = _param(query, "k", int, 1)
+            if k < 1:
+                raise BadRequest("k must be at least 1")
+            max_m = _param(query, "max_m", float, None)
+            if max_m is not None and max_m < 0:
+                raise BadRequest("max_m must not be negative")
+            rows, dist = data.nearest(_param(query, "lon"), _param(query, "lat"), k, max_m)
+            return data.collection(rows, [f',"distance_m":{d:.2f}' for d in dist])
+
+        if path == "/top":
+            by = _param(query, "by", str, "risk_score")
+            if by not in data.rankings:
+                raise BadRequest(f"by must be one of {sorted(data.rankings)}")
+            tier = _param(query, "tier", str, None)
+            if tier is not None and data.tier is None:
+                raise BadRequest("this layer has no risk_tier")
+            return data.collection(data.top(max(0, _param(query, "n", int, 10)), by, tier))
+
+        if path.startswith("/segment/"):
+            seg_id = unquote(path[len("/segment/"):])
+            if seg_id not in data.row:
+                raise NotFound(f"no segment {seg_id!r}")
+            return data.feature(data.row[seg_id])
+
+        if path == "/health":
+            return json.dumps({"segments": data.n, "bounds": data.bounds, "version": data.version})
+
+        raise NotFound(f"no endpoint {path!r}")
+
+    def _send(self, status, body, etag):
+        self.send_response(status)
+        if status != 304:
+            self.send_header("Content-Type", "application/geo+json" if status == 200 else "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")     # revalidate — a reload changes every ETag
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.log:
+            super().log_message(format, *args)
+
+
+class RiskService(ThreadingHTTPServer):
+    """Threaded HTTP server over a RiskData that follows new pipeline runs"""
+
+    daemon_threads = True
+
+    def __init__(self, address, path=ROADS_HOTSPOT, poll=SERVICE_POLL, log=False):
+        self.path  = path
+        self.log   = log
+        self.data  = RiskData(path)
+        self._stop = threading.Event()
+        super().__init__(address, RiskHandler)
+        if poll:
+            threading.Thread(target=self._watch, args=(poll,), daemon=True).start()
+
+    def _watch(self, poll):
+        seen, failed = self.data.stat, None
+        while not self._stop.wait(poll):
+            stat = file_stat(self.path)
+            if stat is None or stat == self.data.stat or stat == failed:
+                seen = stat
+                continue
+            if stat != seen:                # changed since the last check — may still be mid-write
+                seen = stat
+                continue
+            try:
+                data = RiskData(self.path)
+            except Exception as e:
+                failed = stat
+                print(f"Reload of {self.path} failed ({e}) — still serving version {self.data.version}")
+                continue
+            self.data = data
+            print(f"Reloaded {data.n} segments from {self.path} (version {data.version})")
+
+    def server_close(self):
+        self._stop.set()
+        super().server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve risk queries over the hotspot layer")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--log", action="store_true", help="log every request to stderr")
+    args = parser.parse_args()
+
+    server = RiskService((args.host, args.port), log=args.log)
+    print(f"Serving {server.data.n} segments from {ROADS_HOTSPOT} on http://{args.host}:{args.port}"
+          f" (version {server.data.version})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
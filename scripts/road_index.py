@@ -0,0 +1,173 @@
+# scripts/road_index.py
+# Persistent spatial index of road segments for 04_spatial_join.py.
+#
+# A uniform grid (ROAD_INDEX_CELL metres) over the projected network, stored
+# in CSR form: for every occupied cell, the segments whose bounding box
+# touches it. The index is saved to ROADS_INDEX together with a hash of the
+# segment geometries, so it is built once per network and reused by every
+# join until 01 writes a different network.
+#
+# nearest() is a bulk query: all candidate (point, segment) pairs come from
+# array lookups, exact distances from one vectorized shapely.distance call.
+# Like gpd.sjoin_nearest, a point equidistant from several segments (e.g. the
+# two directed edges of a two-way street) is matched to all of them.
+
+import sys
+import os
+import hashlib
+import numpy as np
+import shapely
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+
+def geometry_hash(geoms):
+    """128-bit BLAKE2b digest of the segment geometries, in order"""
+    h = hashlib.blake2b(digest_size=16)
+    for wkb in shapely.to_wkb(np.asarray(geoms)):
+        h.update(wkb)
+    return h.hexdigest()
+
+
+class RoadIndex:
+    """Grid index over projected road geometries — row positions, not labels"""
+
+    def __init__(self, geoms, cell=ROAD_INDEX_CELL, digest=None, arrays=None):
+        self.geoms  = np.asarray(geoms)
+        self.cell   = float(cell)
+        self.digest = digest or geometry_hash(self.geoms)
+        self.bounds = shapely.bounds(self.geoms)
+        self.mid    = shapely.get_coordinates(
+            shapely.line_interpolate_point(self.geoms, 0.5, normalized=True))
+        if arrays is None:
+            arrays = self._build()
+        self.origin, self.ncols, self.cells, self.indptr, self.segments = arrays
+
+    @classmethod
+    def open(cls, geoms, path=ROADS_INDEX, cell=ROAD_INDEX_CELL):
+        """Load the index saved at `path` if it matches `geoms`, else build and save it"""
+        geoms  = np.asarray(geoms)
+        digest = geometry_hash(geoms)
+        if os.path.exists(path):
+            with np.load(path) as f:
+                if str(f["digest"]) == digest and float(f["cell"]) == float(cell):
+                    print(f"Road index: reusing {path}")
+                    arrays = (f["origin"], int(f["ncols"]), f["cells"], f["indptr"], f["segments"])
+                    return cls(geoms, cell, digest, arrays)
+        index = cls(geoms, cell, digest)
+        index.save(path)
+        print(f"Road index: built for {len(geoms)} segments, saved to {path}")
+        return index
+
+    # ---------------------------------------------------
+    # Build / persist
+    # ---------------------------------------------------
+    def _build(self):
+        bounds = self.bounds
+        origin = bounds[:, :2].min(axis=0)
+        ix0, iy0 = self._cell_xy(bounds[:, 0], bounds[:, 1], origin)
+        ix1, iy1 = self._cell_xy(bounds[:, 2], bounds[:, 3], origin)
+        ncols = int(ix1.max()) + 1
+
+        # One (cell, segment) pair per grid cell under each segment's bbox
+        w, h   = ix1 - ix0 + 1, iy1 - iy0 + 1
+        seg    = np.repeat(np.arange(len(self.geoms)), w * h)
+        start  = np.repeat(np.cumsum(w * h) - w * h, w * h)
+        local  = np.arange(len(seg)) - start
+        cx     = ix0[seg] + local % w[seg]
+        cy     = iy0[seg] + local // w[seg]
+        cell   = cy * ncols + cx
+
+        order  = np.argsort(cell, kind="stable")
+        cells, counts = np.unique(cell[order], return_counts=True)
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        return origin, ncols, cells, indptr, seg[order]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, digest=self.digest, cell=self.cell, origin=self.origin,
+                 ncols=self.ncols, cells=self.cells, indptr=self.indptr, segments=self.segments)
+        os.replace(tmp, path)
+
+    def _cell_xy(self, x, y, origin=None):
+        origin = self.origin if origin is None else origin
+        return (np.floor((x - origin[0]) / self.cell).astype(np.int64),
+                np.floor((y - origin[1]) / self.cell).astype(np.int64))
+
+    # ---------------------------------------------------
+    # Query
+    # ---------------------------------------------------
+    def candidates(self, x, y, radius):
+        """(point, segment) pairs whose grid cells lie within `radius` of each point"""
+        ix0, iy0 = self._cell_xy(x - radius, y - radius)
+        ix1, iy1 = self._cell_xy(x + radius, y + radius)
+        ix0, iy0 = np.maximum(ix0, 0), np.maximum(iy0, 0)
+        ix1 = np.minimum(ix1, self.ncols - 1)
+        w, h = np.maximum(ix1 - ix0 + 1, 0), np.maximum(iy1 - iy0 + 1, 0)
+
+        pt    = np.repeat(np.arange(len(x)), w * h)
+        start = np.repeat(np.cumsum(w * h) - w * h, w * h)
+        local = np.arange(len(pt)) - start
+        cell  = (iy0[pt] + local // w[pt]) * self.ncols + ix0[pt] + local % w[pt]
+
+        # Occupied cells only, then expand each to its CSR segment range
+        pos  = np.searchsorted(self.cells, cell)
+        hit  = (pos < len(self.cells)) & (self.cells[np.minimum(pos, len(self.cells) - 1)] == cell)
+        pt, pos, cell = pt[hit], pos[hit], cell[hit]
+        lo, n   = self.indptr[pos], self.indptr[pos + 1] - self.indptr[pos]
+        pt      = np.repeat(pt, n)
+        cell    = np.repeat(cell, n)
+        offset  = np.arange(len(pt)) - np.repeat(np.cumsum(n) - n, n)
+        seg     = self.segments[np.repeat(lo, n) + offset]
+
+        # A segment spanning several cells shows up once per shared cell — keep
+        # only the pair from the lowest cell common to the point's query window
+        # and the segment's bbox (no sort needed, order stays grouped by point)
+        sx, sy = self._cell_xy(self.bounds[seg, 0], self.bounds[seg, 1])
+        first  = ((cell % self.ncols == np.maximum(sx, ix0[pt])) &
+                  (cell // self.ncols == np.maximum(sy, iy0[pt])))
+        return pt[first], seg[first]
+
+    def nearest(self, points, max_distance):
+        """Nearest segment(s) within `max_distance` of each point (projected, same CRS).
+
+        Returns (point positions, segment positions, distances), sorted by point;
+        points with no segment in range are absent, ties all returned.
+        """
+        points = np.asarray(points)
+        x, y   = shapely.get_x(points), shapely.get_y(points)
+        valid  = ~(np.isnan(x) | np.isnan(y))
+        pt, seg = self.candidates(np.where(valid, x, 0), np.where(valid, y, 0), max_distance)
+        keep    = valid[pt]
+        pt, seg = pt[keep], seg[keep]
+        if len(pt) == 0:
+            return pt, seg, np.empty(0)
+
+        # Cheap bounds before the exact test: the bbox distance can only
+        # under-estimate, the distance to a segment's midpoint can only
+        # over-estimate — a candidate whose lower bound exceeds the point's
+        # best upper bound can't be nearest. Small slack for rounding.
+        b  = self.bounds[seg]
+        dx = np.maximum(np.maximum(b[:, 0] - x[pt], x[pt] - b[:, 2]), 0)
+        dy = np.maximum(np.maximum(b[:, 1] - y[pt], y[pt] - b[:, 3]), 0)
+        lower = np.hypot(dx, dy)
+        upper = np.hypot(self.mid[seg, 0] - x[pt], self.mid[seg, 1] - y[pt])
+        bound = np.minimum(_group_min(pt, upper), max_distance) + 1e-6
+        keep  = lower <= bound
+        pt, seg = pt[keep], seg[keep]
+
+        dist = shapely.distance(points[pt], self.geoms[seg])
+        keep = dist <= max_distance
+        pt, seg, dist = pt[keep], seg[keep], dist[keep]
+        if len(pt) == 0:
+            return pt, seg, dist
+
+        keep = dist == _group_min(pt, dist)
+        return pt[keep], seg[keep], dist[keep]
+
+
+def _group_min(groups, values):
+    """Minimum of `values` within each run of equal `groups`, broadcast back per element"""
+    first = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    return np.repeat(np.minimum.reduceat(values, first), np.diff(np.r_[first, len(groups)]))
@@ -0,0 +1,392 @@
+# scripts/routing.py
+# Risk-aware routing over the scored network (ROADS_HOTSPOT).
+#
+#   python scripts/routing.py --od od_pairs.csv     route every origin_lon, origin_lat, dest_lon,
+#                                                   dest_lat row → OUTPUT_ROUTES
+#   python scripts/routing.py --bench 5000          random OD pairs: timings, and costs checked
+#                                                   against plain Dijkstra
+#   python scripts/routing.py --alpha 0 ...         override ROUTE_RISK_ALPHA (0 = shortest path)
+#
+# Each directed segment u → v is an arc costing length × (1 + α · risk_score),
+# so α trades metres driven against risk exposure. The graph is a CSR over
+# 01's nodes (ROADS_NODES gives their positions); parallel segments keep the
+# cheaper one, and a two-way segment stored in one direction only gets its
+# reverse.
+#
+# Queries run on a contraction hierarchy: nodes are contracted least
+# important first, adding a shortcut wherever the only shortest path ran
+# through the contracted node, after which every shortest path climbs and
+# then descends in node rank. A query is two small upward searches — a few
+# hundred nodes rather than the whole city — met in the middle; a batch of
+# OD pairs runs them as scipy Dijkstra calls over the upward graphs, once per
+# distinct origin and destination, and meets every pair in one array op. The
+# hierarchy is saved to ROUTING_CH keyed by the graph and α, so it is built
+# once per network and weighting.
+#
+# Route risk: length, exposure (Σ length × risk_score over its segments),
+# mean risk (exposure / length) and, with paths, the riskiest segment.
+# route_risk() scores a planned route the same way.
+
+import sys
+import os
+import time
+import heapq
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+from pyproj import Transformer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+INF = float("inf")
+
+
+def _two_way(values):
+    return ~pd.Series(values).astype(str).str.lower().isin(["true", "yes", "1", "-1"]).to_numpy()
+
+
+class RoadGraph:
+    """Directed road graph in CSR form — nodes and segments are row positions"""
+
+    def __init__(self, roads, alpha=ROUTE_RISK_ALPHA, nodes=None):
+        """`roads` as 06 writes them (projected), `nodes` as 01 writes them, or None"""
+        self.alpha  = float(alpha)
+        self.seg_id = roads["seg_id"].to_numpy()
+        self.length = roads["length"].to_numpy(dtype=np.float64)
+        self.risk   = roads["risk_score"].fillna(0).to_numpy(dtype=np.float64)
+        u, v = roads["u"].to_numpy(np.int64), roads["v"].to_numpy(np.int64)
+        self.node_ids, ends = np.unique(np.concatenate([u, v]), return_inverse=True)
+        self.n = len(self.node_ids)
+        tail, head = ends[:len(u)], ends[len(u):]
+
+        # Node positions: 01's nodes where known, else segment end points
+        geoms   = roads.geometry.values
+        self.xy = np.empty((self.n, 2))
+        self.xy[head] = shapely.get_coordinates(shapely.get_point(geoms, -1))
+        self.xy[tail] = shapely.get_coordinates(shapely.get_point(geoms, 0))
+        if nodes is not None and len(nodes):
+            nodes = nodes.to_crs(roads.crs)
+            pos   = np.searchsorted(self.node_ids, nodes["osmid"].to_numpy(np.int64))
+            known = (pos < self.n) & (self.node_ids[np.minimum(pos, self.n - 1)] == nodes["osmid"].to_numpy(np.int64))
+            self.xy[pos[known]] = shapely.get_coordinates(nodes.geometry.values)[known]
+
+        # Arcs: every segment, plus the reverse of two-way segments stored one way only
+        seg   = np.arange(len(u))
+        have  = set(zip(tail.tolist(), head.tolist()))
+        back  = seg[_two_way(roads["oneway"]) if "oneway" in roads else np.zeros(len(u), bool)]
+        back  = back[[(h, t) not in have for t, h in zip(tail[back].tolist(), head[back].tolist())]]
+        tail, head, seg = np.r_[tail, head[back]], np.r_[head, tail[back]], np.r_[seg, back]
+        cost  = self.length[seg] * (1 + self.alpha * self.risk[seg])
+
+        # Cheapest of parallel arcs, no self-loops, sorted by tail
+        order = np.lexsort((cost, head, tail))
+        order = order[tail[order] != head[order]]
+        first = np.r_[True, (tail[order][1:] != tail[order][:-1]) | (head[order][1:] != head[order][:-1])]
+        order = order[first]
+        self.indptr = np.searchsorted(tail[order], np.arange(self.n + 1)).astype(np.int64)
+        self.heads  = head[order].astype(np.int64)
+        self.costs  = cost[order]
+        self.segs   = seg[order]
+
+    def key(self):
+        """128-bit BLAKE2b digest of α and the arcs — the hierarchy's cache key"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"ch:{self.alpha!r}".encode())
+        for values in (self.indptr, self.heads, self.costs, self.segs):
+            h.update(np.ascontiguousarray(values).tobytes())
+        return h.hexdigest()
+
+    def nearest_nodes(self, lon, lat):
+        """(node rows, snap distances in metres) nearest the given WGS84 points"""
+        to_m = Transformer.from_crs(CRS_GEOGRAPHIC, CRS_PROJECTED, always_xy=True)
+        x, y = to_m.transform(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+        dist, rows = cKDTree(self.xy).query(np.c_[x, y])
+        return rows, dist
+
+    def route_risk(self, seg_ids):
+        """length, exposure, mean and max risk of a planned route given as seg_ids"""
+        rows = pd.Index(self.seg_id).get_indexer(np.asarray(seg_ids))
+        if (rows < 0).any():
+            raise KeyError(f"unknown seg_id {np.asarray(seg_ids)[rows < 0][0]}")
+        length, exposure = self.length[rows].sum(), (self.length[rows] * self.risk[rows]).sum()
+        return {"length_m": length, "exposure": exposure,
+                "mean_risk": exposure / length if length > 0 else np.nan,
+                "max_risk": self.risk[rows].max() if len(rows) else np.nan}
+
+
+# ---------------------------------------------------
+# Contraction hierarchy
+# ---------------------------------------------------
+def _witness(out, source, skip, limit, settle):
+    """Tentative distances from `source` avoiding `skip`, searched to cost `limit` or `settle` nodes"""
+    dist, heap, settled = {source: 0.0}, [(0.0, source)], 0
+    while heap and settled < settle:
+        d, x = heapq.heappop(heap)
+        if d > dist[x]:
+            continue
+        if d > limit:
+            break
+        settled += 1
+        for y, c in out[x].items():
+            if y != skip and d + c < dist.get(y, INF):
+                dist[y] = d + c
+                heapq.heappush(heap, (d + c, y))
+    return dist
+
+
+def _shortcuts(v, out, inc, settle):
+    """(u, w, cost) shortcuts contracting `v` needs — pairs with no witness path as cheap"""
+    needed = []
+    for u, cu in inc[v].items():
+        targets = {w: cu + cw for w, cw in out[v].items() if w != u}
+        if targets:
+            dist = _witness(out, u, v, max(targets.values()), settle)
+            needed.extend((u, w, c) for w, c in targets.items() if dist.get(w, INF) > c)
+    return needed
+
+
+def contract(graph, settle=ROUTE_WITNESS_SETTLE):
+    """Contraction hierarchy of `graph` — dict of arrays (see Router)"""
+    n   = graph.n
+    out = [{} for _ in range(n)]
+    inc = [{} for _ in range(n)]
+    # (a, b) → [cost, length, exposure, via node or -1, segment row or -1]
+    arcs = {}
+    seg_length = graph.length[graph.segs]
+    seg_expo   = seg_length * graph.risk[graph.segs]
+    for a in range(n):
+        for k in range(graph.indptr[a], graph.indptr[a + 1]):
+            b, c = int(graph.heads[k]), float(graph.costs[k])
+            out[a][b] = inc[b][a] = c
+            arcs[(a, b)] = [c, float(seg_length[k]), float(seg_expo[k]), -1, int(graph.segs[k])]
+
+    # Lazy edge-difference ordering, plus contracted neighbours to spread contraction evenly
+    deleted = [0] * n
+    def priority(v, shortcuts):
+        return len(shortcuts) - len(inc[v]) - len(out[v]) + deleted[v]
+
+    heap = [(priority(v, _shortcuts(v, out, inc, settle)), v) for v in range(n)]
+    heapq.heapify(heap)
+    rank = np.full(n, -1, dtype=np.int64)
+    done = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        if rank[v] >= 0:
+            continue
+        shortcuts = _shortcuts(v, out, inc, settle)
+        p = priority(v, shortcuts)
+        if heap and p > heap[0][0]:
+            heapq.heappush(heap, (p, v))
+            continue
+        for u, w, c in shortcuts:
+            if c < out[u].get(w, INF):
+                out[u][w] = inc[w][u] = c
+                first, second = arcs[(u, v)], arcs[(v, w)]
+                arcs[(u, w)] = [c, first[1] + second[1], first[2] + second[2], v, -1]
+        # v's remaining arcs all lead up the hierarchy and stay as its upward graph
+        for u in inc[v]:
+            del out[u][v]
+            deleted[u] += 1
+        for w in out[v]:
+            del inc[w][v]
+            deleted[w] += 1
+        rank[v] = done
+        done += 1
+
+    def csr(adjacency):
+        indptr = np.r_[0, np.cumsum([len(a) for a in adjacency])].astype(np.int64)
+        heads  = np.fromiter((h for a in adjacency for h in a), dtype=np.int64, count=indptr[-1])
+        costs  = np.fromiter((c for a in adjacency for c in a.values()), dtype=np.float64, count=indptr[-1])
+        return indptr, heads, costs
+
+    keys  = np.fromiter((a * n + b for a, b in arcs), dtype=np.int64, count=len(arcs))
+    table = np.array(list(arcs.values()), dtype=np.float64).reshape(-1, 5)
+    order = np.argsort(keys)
+    up_indptr, up_heads, up_costs = csr(out)
+    down_indptr, down_heads, down_costs = csr(inc)
+    return {
+        "rank": rank,
+        "up_indptr": up_indptr, "up_heads": up_heads, "up_costs": up_costs,
+        "down_indptr": down_indptr, "down_heads": down_heads, "down_costs": down_costs,
+        "arc_keys": keys[order], "arc_length": table[order, 1], "arc_exposure": table[order, 2],
+        "arc_via": table[order, 3].astype(np.int64), "arc_seg": table[order, 4].astype(np.int64),
+    }
+
+
+def open_hierarchy(graph, path=ROUTING_CH):
+    """The hierarchy saved at `path` if it was built for `graph`, else build and save it"""
+    key = graph.key()
+    if os.path.exists(path):
+        with np.load(path) as f:
+            if str(f["key"]) == key:
+                print(f"Contraction hierarchy: reusing {path}")
+                return {name: f[name] for name in f.files if name != "key"}
+    t0 = time.perf_counter()
+    ch = contract(graph)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, key=key, **ch)
+    os.replace(tmp, path)
+    shortcuts = int((ch["arc_via"] >= 0).sum())
+    print(f"Contraction hierarchy: {graph.n} nodes, {shortcuts} shortcuts, built in "
+          f"{time.perf_counter() - t0:.1f}s, saved to {path}")
+    return ch
+
+
+# ---------------------------------------------------
+# Queries
+# ---------------------------------------------------
+class Router:
+    """Batched risk-weighted shortest paths over a RoadGraph's contraction hierarchy"""
+
+    def __init__(self, graph, ch):
+        n = graph.n
+        self.graph   = graph
+        self.up      = csr_matrix((ch["up_costs"], ch["up_heads"], ch["up_indptr"]), shape=(n, n))
+        self.down    = csr_matrix((ch["down_costs"], ch["down_heads"], ch["down_indptr"]), shape=(n, n))
+        self.arc_key = ch["arc_keys"].tolist()                 # tail × n + head
+        self.arc     = {key: k for k, key in enumerate(self.arc_key)}
+        self.arc_length, self.arc_exposure = ch["arc_length"].tolist(), ch["arc_exposure"].tolist()
+        self.arc_via, self.arc_seg = ch["arc_via"].tolist(), ch["arc_seg"].tolist()
+
+    @classmethod
+    def open(cls, graph, path=ROUTING_CH):
+        return cls(graph, open_hierarchy(graph, path))
+
+    def _arcs(self, meet, up_parent, down_parent):
+        """Hierarchy arc indices of the path through `meet`, in driving order"""
+        n, climb, x = self.graph.n, [], meet
+        while up_parent[x] >= 0:
+            climb.append(self.arc[int(up_parent[x]) * n + x])
+            x = int(up_parent[x])
+        path, x = climb[::-1], meet
+        while down_parent[x] >= 0:
+            path.append(self.arc[x * n + int(down_parent[x])])
+            x = int(down_parent[x])
+        return path
+
+    def _unpack(self, arcs):
+        """Segment rows along hierarchy arcs — shortcuts expanded through their via nodes"""
+        n, rows, stack = self.graph.n, [], list(reversed(arcs))
+        while stack:
+            k = stack.pop()
+            via = self.arc_via[k]
+            if via < 0:
+                rows.append(self.arc_seg[k])
+                continue
+            a, b = divmod(self.arc_key[k], n)
+            stack.append(self.arc[via * n + b])
+            stack.append(self.arc[a * n + via])
+        return rows
+
+    def routes(self, origins, destinations, paths=False, cells=ROUTE_BATCH_CELLS):
+        """Cheapest route for each (origin, destination) node row pair — DataFrame.
+
+        Columns cost, length_m, exposure, mean_risk; with `paths` also
+        seg_ids (list, in driving order) and max_risk. Unreachable pairs get
+        NaN and an empty path.
+
+        Pairs go in batches of `cells` / nodes. Each batch runs one upward
+        search per distinct origin and one downward search per distinct
+        destination (scipy's Dijkstra over the hierarchy's upward graphs),
+        and a pair's route meets at the node minimising the two costs.
+        """
+        origins, destinations = np.asarray(origins), np.asarray(destinations)
+        batch = max(1, cells // self.graph.n)
+        rows  = []
+        for start in range(0, len(origins), batch):
+            o, d = origins[start:start + batch], destinations[start:start + batch]
+            uo, oi = np.unique(o, return_inverse=True)
+            ud, di = np.unique(d, return_inverse=True)
+            fwd, fparent = dijkstra(self.up, indices=uo, return_predecessors=True)
+            bwd, bparent = dijkstra(self.down, indices=ud, return_predecessors=True)
+            total = fwd[oi] + bwd[di]
+            meets = total.argmin(axis=1)
+            costs = total[np.arange(len(o)), meets]
+
+            for i, (s, t, meet, cost) in enumerate(zip(o.tolist(), d.tolist(), meets.tolist(), costs.tolist())):
+                row = {"origin": s, "destination": t, "cost": np.nan, "length_m": np.nan,
+                       "exposure": np.nan, "mean_risk": np.nan}
+                if paths:
+                    row.update(seg_ids=[], max_risk=np.nan)
+                if np.isfinite(cost):
+                    arcs     = self._arcs(meet, fparent[oi[i]], bparent[di[i]])
+                    length   = sum(self.arc_length[k] for k in arcs)
+                    exposure = sum(self.arc_exposure[k] for k in arcs)
+                    row.update(cost=cost, length_m=length, exposure=exposure,
+                               mean_risk=exposure / length if length > 0 else 0.0)
+                    if paths:
+                        segs = self._unpack(arcs)
+                        row.update(seg_ids=self.graph.seg_id[segs].tolist(),
+                                   max_risk=float(self.graph.risk[segs].max()) if segs else 0.0)
+                rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def load_graph(alpha=ROUTE_RISK_ALPHA):
+    """RoadGraph over ROADS_HOTSPOT, with ROADS_NODES positions when 01 saved them"""
+    roads = gpd.read_file(ROADS_HOTSPOT).to_crs(CRS_PROJECTED)
+    nodes = gpd.read_file(ROADS_NODES) if os.path.exists(ROADS_NODES) else None
+    return RoadGraph(roads, alpha, nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Risk-aware routing over the scored network")
+    parser.add_argument("--od", help="CSV of origin_lon, origin_lat, dest_lon, dest_lat")
+    parser.add_argument("--bench", type=int, metavar="N", help="time N random OD pairs")
+    parser.add_argument("--alpha", type=float, default=ROUTE_RISK_ALPHA,
+                        help="cost = length × (1 + alpha × risk_score)")
+    args = parser.parse_args()
+    if not args.od and not args.bench:
+        parser.error("give --od or --bench")
+
+    graph  = load_graph(args.alpha)
+    print(f"Graph: {graph.n} nodes, {len(graph.heads)} arcs, alpha = {graph.alpha}")
+    router = Router.open(graph)
+
+    if args.od:
+        od = pd.read_csv(args.od)
+        origins, snap_o = graph.nearest_nodes(od["origin_lon"], od["origin_lat"])
+        dests,   snap_d = graph.nearest_nodes(od["dest_lon"], od["dest_lat"])
+        t0     = time.perf_counter()
+        routes = router.routes(origins, dests, paths=True)
+        print(f"Routed {len(od)} OD pairs in {time.perf_counter() - t0:.2f}s")
+        routes = pd.concat([od.reset_index(drop=True), routes.drop(columns=["origin", "destination"])], axis=1)
+        routes["origin_snap_m"], routes["dest_snap_m"] = snap_o.round(1), snap_d.round(1)
+        routes["seg_ids"] = routes["seg_ids"].map(lambda segs: " ".join(map(str, segs)))
+        os.makedirs(os.path.dirname(OUTPUT_ROUTES), exist_ok=True)
+        routes.to_csv(OUTPUT_ROUTES, index=False)
+        print(f"Unreachable: {routes['cost'].isna().sum()} | mean route risk: {routes['mean_risk'].mean():.3f}")
+        print(f"Saved to {OUTPUT_ROUTES}")
+
+    if args.bench:
+        rng   = np.random.default_rng(0)
+        pairs = rng.integers(graph.n, size=(args.bench, 2))
+        for paths in (False, True):
+            t0 = time.perf_counter()
+            routes = router.routes(pairs[:, 0], pairs[:, 1], paths=paths)
+            elapsed = time.perf_counter() - t0
+            print(f"{args.bench} OD pairs{' with paths' if paths else ''}: {elapsed:.2f}s "
+                  f"({args.bench / elapsed:,.0f} pairs/s)")
+
+        # Check: plain Dijkstra from a sample of origins over the same arcs
+        sample = np.unique(pairs[:200, 0])
+        check  = np.isin(pairs[:, 0], sample)
+        csr    = csr_matrix((graph.costs, graph.heads, graph.indptr), shape=(graph.n, graph.n))
+        t0     = time.perf_counter()
+        ref    = dijkstra(csr, indices=sample)[np.searchsorted(sample, pairs[check, 0]), pairs[check, 1]]
+        print(f"scipy Dijkstra from {len(sample)} origins: {time.perf_counter() - t0:.2f}s")
+        got    = routes["cost"].to_numpy()[check]
+        both   = np.isfinite(ref)
+        print(f"Checked {check.sum()} pairs: reachability agrees {np.array_equal(both, ~np.isnan(got))}, "
+              f"max cost difference {np.abs(got[both] - ref[both]).max() if both.any() else 0:.2e}")
+
+
+if __name__ == "__main__":
+    main()
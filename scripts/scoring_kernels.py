@@ -0,0 +1,107 @@
+# scripts/scoring_kernels.py
+# Vectorized risk-scoring kernels shared by 05_risk_scoring.py's single
+# weight configuration and its --sweep mode.
+#
+# Every kernel takes the normalized feature matrix `norm` (n segments × 3:
+# surface, behavior, accidents) and either one weight triple (3,) or a block
+# of triples (k, 3). With one triple the results are per segment (n,); with
+# a block they are one row per triple (k, n) — so the sweep evaluates a whole
+# block of weight configurations in a few array operations instead of
+# re-running the scoring loop for each, and every per-triple sort runs over
+# contiguous memory.
+
+import sys
+import os
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+FACTORS        = ["Surface Condition", "Behavioral Complexity", "Accident History"]
+TIER_LABELS    = ["Low", "Moderate", "High", "Critical"]
+TIER_QUANTILES = [0.40, 0.70, 0.90]     # Low ≤ 40th pct < Moderate ≤ 70th < High ≤ 90th < Critical
+
+
+def _contributions(norm, weights):
+    """Weighted component per factor — list of (n,) or (k, n) arrays"""
+    w    = np.asarray(weights, dtype=float)
+    w    = w.T[..., None] if w.ndim == 2 else w     # (3, k, 1) broadcasts to (k, n)
+    cols = np.ascontiguousarray(np.asarray(norm).T)
+    return [cols[f] * w[f] for f in range(len(FACTORS))]
+
+
+def risk_scores(norm, weights):
+    """Weighted composite score — (n,) for one triple, (k, n) for a block"""
+    surface, behavior, accidents = _contributions(norm, weights)
+    # Summed term by term, in the same order as the original per-column formula
+    return surface + behavior + accidents
+
+
+def risk_tiers(scores):
+    """Percentile tier index 0-3 (see TIER_LABELS) of each score, per row"""
+    cuts = np.quantile(scores, TIER_QUANTILES, axis=-1)
+    return (scores[None] > cuts[..., None]).sum(axis=0).astype(np.int8)
+
+
+def dominant_factors(norm, weights):
+    """Index into FACTORS of the largest weighted component — first wins ties"""
+    parts    = _contributions(norm, weights)
+    best     = parts[0]
+    dominant = np.zeros(best.shape, dtype=np.int8)
+    for f, part in enumerate(parts[1:], start=1):
+        larger = part > best
+        dominant[larger] = f
+        best = np.where(larger, part, best)
+    return dominant
+
+
+def percentile_bins(scores, bins):
+    """Rank of each score within its row as a percentile bin 0..bins-1 (0 = lowest risk)"""
+    n     = scores.shape[-1]
+    order = np.argsort(scores, axis=-1)
+    ranks = np.empty(order.shape, dtype=np.int64)
+    np.put_along_axis(ranks, order, np.arange(n) * bins // n, axis=-1)
+    return ranks
+
+
+def simplex_weights(resolution):
+    """Every weight triple on the simplex lattice with step 1/resolution — (k, 3)"""
+    i, j = np.triu_indices(resolution + 1)
+    surface, behavior = i, j - i
+    return np.column_stack([surface, behavior, resolution - j]) / resolution
+
+
+def weight_sweep(norm, base_weights, weights, chunk=SWEEP_CHUNK, bins=100):
+    """Stability of each segment's rank, tier and dominant factor across `weights`.
+
+    Triples are evaluated `chunk` at a time. Ranks are accumulated as a
+    per-segment histogram of `bins` percentile bins, so memory stays
+    O(n × bins) however many triples are swept. Returns a dict of (n,) arrays.
+    """
+    n, k      = len(norm), len(weights)
+    base_tier = risk_tiers(risk_scores(norm, base_weights))
+    base_dom  = dominant_factors(norm, base_weights)
+
+    rank_hist  = np.zeros(n * bins, dtype=np.int64)
+    tier_flips = np.zeros(n, dtype=np.int64)
+    dom_counts = np.zeros((len(FACTORS), n), dtype=np.int64)
+    offsets    = np.arange(n) * bins
+
+    for start in range(0, k, chunk):
+        w      = weights[start:start + chunk]
+        scores = risk_scores(norm, w)
+        rank_hist  += np.bincount((offsets + percentile_bins(scores, bins)).ravel(), minlength=n * bins)
+        tier_flips += (risk_tiers(scores) != base_tier).sum(axis=0)
+        dom         = dominant_factors(norm, w)
+        for f in range(len(FACTORS)):
+            dom_counts[f] += (dom == f).sum(axis=0)
+
+    # Rank quantiles from the cumulative histogram — bin midpoints
+    cum    = rank_hist.reshape(n, bins).cumsum(axis=1)
+    result = {}
+    for q in (0.05, 0.50, 0.95):
+        result[f"rank_p{round(q * 100):02d}"] = ((cum < q * k).sum(axis=1) + 0.5) / bins
+
+    result["tier_flip_rate"]     = tier_flips / k
+    result["dominant_stability"] = dom_counts[base_dom, np.arange(n)] / k
+    result["dominant_modal"]     = np.array(FACTORS)[dom_counts.argmax(axis=0)]
+    return result
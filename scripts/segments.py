@@ -0,0 +1,51 @@
+# scripts/segments.py
+# Integer segment IDs.
+#
+# 01 gives every edge of the road network a seg_id derived from its OSM
+# identity (u, v, key) — a hash, not a row number, so re-downloading the
+# network or reading it in another order keeps each edge's seg_id and only
+# new edges get new ones — and writes SEGMENT_LOOKUP mapping each seg_id back
+# to (u, v, key, osmid). Every later table is keyed by seg_id; the original
+# osmid — which OSMnx may give as a list — is only needed to read image
+# caches written before seg_id, which were keyed by it.
+
+import sys
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+LOOKUP_COLUMNS = ["seg_id", "u", "v", "key", "osmid"]
+SEG_ID_BITS    = 53     # exact as a JavaScript number, so JSON clients keep it intact
+
+
+def segment_ids(u, v, key):
+    """seg_id of each (u, v, key) edge — the top SEG_ID_BITS of its BLAKE2b digest"""
+    ids = np.array([
+        int.from_bytes(hashlib.blake2b(f"{int(a)}:{int(b)}:{int(k)}".encode(), digest_size=8).digest(), "big")
+        >> (64 - SEG_ID_BITS)
+        for a, b, k in zip(u, v, key)
+    ], dtype=np.int64)
+    if len(np.unique(ids)) < len(ids):
+        raise ValueError("duplicate seg_id — the network repeats a (u, v, key) edge")
+    return ids
+
+
+def assign_segment_ids(edges, path=SEGMENT_LOOKUP):
+    """Give `edges` a leading seg_id column from (u, v, key) and write the lookup table"""
+    edges = edges.drop(columns="seg_id", errors="ignore").reset_index(drop=True)
+    edges.insert(0, "seg_id", segment_ids(edges["u"], edges["v"], edges["key"]))
+
+    lookup = edges[[c for c in LOOKUP_COLUMNS if c in edges.columns]].copy()
+    lookup["osmid"] = lookup["osmid"].astype(str)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    lookup.to_csv(path, index=False)
+    return edges
+
+
+def segment_osmids(path=SEGMENT_LOOKUP):
+    """seg_id → osmid (as the string used in legacy image cache keys)"""
+    lookup = pd.read_csv(path, usecols=["seg_id", "osmid"], dtype={"osmid": str})
+    return lookup.set_index("seg_id")["osmid"]
@@ -0,0 +1,242 @@
+# scripts/spatial_weights.py
+# Persisted spatial weights for 06_hotspot_analysis.py.
+#
+# Inverse-distance band weights between road segments, row-standardized,
+# with distance measured either
+#   - "euclidean": between segment centroids — the same matrix as libpysal's
+#     DistanceBand(binary=False) with transform "r", built straight into CSR
+#     from a KD-tree pair query
+#   - "network": along the street network, midpoint to midpoint — bounded
+#     Dijkstra searches over 01's road graph, so a parallel street across a
+#     block, the Caltrain tracks or US-101 is only a neighbour if it can be
+#     reached within the band
+# Either way memory is O(pairs within the band) and never n × n.
+#
+# The matrix is saved compressed (SPATIAL_WEIGHTS / NETWORK_WEIGHTS) with a
+# hash of its inputs — centroids or graph, plus the threshold — and reloaded
+# as long as neither changes: a re-scored network skips the neighbour search.
+
+import sys
+import os
+import hashlib
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+
+
+def weights_key(kind, threshold, *arrays):
+    """128-bit BLAKE2b digest of the weight kind, band threshold and input arrays"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"inverse-{kind}:{float(threshold)!r}".encode())
+    for values in arrays:
+        values = np.ascontiguousarray(values)
+        h.update(f"{values.dtype}:".encode())
+        h.update(values.tobytes())
+    return h.hexdigest()
+
+
+# ---------------------------------------------------
+# Neighbour pairs
+# ---------------------------------------------------
+def distance_pairs(coords, threshold):
+    """Every ordered pair of distinct points at most `threshold` apart — (i, j, distance).
+
+    Coincident points (distance 0) are not neighbours, as in DistanceBand.
+    """
+    tree  = cKDTree(np.asarray(coords, dtype=np.float64))
+    pairs = tree.sparse_distance_matrix(tree, threshold, output_type="ndarray")
+    pairs = pairs[pairs["v"] > 0]
+    return pairs["i"], pairs["j"], pairs["v"]
+
+
+_graph = None
+
+
+def _init_worker(graph):
+    global _graph
+    _graph = graph
+
+
+def _network_chunk(sources):
+    """Bounded Dijkstra from each source segment's midpoint — (i, j, distance) lists"""
+    adj, incident, ends, half, skip, threshold = _graph
+    I, J, D = [], [], []
+    for s in sources:
+        a, b    = ends[s]
+        settled = set()
+        seen    = {s, *skip.get(s, ())}
+        heap    = [(half[s], a), (half[s], b)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            # Nodes settle nearest first, so a segment's first endpoint
+            # reached is its nearer one — no later path can be shorter
+            for seg, h in incident[node]:
+                if seg not in seen:
+                    seen.add(seg)
+                    if d + h <= threshold:
+                        I.append(s)
+                        J.append(seg)
+                        D.append(d + h)
+            for nbr, length in adj[node]:
+                if nbr not in settled and d + length <= threshold:
+                    heapq.heappush(heap, (d + length, nbr))
+    return I, J, D
+
+
+def network_distance_pairs(u, v, length, threshold, workers=NETWORK_WORKERS, chunk=512):
+    """Every ordered pair of segments at most `threshold` apart along the network — (i, j, distance).
+
+    Segments are edges (u, v, length in metres) of the road graph; distance
+    runs from midpoint to midpoint, in either direction regardless of
+    one-way restrictions. The two directed edges of a two-way street are the
+    same place — distance 0 — and, as with coincident centroids, not
+    neighbours.
+    """
+    u, v, length = np.asarray(u), np.asarray(v), np.asarray(length, dtype=np.float64)
+    n = len(u)
+    nodes, ends = np.unique(np.concatenate([u, v]), return_inverse=True)
+    ends  = ends.reshape(2, n).T
+
+    adj      = [[] for _ in range(len(nodes))]
+    incident = [[] for _ in range(len(nodes))]
+    for seg, (a, b) in enumerate(ends.tolist()):
+        adj[a].append((b, length[seg]))
+        adj[b].append((a, length[seg]))
+        incident[a].append((seg, length[seg] / 2))
+        if b != a:
+            incident[b].append((seg, length[seg] / 2))
+
+    # Reverse twins: same node pair, same length
+    pair  = pd.DataFrame({"a": ends.min(axis=1), "b": ends.max(axis=1), "len": length.round(3)})
+    twins = pair.groupby(["a", "b", "len"]).ngroup().to_numpy()
+    skip  = {}
+    for group in pd.Series(np.arange(n)).groupby(twins).groups.values():
+        if len(group) > 1:
+            for seg in group:
+                skip[seg] = [other for other in group if other != seg]
+
+    graph   = (adj, incident, ends.tolist(), (length / 2).tolist(), skip, float(threshold))
+    chunks  = [range(start, min(start + chunk, n)) for start in range(0, n, chunk)]
+    workers = max(1, min(workers or 1, len(chunks)))
+    if workers == 1:
+        _init_worker(graph)
+        results = list(map(_network_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(graph,)) as pool:
+            results = list(pool.map(_network_chunk, chunks))
+    I, J, D = [], [], []
+    for ci, cj, cd in results:
+        I.extend(ci)
+        J.extend(cj)
+        D.extend(cd)
+    return np.array(I, dtype=np.int64), np.array(J, dtype=np.int64), np.array(D, dtype=np.float64)
+
+
+# ---------------------------------------------------
+# Weights
+# ---------------------------------------------------
+def row_standardize(w):
+    """Rows scaled to sum to 1, neighbour order kept; rows without neighbours stay empty"""
+    w     = sp.csr_matrix(w, dtype=np.float64, copy=True)
+    rows  = np.repeat(np.arange(w.shape[0]), np.diff(w.indptr))
+    # float even without pairs — bincount of an empty array is int64
+    total = np.bincount(rows, weights=w.data, minlength=w.shape[0]).astype(np.float64)
+    scale = np.divide(1.0, total, out=np.zeros_like(total), where=total > 0)
+    w.data *= scale[rows]
+    return w
+
+
+def pair_weights(n, pairs):
+    """Row-standardized 1 / distance weights (n × n csr) from (i, j, distance) pairs"""
+    i, j, d = pairs
+    w = sp.csr_matrix((1.0 / d, (i, j)), shape=(n, n))
+    w.sort_indices()
+    return row_standardize(w)
+
+
+def band_weights(n, pairs, bands):
+    """Row-standardized 1 / distance weights for each threshold in `bands` — list of csr.
+
+    `pairs` are the (i, j, distance) neighbours at the widest band; every
+    narrower band is a filter of them, so the neighbour search is paid once
+    however many bands.
+    """
+    i, j, d = pairs
+    dist    = sp.csr_matrix((d, (i, j)), shape=(n, n))
+    rows    = np.repeat(np.arange(n), np.diff(dist.indptr))
+    weights = []
+    for band in bands:
+        keep   = dist.data <= band
+        if not keep.any():              # no neighbour this close — every row empty
+            weights.append(sp.csr_matrix((n, n), dtype=np.float64))
+            continue
+        indptr = np.r_[0, np.cumsum(np.bincount(rows[keep], minlength=n))]
+        w      = sp.csr_matrix((1.0 / dist.data[keep], dist.indices[keep], indptr), shape=(n, n))
+        weights.append(row_standardize(w))
+    return weights
+
+
+def inverse_distance_weights(coords, threshold):
+    """Row-standardized 1 / Euclidean distance weights within `threshold` (n × n csr)"""
+    return pair_weights(len(coords), distance_pairs(coords, threshold))
+
+
+def network_weights(u, v, length, threshold):
+    """Row-standardized 1 / network distance weights within `threshold` (n × n csr)"""
+    return pair_weights(len(u), network_distance_pairs(u, v, length, threshold))
+
+
+# ---------------------------------------------------
+# Persistence
+# ---------------------------------------------------
+def save_weights(w, path, key):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, key=key, shape=np.array(w.shape), data=w.data,
+                        indices=w.indices, indptr=w.indptr)
+    os.replace(tmp, path)
+
+
+def load_weights(path, key):
+    """The matrix saved at `path` if it was saved under `key`, else None"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        if str(f["key"]) != key:
+            return None
+        return sp.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+
+
+def _open(path, key, build, n):
+    w = load_weights(path, key)
+    if w is not None:
+        print(f"Spatial weights: reusing {path}")
+        return w
+    w = build()
+    save_weights(w, path, key)
+    print(f"Spatial weights: built for {n} segments, saved to {path}")
+    return w
+
+
+def open_weights(coords, threshold=SPATIAL_WEIGHT_THRESHOLD, path=SPATIAL_WEIGHTS):
+    """Euclidean weights saved at `path` if they match `coords` and `threshold`, else build and save them"""
+    coords = np.asarray(coords, dtype=np.float64)
+    key    = weights_key("distance", threshold, coords)
+    return _open(path, key, lambda: inverse_distance_weights(coords, threshold), len(coords))
+
+
+def open_network_weights(u, v, length, threshold=SPATIAL_WEIGHT_THRESHOLD, path=NETWORK_WEIGHTS):
+    """Network weights saved at `path` if they match the graph and `threshold`, else build and save them"""
+    u, v   = np.asarray(u, dtype=np.int64), np.asarray(v, dtype=np.int64)
+    length = np.asarray(length, dtype=np.float64)
+    key    = weights_key("network", threshold, u, v, length)
+    return _open(path, key, lambda: network_weights(u, v, length, threshold), len(u))
@@ -0,0 +1,233 @@
+# scripts/sv_fetch.py
+# Concurrent, rate-limited Street View fetcher used by 02b_streetview_distress.py.
+#
+#   - Bounded thread pool (SV_MAX_WORKERS) — network waits overlap instead of
+#     running one request at a time
+#   - Token bucket (SV_RATE_LIMIT req/s, SV_RATE_BURST burst) shared by all
+#     workers, so metadata + image calls together never exceed the quota
+#   - One keep-alive requests.Session per worker thread (connection reuse)
+#   - Retry with exponential backoff + jitter on 429 / 5xx / timeouts;
+#     anything still failing is reported by kind instead of silently counted
+#   - MetadataCache persists coverage lookups (pano_id, date) by rounded
+#     location, so re-runs and nearby sample points skip the metadata call
+#
+# SV_API_BASE (config / env) can point at a local stand-in server exposing the
+# same /metadata and image endpoints, so the engine can be exercised offline.
+
+import sys
+import os
+import csv
+import time
+import random
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+from scripts.image_store import ends_with_newline
+
+RETRY_STATUS     = {429, 500, 502, 503, 504}
+NO_COVERAGE      = {"ZERO_RESULTS", "NOT_FOUND"}
+
+
+class FetchError(Exception):
+    """Request that still failed after all retries — `kind` says why"""
+    def __init__(self, kind, message=""):
+        super().__init__(f"{kind}: {message}" if message else kind)
+        self.kind = kind
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `burst` banked.
+
+    `clock` and `sleep` default to time.monotonic and time.sleep; tests pass
+    a fake pair so no real time goes by.
+    """
+    def __init__(self, rate, burst, clock=None, sleep=None):
+        self.rate    = float(rate)
+        self.burst   = float(max(1, burst))
+        self.clock   = clock or time.monotonic
+        self.sleep   = sleep or time.sleep
+        self.tokens  = self.burst
+        self.updated = self.clock()
+        self.lock    = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class StreetViewFetcher:
+    """Fetches (jpeg bytes, date) per sample point through a pooled, rate-limited client"""
+
+    def __init__(self, api_key=STREETVIEW_API_KEY, base_url=SV_API_BASE,
+                 workers=SV_MAX_WORKERS, rate=SV_RATE_LIMIT, burst=SV_RATE_BURST,
+                 max_retries=SV_MAX_RETRIES, backoff=SV_BACKOFF_BASE):
+        self.api_key     = api_key
+        self.base_url    = base_url.rstrip("/")
+        self.workers     = workers
+        self.bucket      = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff     = backoff
+        self.stats       = Counter()
+        self.stats_lock  = threading.Lock()
+        self.local       = threading.local()
+
+    # ---------------------------------------------------
+    # HTTP plumbing
+    # ---------------------------------------------------
+    def _session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.local.session = session
+        return session
+
+    def _count(self, key, n=1):
+        with self.stats_lock:
+            self.stats[key] += n
+
+    def _get(self, url, params, timeout):
+        """GET with token-bucket pacing and backoff on retryable failures"""
+        params = dict(params, key=self.api_key)
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self._count("requests")
+            try:
+                r = self._session().get(url, params=params, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                kind, detail = "connection", str(e)
+            else:
+                if r.status_code not in RETRY_STATUS:
+                    return r
+                kind, detail = f"http_{r.status_code}", r.reason
+
+            if attempt == self.max_retries:
+                raise FetchError(kind, detail)
+            self._count("retries")
+            # Exponential backoff with full jitter so workers don't retry in lockstep
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    # ---------------------------------------------------
+    # Street View endpoints
+    # ---------------------------------------------------
+    def metadata(self, lat, lon):
+        """Coverage lookup. Returns {status, pano_id, sv_date} — status OK or no coverage"""
+        r = self._get(
+            f"{self.base_url}/metadata",
+            {"location": f"{lat},{lon}"},
+            timeout=10
+        )
+        try:
+            meta = r.json()
+        except ValueError:
+            raise FetchError("bad_metadata", r.text[:80])
+        status = meta.get("status")
+        if status not in NO_COVERAGE and status != "OK":
+            raise FetchError(f"meta_{status}", meta.get("error_message", ""))
+        return {
+            "status":  status,
+            "pano_id": meta.get("pano_id", ""),
+            "sv_date": meta.get("date", "unknown"),
+        }
+
+    def image(self, pano_id, heading, location=None):
+        """Fetch one 640×480 view of a panorama. Returns jpeg bytes
+
+        Without a pano_id, the view is of the panorama nearest `location`
+        ("lat,lon") instead.
+        """
+        params = {
+            "size":    "640x480",
+            "heading": heading,
+            "pitch":   SV_PITCH,
+            "fov":     SV_FOV,
+        }
+        if pano_id:
+            params["pano"] = pano_id
+        else:
+            params["location"] = location
+        r = self._get(self.base_url, params, timeout=15)
+        if r.status_code != 200:
+            raise FetchError(f"http_{r.status_code}", r.reason)
+        return r.content
+
+    def run_many(self, func, jobs):
+        """Run func(*args) for (key, *args) jobs concurrently.
+
+        Yields (key, result, error) in completion order. `error` is a
+        FetchError kind string, or None on success.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(func, *args): key for key, *args in jobs}
+            for fut in as_completed(futures):
+                key = futures[fut]
+                try:
+                    result = fut.result()
+                except FetchError as e:
+                    self._count(f"error_{e.kind}")
+                    yield key, None, e.kind
+                else:
+                    yield key, result, None
+
+
+class MetadataCache:
+    """Persistent metadata lookups keyed by location rounded to SV_META_ROUND decimals.
+
+    Only definitive answers (OK / no coverage) are stored, so failed lookups
+    are retried on the next run.
+    """
+    COLUMNS = ["location", "status", "pano_id", "sv_date"]
+
+    def __init__(self, path=SV_METADATA_CACHE):
+        self.path    = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    if None not in row.values():
+                        self.entries[row["location"]] = {
+                            "status":  row["status"],
+                            "pano_id": row["pano_id"],
+                            "sv_date": row["sv_date"],
+                        }
+
+    @staticmethod
+    def location(lat, lon):
+        return f"{round(float(lat), SV_META_ROUND)},{round(float(lon), SV_META_ROUND)}"
+
+    def __contains__(self, location):
+        return location in self.entries
+
+    def __getitem__(self, location):
+        return self.entries[location]
+
+    def add(self, location, meta):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(self.COLUMNS)
+            elif not ends_with_newline(self.path):
+                f.write("\r\n")   # close off a torn final row
+            writer.writerow([location, meta["status"], meta["pano_id"], meta["sv_date"]])
+        self.entries[location] = meta
+
+
+def heading_bucket(heading):
+    """SV_HEADING_BUCKET-degree bucket, centred on 0° so 359° and 1° share a bucket"""
+    return int(((float(heading) + SV_HEADING_BUCKET / 2) % 360) // SV_HEADING_BUCKET)
@@ -0,0 +1,182 @@
+# scripts/sv_scoring.py
+# Pavement distress scoring kernel + parallel batch engine for 02b.
+#
+# The kernel works on the grayscale road crop only:
+#   - JPEGs are decoded straight to grayscale (no RGB buffer, no cvtColor)
+#     and optionally at 1/2, 1/4 or 1/8 scale via SV_DECODE_SCALE
+#   - the top 60% of the frame is sliced away as a view, not copied
+#   - Canny / threshold outputs are written into per-process buffers that
+#     are reused for every image of the same size
+#
+# score_images() fans batches of image keys out to a process pool; each
+# worker decodes zero-copy from its own mmap of the image pack and scored
+# batches stream back as they finish.
+#
+# ScoreStore checkpoints results to an append-only CSV keyed by image content
+# hash + a hash of SCORE_PARAMS: an interrupted run resumes where it stopped,
+# and changing a parameter re-scores exactly the rows scored under the old one.
+
+import sys
+import os
+import csv
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import cv2
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+from scripts.image_store import ImageStore, ends_with_newline
+
+# Everything that changes the score of a given image lives here
+SCORE_PARAMS = {
+    "road_crop":      0.6,     # keep rows below this fraction — road surface at pitch=-45
+    "canny_low":      50,
+    "canny_high":     150,
+    "dark_threshold": 60,      # pixels at or below this count as dark patches
+    "weight_edges":   0.40,
+    "weight_texture": 0.35,
+    "weight_dark":    0.25,
+    "decode_scale":   SV_DECODE_SCALE,
+    "kernel_version": 1,       # bump when score_gray() changes behaviour
+}
+
+PARAMS_HASH = hashlib.blake2b(
+    json.dumps(SCORE_PARAMS, sort_keys=True).encode(), digest_size=8
+).hexdigest()
+
+METRICS = ["edge_density", "texture_variance", "dark_ratio", "distress_score"]
+
+DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+# Per-process scratch buffers keyed by crop shape
+_buffers = {}
+
+
+def _scratch(shape):
+    if shape not in _buffers:
+        _buffers[shape] = (np.empty(shape, np.uint8), np.empty(shape, np.uint8))
+    return _buffers[shape]
+
+
+def score_gray(gray, params=SCORE_PARAMS):
+    """Score a full grayscale frame. Returns 0 (perfect) to 1 (severe) plus metrics"""
+    road = gray[int(gray.shape[0] * params["road_crop"]):, :]
+    edges, dark = _scratch(road.shape)
+
+    # Metric 1: Edge density — cracks and distress lines create edges
+    cv2.Canny(road, params["canny_low"], params["canny_high"], edges=edges)
+    edge_density = cv2.countNonZero(edges) / edges.size
+
+    # Metric 2: Texture variance — rough surfaces have higher variance than smooth
+    _, std = cv2.meanStdDev(road)
+    texture_variance = float(std[0, 0] ** 2 / 10000)
+
+    # Metric 3: Dark patch ratio — cracks appear as dark linear features
+    cv2.threshold(road, params["dark_threshold"], 255, cv2.THRESH_BINARY_INV, dst=dark)
+    dark_ratio = cv2.countNonZero(dark) / dark.size
+
+    distress_score = min(1.0,
+        edge_density               * params["weight_edges"] +
+        min(texture_variance, 1.0) * params["weight_texture"] +
+        dark_ratio                 * params["weight_dark"]
+    )
+
+    return {
+        "edge_density":      edge_density,
+        "texture_variance":  texture_variance,
+        "dark_ratio":        dark_ratio,
+        "distress_score":    distress_score
+    }
+
+
+def score_jpeg(data):
+    """Score JPEG bytes (bytes / memoryview). Returns metrics dict, or None if undecodable"""
+    buf  = np.frombuffer(data, dtype=np.uint8)
+    gray = cv2.imdecode(buf, DECODE_FLAGS[SCORE_PARAMS["decode_scale"]])
+    if gray is None:
+        return None
+    return score_gray(gray)
+
+
+# Per-process read-only view of the image pack
+_store = None
+
+
+def _init_worker(pack_path):
+    global _store
+    # One OpenCV thread per process — the pool already fills every core
+    cv2.setNumThreads(1)
+    _store = ImageStore(pack_path)
+
+
+def _score_batch(keys):
+    return [(key, score_jpeg(_store.get(key))) for key in keys]
+
+
+def score_images(keys, pack_path=SV_IMAGE_PACK, workers=SV_SCORE_WORKERS, batch=SV_SCORE_BATCH):
+    """Score packed images in parallel. Yields lists of (key, metrics or None) per batch"""
+    keys    = list(keys)
+    batches = [keys[i:i + batch] for i in range(0, len(keys), batch)]
+    if not batches:
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(pack_path,)
+    ) as pool:
+        futures = [pool.submit(_score_batch, b) for b in batches]
+        for fut in as_completed(futures):
+            yield fut.result()
+
+
+class ScoreStore:
+    """Append-only checkpoint of metrics keyed by (content hash, params hash).
+
+    Only rows scored under `params_hash` are loaded; rows from other parameter
+    sets stay in the file but are ignored.
+    """
+    COLUMNS = ["content_hash", "params_hash", *METRICS]
+
+    def __init__(self, path=SV_SCORE_STORE, params_hash=PARAMS_HASH):
+        self.path        = path
+        self.params_hash = params_hash
+        self.scores      = {}
+        self.stale       = 0
+        if os.path.exists(path):
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    if None in row.values():
+                        continue   # torn final line from an interrupted write
+                    if row["params_hash"] != params_hash:
+                        self.stale += 1
+                        continue
+                    self.scores[row["content_hash"]] = {m: float(row[m]) for m in METRICS}
+
+    def __contains__(self, digest):
+        return digest in self.scores
+
+    def __getitem__(self, digest):
+        return self.scores[digest]
+
+    def __len__(self):
+        return len(self.scores)
+
+    def add(self, items):
+        """Persist [(content hash, metrics)] — flushed before returning"""
+        if not items:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(self.COLUMNS)
+            elif not ends_with_newline(self.path):
+                f.write("\r\n")   # close off a torn final row
+            for digest, metrics in items:
+                writer.writerow([digest, self.params_hash, *(metrics[m] for m in METRICS)])
+                self.scores[digest] = metrics
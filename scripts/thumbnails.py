@@ -0,0 +1,129 @@
+# scripts/thumbnails.py
+# Popup thumbnails for 07_build_webmap.py.
+#
+# One image per segment — the sample 02b scored as most distressed, so the
+# popup shows the worst of the road rather than whatever sample 0 happens to
+# be — shrunk to THUMB_WIDTH and re-encoded at THUMB_QUALITY.
+#
+# Thumbnails are named by the source image's content hash plus a hash of the
+# thumbnail parameters, so a file that exists is current by construction:
+# re-runs only derive thumbnails for new images or changed settings. The work
+# fans out to a process pool, each worker decoding zero-copy from its own
+# mmap of the image pack, like the distress scorer.
+
+import sys
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import cv2
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+from scripts.image_store import ImageStore, image_key
+
+THUMB_PARAMS = {"width": THUMB_WIDTH, "quality": THUMB_QUALITY, "version": 1}
+PARAMS_HASH  = hashlib.blake2b(json.dumps(THUMB_PARAMS, sort_keys=True).encode(), digest_size=4).hexdigest()
+
+
+def thumbnail_name(digest):
+    """File name of the thumbnail of an image with content hash `digest`"""
+    return f"{digest[:16]}_{PARAMS_HASH}.jpg"
+
+
+def select_samples(store):
+    """seg_id → image key of the segment's highest-distress sample.
+
+    Segments without distress scores fall back to their first packed sample.
+    """
+    points = gpd.read_file(SAMPLE_POINTS, ignore_geometry=True)
+    points["key"] = [
+        image_key(seg_id, n, heading)
+        for seg_id, n, heading in zip(points["seg_id"], points["sample_num"], points["heading"])
+    ]
+    points = points[points["key"].map(store.__contains__)]
+
+    if os.path.exists(SV_DISTRESS_RAW):
+        scores = pd.read_csv(SV_DISTRESS_RAW, usecols=["seg_id", "sample_num", "distress_score"])
+        points = points.merge(scores.drop_duplicates(["seg_id", "sample_num"]),
+                              on=["seg_id", "sample_num"], how="left")
+    else:
+        points["distress_score"] = np.nan
+
+    # Highest score first, unscored samples last, then lowest sample number
+    points = points.sort_values(["seg_id", "distress_score", "sample_num"],
+                                ascending=[True, False, True], na_position="last")
+    best = points.drop_duplicates("seg_id")
+    return dict(zip(best["seg_id"], best["key"]))
+
+
+def make_thumbnail(data):
+    """JPEG bytes → THUMB_WIDTH-wide JPEG bytes, or None if undecodable"""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    h, w = image.shape[:2]
+    if w > THUMB_WIDTH:
+        image = cv2.resize(image, (THUMB_WIDTH, round(h * THUMB_WIDTH / w)), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY])
+    return buf.tobytes() if ok else None
+
+
+# Per-process read-only view of the image pack
+_store = None
+
+
+def _init_worker(pack_path):
+    global _store
+    cv2.setNumThreads(1)
+    _store = ImageStore(pack_path)
+
+
+def _thumbnail_batch(tasks):
+    """Write the thumbnail of each (key, path). Returns [(path, bytes written or None)]"""
+    done = []
+    for key, path in tasks:
+        thumb = make_thumbnail(_store.get(key))
+        if thumb is not None:
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(thumb)
+            os.replace(tmp, path)
+        done.append((path, None if thumb is None else len(thumb)))
+    return done
+
+
+def build_thumbnails(store, out_dir=OUTPUT_THUMBS, workers=THUMB_WORKERS, batch=THUMB_BATCH):
+    """seg_id → thumbnail path for every segment with an image; derives missing thumbnails.
+
+    Returns (paths, stats) — stats counts thumbnails derived, already current
+    and undecodable.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    samples = select_samples(store)
+    paths   = {seg_id: os.path.join(out_dir, thumbnail_name(store.content_hash(key)))
+               for seg_id, key in samples.items()}
+
+    # Identical source images share one thumbnail
+    todo = {}
+    for seg_id, path in paths.items():
+        if path not in todo and not os.path.exists(path):
+            todo[path] = samples[seg_id]
+    stats = {"derived": 0, "current": len(set(paths.values())) - len(todo), "failed": 0}
+
+    tasks   = [(key, path) for path, key in todo.items()]
+    batches = [tasks[i:i + batch] for i in range(0, len(tasks), batch)]
+    failed  = set()
+    if batches:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(store.path,)) as pool:
+            for fut in as_completed([pool.submit(_thumbnail_batch, b) for b in batches]):
+                for path, size in fut.result():
+                    if size is None:
+                        failed.add(path)
+                    else:
+                        stats["derived"] += 1
+    stats["failed"] = len(failed)
+    return {seg_id: path for seg_id, path in paths.items() if path not in failed}, stats
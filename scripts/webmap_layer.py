@@ -0,0 +1,428 @@
+# scripts/webmap_layer.py
+# Client-side segment layer for 07_build_webmap.py.
+#
+# The whole network goes into the page as one compact JSON blob — geometry
+# as flat coordinate arrays, attributes as columns, categories as small
+# integer codes — and one script turns it into polylines on a shared canvas
+# renderer. Styling happens in the browser from the columns, and a popup's
+# HTML is only built when its segment is clicked, so page size and load time
+# grow with the data itself rather than with per-segment markup.
+#
+# Risk scores are live: the three normalized factors travel as float32
+# arrays and the browser re-runs 05's scoring — weighted sum, percentile
+# tiers, dominant factor — whenever the weight sliders move, restyling only
+# the segments whose tier changed. Gi* classes can't follow (they need 06's
+# permutations), so they stay as baked and get their own layer.
+#
+# Geometry comes in levels of detail (MAP_LOD): each zoom band gets the
+# network simplified to its own tolerance, with coordinates snapped to an
+# integer grid and delta-encoded — mostly one- and two-digit numbers in the
+# JSON. Only the coarsest level is in the page; the finer ones are script
+# files next to the map (write_levels), loaded the first time the map is
+# zoomed into their band, after which every line's vertices are swapped over.
+#
+# Thumbnails are separate files next to the map (see 07), referenced by
+# relative path and only fetched when a popup opens.
+
+import sys
+import os
+import json
+import base64
+import numpy as np
+import shapely
+import geopandas as gpd
+from branca.element import MacroElement
+from jinja2 import Template
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import *
+from scripts.scoring_kernels import FACTORS, TIER_LABELS, TIER_QUANTILES
+
+# (column, decimals) — numeric popup fields, NaN → null
+NUMERIC_FIELDS = [
+    ("gi_zscore", 3), ("avg_distress", 3),
+    ("avg_complexity", 3), ("accident_count", 0),
+]
+# Categorical fields, sent as an index into their list of values
+CATEGORY_FIELDS = ["hotspot_class"]
+# 05's normalized factors, in FACTORS order — scored in the browser
+NORM_FIELDS = ["norm_surface", "norm_behavior", "norm_accidents"]
+
+
+def _codes(values):
+    """(labels, int codes) of a column — missing values as -1"""
+    values = np.asarray([None if v is None or v != v else str(v) for v in values], dtype=object)
+    labels = sorted({v for v in values if v is not None})
+    lookup = {label: i for i, label in enumerate(labels)}
+    return labels, [lookup.get(v, -1) for v in values]
+
+
+def _float32(values):
+    """Base64 of a column as little-endian float32 — a Float32Array in the browser"""
+    return base64.b64encode(np.asarray(values, dtype="<f4").tobytes()).decode("ascii")
+
+
+def _column(values, decimals):
+    values = np.round(np.asarray(values, dtype=np.float64), decimals)
+    if decimals == 0:
+        return [None if np.isnan(v) else int(v) for v in values]
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+def _encode(parts, owner, n, decimals):
+    """Per segment, its parts as flat [dlat, dlon, dlat, dlon, ...] integer lists.
+
+    Coordinates are snapped to a 10^-decimals degree grid and each vertex is
+    stored as the step from the one before it — across the whole stream, so
+    consecutive parts and segments chain on. Vertices that snap onto their
+    predecessor within a part are dropped.
+    """
+    coords, index = shapely.get_coordinates(parts, return_index=True)
+    grid  = np.rint(coords[:, ::-1] * 10 ** decimals).astype(np.int64)   # lon/lat → lat/lon
+    keep  = np.ones(len(grid), dtype=bool)
+    keep[1:] = (grid[1:] != grid[:-1]).any(axis=1) | (index[1:] != index[:-1])
+    grid, index = grid[keep], index[keep]
+    steps  = np.diff(grid, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel().tolist()
+    bounds = (2 * np.searchsorted(index, np.arange(len(parts) + 1))).tolist()
+    lines  = [[] for _ in range(n)]
+    for p, seg in enumerate(owner.tolist()):
+        lines[seg].append(steps[bounds[p]:bounds[p + 1]])
+    return lines
+
+
+def _levels(geoms, lod):
+    """Encoded geometry of `geoms` (EPSG:4326) at each (from zoom, tolerance m, decimals) of `lod`.
+
+    Every level simplifies the same line parts, so a part is the same
+    polyline at every zoom and only its vertices change. Simplification
+    keeps each part's end points and they all snap to the same grid, so
+    segments meeting at a junction still meet at every level. Topology is
+    only preserved within a part: at coarse tolerances two nearby roads can
+    cross where they don't.
+    """
+    parts, owner = shapely.get_parts(geoms, return_index=True)
+    projected    = None
+    levels       = []
+    for zoom, tolerance, decimals in lod:
+        level = parts
+        if tolerance > 0:
+            if projected is None:
+                projected = gpd.GeoSeries(parts, crs=CRS_GEOGRAPHIC).to_crs(CRS_PROJECTED)
+            level = gpd.GeoSeries(shapely.simplify(projected.values, tolerance, preserve_topology=True),
+                                  crs=CRS_PROJECTED).to_crs(CRS_GEOGRAPHIC).values
+        levels.append({"zoom": zoom, "scale": 10 ** decimals,
+                       "lines": _encode(level, owner, len(geoms), decimals)})
+    return levels
+
+
+def level_vertices(payload):
+    """Vertex count of each level of detail in a segment payload"""
+    return [sum(len(part) for seg in level["lines"] for part in seg) // 2 for level in payload["lods"]]
+
+
+def write_levels(payload, output_map):
+    """Move every level but the coarsest out of `payload` into script files next to `output_map`.
+
+    Each level becomes <map name>_lod<zoom>.js, which hands its lines to
+    the page when loaded — a script tag, so it also works from file://.
+    Returns the paths written.
+    """
+    stem, paths = os.path.splitext(output_map)[0], []
+    for level in payload["lods"][1:]:
+        path = f"{stem}_lod{level['zoom']}.js"
+        src  = os.path.basename(path)
+        body = json.dumps(level.pop("lines"), separators=(",", ":"))
+        tmp  = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"segmentLayerLevels[{json.dumps(src)}]({body});\n")
+        os.replace(tmp, path)
+        level["src"] = src
+        paths.append(path)
+    return paths
+
+
+def segment_payload(roads, thumbs, colors, lod=MAP_LOD,
+                    weights=(WEIGHT_SURFACE, WEIGHT_BEHAVIOR, WEIGHT_ACCIDENTS)):
+    """Compact columnar description of `roads` (EPSG:4326) for SegmentLayer.
+
+    `thumbs` is a per-row relative path (or None), `colors` maps
+    hotspot_class labels to line colours, `lod` lists the levels of detail
+    as (from zoom, simplify tolerance in metres, coordinate decimals) and
+    `weights` are the sliders' starting point. All levels are inline until
+    write_levels moves the finer ones out. Segments without a name (or
+    networks without a name column, as from --pbf) are "Road Segment".
+    """
+    payload = {
+        "n":     len(roads),
+        "lods":  _levels(roads.geometry.values, sorted(lod)),
+        "name":  [str(v) if v == v and v is not None and v != "" else "Road Segment"
+                  for v in roads.get("name", [""] * len(roads))],
+    }
+    for col, decimals in NUMERIC_FIELDS:
+        payload[col] = _column(roads[col], decimals)
+    for col in CATEGORY_FIELDS:
+        payload[col + "_labels"], payload[col] = _codes(roads[col])
+
+    payload["norm"]           = [_float32(roads[col]) for col in NORM_FIELDS]
+    payload["weights"]        = [float(w) for w in weights]
+    payload["factors"]        = FACTORS
+    payload["tiers"]          = TIER_LABELS
+    payload["tier_quantiles"] = TIER_QUANTILES
+
+    thumb_files, payload["thumb"] = _codes(thumbs)
+    payload["thumb_files"] = thumb_files
+    payload["colors"] = [colors.get(label, "#d3d3d3") for label in payload["hotspot_class_labels"]]
+    return payload
+
+
+class SegmentLayer(MacroElement):
+    """All road segments as one data blob, scored, drawn and styled client-side"""
+
+    _template = Template("""
+{% macro script(this, kwargs) %}
+(function() {
+    var map  = {{ this._parent.get_name() }};
+    var d    = {{ this.payload }};
+    var canvas = L.canvas({padding: 0.5, tolerance: 4});
+    var TIER_COLORS = {"Low": "#2ecc71", "Moderate": "#f39c12", "High": "#e67e22", "Critical": "#e74c3c"};
+
+    function esc(s) {
+        return String(s).replace(/[&<>"]/g, function(c) {
+            return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}[c];
+        });
+    }
+    function label(col, i) {
+        var code = d[col][i];
+        return code < 0 ? "N/A" : d[col + "_labels"][code];
+    }
+    function num(col, i, digits) {
+        var v = d[col][i];
+        return v === null ? "N/A" : v.toFixed(digits);
+    }
+
+    // Live scoring — the kernels of scoring_kernels.py over the float32 factors
+    var norm = d.norm.map(function(b64) {
+        var bytes = Uint8Array.from(atob(b64), function(c) { return c.charCodeAt(0); });
+        return new Float32Array(bytes.buffer);
+    });
+    var weights  = d.weights.slice();
+    var score    = new Float64Array(d.n);
+    var tier     = new Int8Array(d.n).fill(-1);
+    var dominant = new Int8Array(d.n);
+
+    function quantile(sorted, q) {
+        // numpy's default (linear) interpolation
+        var pos = q * (sorted.length - 1), lo = Math.floor(pos), hi = Math.min(lo + 1, sorted.length - 1);
+        return sorted[lo] + (sorted[hi] - sorted[lo]) * (pos - lo);
+    }
+    function rescore() {
+        // Returns the segments whose tier changed
+        var total = weights.reduce(function(a, b) { return a + b; }, 0) || 1;
+        var w = weights.map(function(x) { return x / total; });
+        for (var i = 0; i < d.n; i++) {
+            var s = 0, best = -Infinity;
+            for (var f = 0; f < norm.length; f++) {
+                var part = norm[f][i] * w[f];
+                s += part;
+                if (part > best) { best = part; dominant[i] = f; }
+            }
+            score[i] = s;
+        }
+        var sorted  = Float64Array.from(score).sort();
+        var cuts    = d.tier_quantiles.map(function(q) { return quantile(sorted, q); });
+        var changed = [];
+        for (var i = 0; i < d.n; i++) {
+            var t = 0;
+            for (var c = 0; c < cuts.length; c++) if (score[i] > cuts[c]) t++;
+            if (t !== tier[i]) { tier[i] = t; changed.push(i); }
+        }
+        return changed;
+    }
+
+    function riskStyle(i) {
+        var t = d.tiers[tier[i]];
+        return {color: TIER_COLORS[t], weight: t === "Critical" ? 5 : 2, opacity: 0.85};
+    }
+    function hotspotStyle(i) {
+        var cls = label("hotspot_class", i);
+        var code = d.hotspot_class[i];
+        return {
+            color:   code < 0 ? "#d3d3d3" : d.colors[code],
+            weight:  cls.indexOf("Hot Spot") === 0 ? 6 : 2,
+            opacity: 0.85
+        };
+    }
+    function popupHtml(i) {
+        var t     = d.tiers[tier[i]];
+        var thumb = d.thumb[i] < 0 ? "" :
+            '<img src="' + d.thumb_files[d.thumb[i]] + '" loading="lazy" width="400" ' +
+            'style="border-radius:6px;margin-bottom:8px;display:block"><br>';
+        return '<div style="font-family:Arial;font-size:12px;width:420px">' + thumb +
+            '<b>' + esc(d.name[i]) + '</b> ' +
+            '<span style="background:' + (TIER_COLORS[t] || "#95a5a6") + ';color:white;' +
+            'padding:2px 8px;border-radius:10px;font-size:11px">' + t + '</span><br><br>' +
+            '<b>Risk Score:</b> ' + score[i].toFixed(3) + '<br>' +
+            '<b>Hotspot Class:</b> ' + label("hotspot_class", i) + ' <i>(baked weights)</i><br>' +
+            '<b>Gi* Z-Score:</b> ' + num("gi_zscore", i, 3) + '<br>' +
+            '<hr style="margin:4px 0"><b>Components:</b><br>' +
+            'Pavement Distress: ' + num("avg_distress", i, 3) + '<br>' +
+            'Behavioral Complexity: ' + num("avg_complexity", i, 3) + '<br>' +
+            'Accident Count: ' + num("accident_count", i, 0) + '<br><br>' +
+            '<b>Dominant Factor:</b> ' + d.factors[dominant[i]] + '</div>';
+    }
+
+    // Levels of detail: the coarsest is inline, finer ones are loaded from their
+    // script file the first time they're needed; decoded on first use, then kept
+    var decoded = [], waiting = [], current = 0, wanted = 0;
+    window.segmentLayerLevels = window.segmentLayerLevels || {};
+    function decode(l) {
+        var lod = d.lods[l], lat = 0, lon = 0, segs = new Array(d.n);
+        for (var i = 0; i < d.n; i++) {
+            var parts = lod.lines[i];
+            segs[i] = new Array(parts.length);
+            for (var p = 0; p < parts.length; p++) {
+                var steps = parts[p], latlngs = new Array(steps.length / 2);
+                for (var k = 0; k < latlngs.length; k++) {
+                    lat += steps[2 * k];
+                    lon += steps[2 * k + 1];
+                    latlngs[k] = [lat / lod.scale, lon / lod.scale];
+                }
+                segs[i][p] = latlngs;
+            }
+        }
+        return segs;
+    }
+    function levelFor(zoom) {
+        var l = 0;
+        while (l + 1 < d.lods.length && zoom >= d.lods[l + 1].zoom) l++;
+        return l;
+    }
+    function geometry(l) {
+        return decoded[l] || (decoded[l] = decode(l));
+    }
+    function whenLoaded(l, done) {
+        var lod = d.lods[l];
+        if (lod.lines) return done();
+        if (waiting[l]) return waiting[l].push(done);
+        waiting[l] = [done];
+        var script = document.createElement("script");
+        segmentLayerLevels[lod.src] = function(lines) {
+            lod.lines = lines;
+            delete segmentLayerLevels[lod.src];
+            var callbacks = waiting[l];
+            waiting[l] = null;
+            callbacks.forEach(function(f) { f(); });
+        };
+        script.onerror = function() {
+            // Stay on the level already drawn; the next zoom into the band retries
+            waiting[l] = null;
+            script.remove();
+        };
+        script.src = lod.src;
+        document.head.appendChild(script);
+    }
+    function showLevel(l) {
+        wanted = l;
+        whenLoaded(l, function() {
+            if (wanted !== l || current === l) return;
+            var segs = geometry(l);
+            for (var k = 0; k < lines.length; k++) {
+                lines[k].setLatLngs(segs[lines[k].options.seg][lines[k].options.part]);
+            }
+            current = l;
+        });
+    }
+
+    // Two layers over the same geometry: live risk tiers, and baked Gi* classes
+    // (built the first time it is shown)
+    var lines = [], riskLines = [];
+    function addLines(group, styleOf, bySegment) {
+        var segs = geometry(current);
+        for (var i = 0; i < d.n; i++) {
+            if (bySegment) bySegment[i] = [];
+            for (var p = 0; p < segs[i].length; p++) {
+                var line = L.polyline(segs[i][p], Object.assign({renderer: canvas, seg: i, part: p}, styleOf(i)));
+                line.bindTooltip((function(i) {
+                    return function() { return esc(d.name[i]) + " — Risk: " + score[i].toFixed(2); };
+                })(i), {sticky: true});
+                group.addLayer(line);
+                lines.push(line);
+                if (bySegment) bySegment[i].push(line);
+            }
+        }
+    }
+    function openPopup(e) {
+        L.popup({maxWidth: 430}).setLatLng(e.latlng)
+            .setContent(popupHtml(e.layer.options.seg)).openOn(map);
+    }
+
+    rescore();
+    var riskLayer    = L.featureGroup().on("click", openPopup);
+    var hotspotLayer = L.featureGroup().on("click", openPopup);
+    addLines(riskLayer, riskStyle, riskLines);
+    hotspotLayer.on("add", function() {
+        if (!hotspotLayer.getLayers().length) addLines(hotspotLayer, hotspotStyle);
+    });
+    riskLayer.addTo(map);
+    L.control.layers({
+        "Risk tier (live weights)": riskLayer,
+        "Gi* hotspots (baked run)": hotspotLayer
+    }, null, {collapsed: false}).addTo(map);
+
+    showLevel(levelFor(map.getZoom()));
+    map.on("zoomend", function() { showLevel(levelFor(map.getZoom())); });
+
+    // Weight sliders — rescoring and restyling batched into one animation frame
+    var sliders = L.control({position: "topright"}), inputs, shares, pending = false;
+    function showWeights() {
+        var total = weights.reduce(function(a, b) { return a + b; }, 0) || 1;
+        for (var f = 0; f < weights.length; f++) {
+            inputs[f].value = weights[f];
+            shares[f].textContent = Math.round(100 * weights[f] / total) + "%";
+        }
+    }
+    function reweight() {
+        if (pending) return;
+        pending = true;
+        L.Util.requestAnimFrame(function() {
+            pending = false;
+            var changed = rescore();
+            for (var k = 0; k < changed.length; k++) {
+                var i = changed[k], style = riskStyle(i);
+                for (var p = 0; p < riskLines[i].length; p++) riskLines[i][p].setStyle(style);
+            }
+            showWeights();
+        });
+    }
+    sliders.onAdd = function() {
+        var div = L.DomUtil.create("div", "leaflet-bar");
+        div.style.cssText = "background:white;padding:8px 10px;font:12px Arial;width:200px";
+        var html = "<b>Risk Weights</b>";
+        for (var f = 0; f < d.factors.length; f++) {
+            html += '<label style="display:block;margin-top:6px">' + esc(d.factors[f]) +
+                ' <b></b><input type="range" min="0" max="1" step="0.01" style="width:100%"></label>';
+        }
+        div.innerHTML = html + '<button type="button" style="margin-top:6px">Reset</button>';
+        inputs = div.querySelectorAll("input");
+        shares = div.querySelectorAll("label b");
+        inputs.forEach(function(input, f) {
+            input.addEventListener("input", function() { weights[f] = +input.value; reweight(); });
+        });
+        div.querySelector("button").addEventListener("click", function() {
+            weights = d.weights.slice();
+            reweight();
+        });
+        L.DomEvent.disableClickPropagation(div);
+        L.DomEvent.disableScrollPropagation(div);
+        showWeights();
+        return div;
+    };
+    sliders.addTo(map);
+})();
+{% endmacro %}
+""")
+
+    def __init__(self, payload):
+        super().__init__()
+        self._name   = "SegmentLayer"
+        # "</" can't appear inside an inline <script>
+        self.payload = json.dumps(payload, separators=(",", ":"), allow_nan=False).replace("</", "<\\/")
@@ -0,0 +1,6 @@
+# tests/conftest.py
+# Tests import the pipeline modules the way the scripts do — as scripts.<module>
+# from the repository root.
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,72 @@
+# tests/sv_standin.py
+# Local stand-in for the Street View metadata and image endpoints.
+#
+# Serves scripted responses — (status, body) per request, in order, falling
+# back to a default once the script runs out — and records every request's
+# query, so the fetcher can be exercised offline through SV_API_BASE. A
+# default may also be a function of the query, returning (status, body).
+
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+JPEG = b"\xff\xd8\xff\xe0stand-in\xff\xd9"
+OK_METADATA = {"status": "OK", "pano_id": "pano-1", "date": "2022-05"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url   = urlsplit(self.path)
+        kind  = "metadata" if url.path.endswith("/metadata") else "image"
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        status, body = self.server.next_response(kind, query)
+        if isinstance(body, dict):
+            body, ctype = json.dumps(body).encode(), "application/json"
+        else:
+            ctype = "image/jpeg" if status == 200 else "text/plain"
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandIn(ThreadingHTTPServer):
+    """Stand-in server on a free local port; `base_url` is its SV_API_BASE"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.scripts  = {"metadata": [], "image": []}
+        self.defaults = {"metadata": (200, OK_METADATA), "image": (200, JPEG)}
+        self.requests = []
+        self.lock     = threading.Lock()
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}/streetview"
+
+    def script(self, kind, *responses):
+        """Queue (status, body) responses for the next `kind` requests"""
+        with self.lock:
+            self.scripts[kind].extend(responses)
+
+    def next_response(self, kind, query):
+        with self.lock:
+            self.requests.append((kind, query))
+            if self.scripts[kind]:
+                return self.scripts[kind].pop(0)
+        default = self.defaults[kind]
+        return default(query) if callable(default) else default
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
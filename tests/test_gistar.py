@@ -0,0 +1,19 @@
+import numpy as np
+
+from scripts.gistar import gi_star_bands, hotspot_classes, most_significant_band
+from scripts.spatial_weights import band_weights
+
+
+def chain_pairs(n, distance):
+    i = np.arange(n - 1)
+    return np.r_[i, i + 1], np.r_[i + 1, i], np.full(2 * (n - 1), distance)
+
+
+def test_empty_band_is_not_significant():
+    y = np.random.default_rng(0).random(50)
+    weights = band_weights(50, chain_pairs(50, 250.0), [100, 300])
+    (z_narrow, p_narrow), (z_wide, p_wide) = gi_star_bands(y, weights, permutations=99, workers=1)
+    assert np.isnan(z_narrow).all() and not np.isnan(z_wide).any()
+    assert (hotspot_classes(z_narrow, p_narrow) == "Not Significant").all()
+    best = most_significant_band([100, 300], [z_narrow, z_wide], [p_narrow, p_wide])
+    assert (best == 300).all()
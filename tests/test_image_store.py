@@ -0,0 +1,85 @@
+import functools
+import importlib.util
+import os
+
+import pandas as pd
+import pytest
+
+from scripts.image_store import ImageStore, image_key, legacy_image_key
+from scripts.sv_fetch import MetadataCache, StreetViewFetcher
+from sv_standin import JPEG, StandIn
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+
+
+def load_02b():
+    spec   = importlib.util.spec_from_file_location("streetview_distress",
+                                                    os.path.join(SCRIPTS, "02b_streetview_distress.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def split_way_points():
+    """Sample 0 of two edges split from one way — same osmid, sample_num and heading"""
+    points = pd.DataFrame({
+        "seg_id":     [101, 202],
+        "sample_num": [0, 0],
+        "heading":    [90.0, 90.0],
+        "latitude":   [37.4500, 37.4510],
+        "longitude":  [-122.1800, -122.1790],
+    })
+    points["key"] = [image_key(*row) for row in zip(points["seg_id"], points["sample_num"], points["heading"])]
+    return points
+
+
+def test_edges_split_from_one_way_get_their_own_images(tmp_path, monkeypatch):
+    distress = load_02b()
+    with StandIn() as standin:
+        # Each location is its own panorama, and each panorama its own image
+        standin.defaults["metadata"] = lambda q: (200, {"status": "OK", "pano_id": q["location"], "date": "2022-05"})
+        standin.defaults["image"]    = lambda q: (200, JPEG + q["pano"].encode())
+        monkeypatch.setattr(distress, "StreetViewFetcher",
+                            functools.partial(StreetViewFetcher, api_key="test", base_url=standin.base_url))
+        monkeypatch.setattr(distress, "MetadataCache", type("MetadataCache", (MetadataCache,), {
+            "__init__": lambda self: MetadataCache.__init__(self, str(tmp_path / "metadata.csv"))}))
+        store = ImageStore(str(tmp_path / "images.pack"))
+        points = split_way_points()
+        no_coverage, errors = distress.fetch_missing(points, store)
+
+    assert not no_coverage and not errors
+    first, second = points["key"]
+    assert first != second
+    assert store.content_hash(first) != store.content_hash(second)
+    store.close()
+    reopened = ImageStore(str(tmp_path / "images.pack"))
+    assert bytes(reopened.get(first)) != bytes(reopened.get(second))
+
+
+def write_legacy_pack(path, rows):
+    """An osmid-keyed pack as written before seg_id"""
+    with open(path, "wb") as f:
+        f.write(JPEG * len(rows))
+    with open(path + ".idx", "w", newline="", encoding="utf-8") as f:
+        f.write("osmid,sample_num,heading,offset,length,sv_date,pano_id,content_hash\r\n")
+        for i, (osmid, n, heading) in enumerate(rows):
+            f.write(f"{osmid},{n},{heading},{i * len(JPEG)},{len(JPEG)},2020-01,,\r\n")
+
+
+def test_adopt_legacy_skips_keys_shared_by_edges(tmp_path):
+    path = str(tmp_path / "images.pack")
+    write_legacy_pack(path, [(7, 0, 90.0), (8, 0, 45.0)])
+    store = ImageStore(path)
+    assert len(store) == 0 and len(store.legacy) == 2
+
+    keys   = [image_key(101, 0, 90.0), image_key(202, 0, 90.0), image_key(303, 0, 45.0)]
+    legacy = [legacy_image_key(7, 0, 90.0), legacy_image_key(7, 0, 90.0), legacy_image_key(8, 0, 45.0)]
+    assert store.adopt_legacy(keys, legacy) == 1
+    assert keys[2] in store and keys[0] not in store and keys[1] not in store
+    store.close()
+
+    # The index is rewritten keyed by seg_id; the osmid-keyed one is kept beside it
+    assert os.path.exists(path + ".idx.osmid")
+    reopened = ImageStore(path)
+    assert keys[2] in reopened and len(reopened.legacy) == 2
+    assert bytes(reopened.get(keys[2])) == JPEG
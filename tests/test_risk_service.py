@@ -0,0 +1,64 @@
+import http.client
+import json
+import threading
+
+import geopandas as gpd
+import pytest
+from shapely.geometry import LineString
+
+from scripts.config import CRS_GEOGRAPHIC
+from scripts.risk_service import RiskData, RiskService
+
+
+@pytest.fixture
+def service(tmp_path):
+    path = str(tmp_path / "hotspot.gpkg")
+    gpd.GeoDataFrame({
+        "seg_id":     [0, 1, 2],
+        "risk_score": [0.2, 0.9, 0.5],
+        "risk_tier":  ["Low", "Critical", "Moderate"],
+        "geometry":   [LineString([(-122.18 + 0.001 * i, 37.45), (-122.18 + 0.001 * i, 37.451)])
+                       for i in range(3)],
+    }, crs=CRS_GEOGRAPHIC).to_file(path, driver="GPKG")
+    server = RiskService(("127.0.0.1", 0), path=path, poll=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path):
+    conn = http.client.HTTPConnection(*server.server_address)
+    conn.request("GET", path)
+    resp = conn.getresponse()
+    body = json.loads(resp.read())
+    conn.close()
+    return resp.status, body
+
+
+def test_nearest(service):
+    status, body = get(service, "/nearest?lat=37.4505&lon=-122.1789&k=2")
+    assert status == 200
+    assert [f["id"] for f in body["features"]] == [1, 2]
+
+
+@pytest.mark.parametrize("query", [
+    "lat=nan&lon=-122.18", "lat=37.45&lon=inf", "lat=37.45&lon=-122.18&max_m=-inf",
+    "lat=37.45&lon=-122.18&max_m=nan", "lat=37.45&lon=-122.18&max_m=-5",
+])
+def test_nearest_rejects_bad_numbers(service, query):
+    status, body = get(service, f"/nearest?{query}")
+    assert status == 400 and "error" in body
+
+
+def test_bbox_rejects_non_finite(service):
+    assert get(service, "/segments?bbox=nan,37.4,-122.1,37.5")[0] == 400
+
+
+def test_unexpected_error_is_500(service, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(RiskData, "top", broken)
+    status, body = get(service, "/top")
+    assert status == 500 and body == {"error": "internal error"}
+    assert get(service, "/health")[0] == 200
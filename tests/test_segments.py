@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.segments import SEG_ID_BITS, assign_segment_ids, segment_ids, segment_osmids
+
+
+def edges():
+    return pd.DataFrame({
+        "u":     [10, 10, 11, 12],
+        "v":     [11, 11, 12, 10],
+        "key":   [0, 1, 0, 0],
+        "osmid": [100, 100, "[101, 102]", 103],
+    })
+
+
+def test_ids_follow_the_edge_not_the_row(tmp_path):
+    first  = assign_segment_ids(edges(), path=str(tmp_path / "a.csv"))
+    second = assign_segment_ids(edges().iloc[::-1], path=str(tmp_path / "b.csv"))
+    assert first.columns[0] == "seg_id" and first["seg_id"].dtype == np.int64
+    ids = dict(zip(zip(first["u"], first["v"], first["key"]), first["seg_id"]))
+    assert all(ids[(u, v, k)] == seg_id
+               for u, v, k, seg_id in zip(second["u"], second["v"], second["key"], second["seg_id"]))
+    assert first["seg_id"].nunique() == 4
+    assert (first["seg_id"] >= 0).all() and (first["seg_id"] < 2 ** SEG_ID_BITS).all()
+
+
+def test_lookup_table(tmp_path):
+    path  = str(tmp_path / "segments.csv")
+    roads = assign_segment_ids(edges(), path=path)
+    assert segment_osmids(path)[roads["seg_id"][2]] == "[101, 102]"
+
+
+def test_repeated_edge_is_an_error():
+    with pytest.raises(ValueError):
+        segment_ids([1, 1], [2, 2], [0, 0])
@@ -0,0 +1,38 @@
+# tests/test_spatial_weights.py
+import numpy as np
+import scipy.sparse as sp
+from scripts.spatial_weights import (
+    row_standardize, pair_weights, band_weights, inverse_distance_weights,
+)
+
+
+def test_row_standardize_without_pairs():
+    w = row_standardize(sp.csr_matrix((3, 3)))
+    assert w.dtype == np.float64
+    assert w.nnz == 0
+
+
+def test_inverse_distance_weights_neighbourless():
+    w = inverse_distance_weights(np.array([[0, 0], [1000, 0.]]), 300)
+    assert w.shape == (2, 2)
+    assert w.nnz == 0
+
+
+def test_inverse_distance_weights_rows_sum_to_one():
+    coords = np.array([[0, 0], [100, 0], [0, 200], [5000, 5000.]])
+    w      = inverse_distance_weights(coords, 300)
+    sums   = np.asarray(w.sum(axis=1)).ravel()
+    np.testing.assert_allclose(sums, [1, 1, 1, 0])
+
+
+def test_empty_pairs():
+    empty = (np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([]))
+    assert pair_weights(4, empty).nnz == 0
+    assert [w.nnz for w in band_weights(4, empty, [100, 300])] == [0, 0]
+
+
+def test_band_weights_narrow_band_empty():
+    pairs = (np.array([0, 1]), np.array([1, 0]), np.array([250.0, 250.0]))
+    narrow, wide = band_weights(2, pairs, [100, 300])
+    assert narrow.nnz == 0 and narrow.shape == (2, 2)
+    np.testing.assert_allclose(wide.toarray(), [[0, 1], [1, 0]])
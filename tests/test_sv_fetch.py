@@ -0,0 +1,133 @@
+import socket
+import threading
+
+import pytest
+
+import scripts.sv_fetch as sv_fetch
+from scripts.sv_fetch import FetchError, StreetViewFetcher, TokenBucket
+from sv_standin import JPEG, StandIn
+
+
+@pytest.fixture
+def standin():
+    with StandIn() as server:
+        yield server
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff waits, taken at their upper bound and not actually slept"""
+    waits = []
+    monkeypatch.setattr(sv_fetch.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(sv_fetch.time, "sleep", waits.append)
+    return waits
+
+
+def fetcher(base_url, **kwargs):
+    kwargs = {"api_key": "test", "rate": 1000, "burst": 100, "max_retries": 3, "backoff": 0.5, **kwargs}
+    return StreetViewFetcher(base_url=base_url, **kwargs)
+
+
+def test_retries_throttling_and_server_errors(standin, sleeps):
+    standin.script("image", (429, b"slow down"), (503, b"busy"))
+    f = fetcher(standin.base_url)
+    assert f.image("pano-1", 90) == JPEG
+    assert f.stats["requests"] == 3 and f.stats["retries"] == 2
+    assert sleeps == [0.5, 1.0]                     # doubling backoff
+    assert [q["pano"] for _, q in standin.requests] == ["pano-1"] * 3
+
+
+def test_gives_up_after_max_retries(standin, sleeps):
+    standin.script("metadata", *[(500, b"down")] * 5)
+    f = fetcher(standin.base_url, max_retries=2)
+    with pytest.raises(FetchError) as e:
+        f.metadata(37.45, -122.18)
+    assert e.value.kind == "http_500"
+    assert f.stats["requests"] == 3 and sleeps == [0.5, 1.0]
+
+
+def test_client_errors_are_not_retried(standin, sleeps):
+    standin.script("image", (403, b"forbidden"))
+    f = fetcher(standin.base_url)
+    with pytest.raises(FetchError) as e:
+        f.image("pano-1", 0)
+    assert e.value.kind == "http_403"
+    assert f.stats["requests"] == 1 and not sleeps
+
+
+def test_connection_errors_are_retried(sleeps):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]                   # nothing listens here once closed
+    f = fetcher(f"http://127.0.0.1:{port}", max_retries=1)
+    with pytest.raises(FetchError) as e:
+        f.image("pano-1", 0)
+    assert e.value.kind == "connection" and f.stats["retries"] == 1
+
+
+def test_metadata_and_image_by_location(standin):
+    standin.script("metadata", (200, {"status": "ZERO_RESULTS"}), (200, {"status": "OK", "date": "2021-01"}))
+    f = fetcher(standin.base_url)
+    assert f.metadata(37.45, -122.18)["status"] == "ZERO_RESULTS"
+    assert f.metadata(37.45, -122.18) == {"status": "OK", "pano_id": "", "sv_date": "2021-01"}
+    f.image("", 180, location="37.45,-122.18")
+    query = standin.requests[-1][1]
+    assert query["location"] == "37.45,-122.18" and "pano" not in query
+
+
+def test_run_many_reports_errors_by_kind(standin, sleeps):
+    standin.script("image", (404, b"gone"))
+    f = fetcher(standin.base_url, workers=1)
+    results = {key: (content, error) for key, content, error in
+               f.run_many(f.image, [("a", "pano-a", 0), ("b", "pano-b", 0)])}
+    assert results == {"a": (None, "http_404"), "b": (JPEG, None)}
+    assert f.stats["error_http_404"] == 1
+
+
+class FakeClock:
+    """Monotonic time that only moves when someone sleeps.
+
+    Tests use power-of-two rates so every wait, and so the clock, is exact.
+    """
+    def __init__(self):
+        self.now   = 0.0
+        self.waits = []
+        self.lock  = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.waits.append(seconds)
+            self.now += seconds
+
+
+def test_token_bucket_burst_then_rate():
+    clock  = FakeClock()
+    bucket = TokenBucket(rate=64, burst=5, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        bucket.acquire()
+    assert clock.waits == []                        # the burst is banked
+    for _ in range(10):
+        bucket.acquire()
+    assert len(clock.waits) == 10                   # then one wait per token
+    assert clock() == 10 / 64                       # 10 tokens at 64/s
+
+
+def test_token_bucket_shared_by_threads():
+    clock   = FakeClock()
+    bucket  = TokenBucket(rate=128, burst=1, clock=clock, sleep=clock.sleep)
+    granted = []
+    def worker():
+        for _ in range(10):
+            bucket.acquire()
+            granted.append(1)
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(granted) == 40
+    assert clock() >= 39 / 128                      # 40 tokens, one banked, at 128/s overall
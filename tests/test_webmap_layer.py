@@ -0,0 +1,76 @@
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from scripts.webmap_layer import _levels, level_vertices, segment_payload, write_levels
+
+LOD = [(0, 25, 4), (14, 4, 5), (16, 0, 6)]
+
+
+def decode(lines, scale):
+    """[[(lat, lon), ...] per part] per segment, undoing the delta stream"""
+    lat = lon = 0
+    segments = []
+    for seg in lines:
+        parts = []
+        for steps in seg:
+            part = []
+            for k in range(0, len(steps), 2):
+                lat, lon = lat + steps[k], lon + steps[k + 1]
+                part.append((lat / scale, lon / scale))
+            parts.append(part)
+        segments.append(parts)
+    return segments
+
+
+def wiggly(start, end, n=40, amplitude=0.00002):
+    t = np.linspace(0, 1, n)
+    xy = np.outer(1 - t, start) + np.outer(t, end)
+    xy[1:-1, 1] += amplitude * np.sin(t[1:-1] * 40)
+    return shapely.LineString(xy)
+
+
+def test_levels_keep_junctions():
+    junction = (-122.18, 37.45)
+    geoms = np.array([wiggly((-122.19, 37.45), junction), wiggly(junction, (-122.18, 37.46)),
+                      wiggly(junction, (-122.17, 37.44))])
+    levels = _levels(geoms, LOD)
+    vertices = level_vertices({"lods": levels})
+    assert vertices[0] < vertices[-1]
+    for level in levels:
+        a, b, c = decode(level["lines"], level["scale"])
+        assert a[0][-1] == b[0][0] == c[0][0]
+
+
+def test_write_levels_keeps_coarsest_inline(tmp_path):
+    geoms = np.array([wiggly((-122.19, 37.45), (-122.18, 37.45))])
+    payload = {"lods": _levels(geoms, LOD)}
+    finer = [level["lines"] for level in payload["lods"][1:]]
+    paths = write_levels(payload, os.path.join(tmp_path, "map.html"))
+
+    assert [os.path.basename(p) for p in paths] == ["map_lod14.js", "map_lod16.js"]
+    assert "lines" in payload["lods"][0]
+    for level, path, lines in zip(payload["lods"][1:], paths, finer):
+        assert "lines" not in level and level["src"] == os.path.basename(path)
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        prefix = f'segmentLayerLevels["{level["src"]}"]('
+        assert text.startswith(prefix) and text.endswith(");\n")
+        assert json.loads(text[len(prefix):-3]) == lines
+
+
+def test_payload_without_name_column():
+    geoms = [wiggly((-122.19, 37.45), (-122.18, 37.45)), wiggly((-122.18, 37.45), (-122.17, 37.45))]
+    roads = gpd.GeoDataFrame({
+        "gi_zscore": [2.1, -0.3], "avg_distress": [0.4, 0.1],
+        "avg_complexity": [0.2, 0.5], "accident_count": [3, 0],
+        "hotspot_class": ["Hot Spot (95%)", "Not Significant"],
+        "norm_surface": [0.4, 0.1], "norm_behavior": [0.2, 0.5], "norm_accidents": [1.0, 0.0],
+    }, geometry=geoms, crs="EPSG:4326")
+    payload = segment_payload(roads, [None, None], {"Hot Spot (95%)": "#d7191c"}, lod=LOD)
+
+    assert payload["name"] == ["Road Segment", "Road Segment"]
+    assert payload["n"] == 2 and payload["colors"] == ["#d7191c", "#d3d3d3"]